@@ -0,0 +1,52 @@
+"""Benchmark: a numeric pipeline (scale, square, filter and sum a series) on a vector
+with mal functions called per element, and on a typed array with the vectorized
+builtins. Requires NumPy.
+Run from impls/myPython:
+```
+python3 -m benchmarks.arrays
+```
+"""
+
+from benchmarks import common
+
+sizes = [1000, 10000, 100000]
+
+definitions = """
+(do
+  (def! build (fn* [v n] (if (= n 0) v (build (conj v (/ n 3.0)) (- n 1)))))
+  (def! sum-large-squares (fn* [v i acc]
+    (if (= i (count v))
+      acc
+      (let* [x (* 2 (nth v i))
+             square (* x x)]
+        (sum-large-squares v (+ i 1) (if (> square 100) (+ acc square) acc)))))))
+"""
+
+vector_pipeline = "(sum-large-squares data 0 0)"
+array_pipeline = """
+(let* [x (* 2 series)
+       squares (* x x)]
+  (array-sum (array-mask squares (array> squares 100))))
+"""
+
+
+def main():
+    mal = common.make_interpreter()
+    mal(definitions)
+
+    print(f"{'size':>8} {'vector (ms)':>12} {'array (ms)':>11} {'speedup':>8}")
+    for size in sizes:
+        mal(f"(do (def! data (build [] {size})) (def! series (f64-array data)))")
+        vector_time, vector_result = common.time_call(mal, vector_pipeline)
+        array_time, array_result = common.time_call(mal, array_pipeline)
+        assert abs(float(vector_result) - float(array_result)) < 1e-6 * abs(
+            float(vector_result)
+        )
+        print(
+            f"{size:>8} {vector_time * 1000:>12.2f} {array_time * 1000:>11.2f} "
+            f"{vector_time / array_time:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark: memory used to scan a log file, counting the lines that contain "ERROR"
+with bytes-lines, on the file read with slurp-bytes and mapped with mmap-file. Reading
+the file with slurp, which decodes all of it into a string, is shown for comparison.
+Reports the time and the peak memory traced by tracemalloc (memory-mapped pages are not
+allocated by Python, and are not counted). Scanning a mapped file keeps the matching
+lines, as count holds the head of the filtered sequence, and none of the others.
+Run from impls/myPython:
+```
+python3 -m benchmarks.buffers
+```
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import common
+
+line_counts = [10000, 100000, 500000]
+
+scan = """
+(count (filter (fn* [line] (bytes-find line "ERROR"))
+               (bytes-lines ({read} path))))
+"""
+workloads = {
+    "slurp": "(count (slurp path))",  # Only reads the file
+    "slurp-bytes": scan.format(read="slurp-bytes"),
+    "mmap-file": scan.format(read="mmap-file"),
+}
+
+
+def write_log(path, lines):
+    with open(path, "w") as file:
+        for index in range(lines):
+            level = "ERROR" if index % 10 == 0 else "INFO "
+            file.write(f"{level} {index:>10} request handled in {index % 97:>4} ms\n")
+
+
+def measure(mal, source):
+    """Return (seconds, peak bytes, result) of evaluating source"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = mal(source)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return time.perf_counter() - start, peak, result
+
+
+def main():
+    mal = common.make_interpreter()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "log.txt")
+        print(
+            f"{'lines':>7} {'MB':>6} {'workload':>10} {'time (ms)':>10} {'peak MB':>8}"
+        )
+        for lines in line_counts:
+            write_log(path, lines)
+            mal(f'(def! path "{path}")')
+            for name, source in workloads.items():
+                seconds, peak, result = measure(mal, source)
+                if name != "slurp":
+                    assert result == str(lines // 10), result
+                print(
+                    f"{lines:>7} {os.path.getsize(path) / 1e6:>6.1f} {name:>10} "
+                    f"{seconds * 1000:>10.1f} {peak / 1e6:>8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""Helpers shared by the benchmarks"""
+
+import time
+
+from mal_python import stepA_mal
+
+
+def make_interpreter(engine="closure"):
+    """Set up a new mal REPL environment and return a function evaluating mal source"""
+    stepA_mal.EVAL = stepA_mal.load_engine(engine)
+    stepA_mal.repl_environment.data.clear()
+    stepA_mal.define_new_forms()
+    return stepA_mal.read_eval_print
+
+
+def time_call(function, *args):
+    """Return (seconds, result) of calling function"""
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
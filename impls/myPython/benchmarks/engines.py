@@ -0,0 +1,53 @@
+"""Benchmark: the execution engines side by side on the mal performance tests
+(tests/fib.mal and tests/perf1.mal to tests/perf3.mal of the mal repository).
+Run from impls/myPython:
+```
+python3 -m benchmarks.engines
+```
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+from mal_python import stepA_mal
+
+implementation_directory = os.path.join(os.path.dirname(__file__), "..")
+tests_directory = os.path.join(implementation_directory, "..", "tests")
+interpreter = os.path.abspath(stepA_mal.__file__)
+
+# (test file, arguments, pattern extracting the result from the output)
+tests = [
+    ("fib.mal", ["20", "3"], r"\[(\d+)"),  # ms, first of the iterations
+    ("perf1.mal", [], r"Elapsed time: (\d+)"),  # ms
+    ("perf2.mal", [], r"Elapsed time: (\d+)"),  # ms
+    ("perf3.mal", [], r"iters over 10 seconds: (\d+)"),  # iterations, higher is better
+]
+
+
+def run_test(engine, test_file, args):
+    environment = dict(os.environ, PYTHONPATH=os.path.abspath(implementation_directory))
+    return subprocess.run(
+        [sys.executable, interpreter, "--engine", engine, test_file, *args],
+        cwd=tests_directory,
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def main():
+    engines = list(stepA_mal.engines)
+    print(f"{'test':>10} " + " ".join(f"{engine:>10}" for engine in engines))
+    for test_file, args, pattern in tests:
+        results = []
+        for engine in engines:
+            output = run_test(engine, test_file, args)
+            results.append(re.search(pattern, output).group(1))
+        print(f"{test_file:>10} " + " ".join(f"{result:>10}" for result in results))
+
+
+if __name__ == "__main__":
+    main()
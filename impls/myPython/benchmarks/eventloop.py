@@ -0,0 +1,57 @@
+"""Benchmark: I/O bound scripts waiting on subprocesses and files, with each task
+awaited as soon as it is started (one wait after another), and with all tasks started
+first, then awaited (overlapping waits).
+Run from impls/myPython:
+```
+python3 -m benchmarks.eventloop
+```
+"""
+
+import os
+import tempfile
+
+from benchmarks import common
+
+task_counts = [4, 16, 64]
+
+workloads = {
+    # Subprocesses each taking 50 ms
+    "sh-async": '(sh-async "sleep" "0.05")',
+    # Files of 1 MB, read through the executor of the event loop
+    "slurp-async": '(slurp-async (str directory "/" (mod i files)))',
+}
+
+one_at_a_time = "(count (doall (map (fn* [i] (deref {task})) (range {count}))))"
+overlapped = (
+    "(count (doall (map deref (doall (map (fn* [i] {task}) (range {count}))))))"
+)
+
+
+def main():
+    mal = common.make_interpreter()
+    with tempfile.TemporaryDirectory() as directory:
+        files = 8
+        for index in range(files):
+            with open(os.path.join(directory, str(index)), "w") as file:
+                file.write("x" * 1000000)
+        mal(f'(do (def! directory "{directory}") (def! files {files}))')
+        mal("(def! mod (fn* [a b] (- a (* b (/ a b)))))")
+
+        print(f"{'workload':>11} {'tasks':>5} {'one at a time (ms)':>18} ", end="")
+        print(f"{'overlapped (ms)':>15}")
+        for name, task in workloads.items():
+            for count in task_counts:
+                sequential_time, _ = common.time_call(
+                    mal, one_at_a_time.format(task=task, count=count)
+                )
+                overlapped_time, _ = common.time_call(
+                    mal, overlapped.format(task=task, count=count)
+                )
+                print(
+                    f"{name:>11} {count:>5} {sequential_time * 1000:>18.1f} "
+                    f"{overlapped_time * 1000:>15.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark: futures and atoms.
+
+Contention: futures increment one atom with swap! concurrently, and the final count is
+checked, so lost updates fail the benchmark. Fan-out: tasks each waiting on simulated
+I/O (a sleep, as io-wait) are run one after another, then as futures, and the throughput
+of both is reported.
+Run from impls/myPython:
+```
+python3 -m benchmarks.futures
+```
+"""
+
+import time
+
+from benchmarks import common
+from mal_python import mal_types
+from mal_python import stepA_mal
+
+thread_counts = [2, 8, 32]
+increments = 5000  # swap! calls of each thread
+io_seconds = 0.01
+task_counts = [16, 64, 256]
+
+contention = """
+(let* [counter (atom 0)
+       threads (doall (map (fn* [_]
+                             (future (doall (map (fn* [_] (swap! counter + 1))
+                                                 (range {increments})))))
+                           (range {threads})))]
+  (do (doall (map deref threads)) @counter))
+"""
+
+sequential_io = "(doall (map (fn* [_] (io-wait)) (range {tasks})))"
+concurrent_io = """
+(doall (map deref (doall (map (fn* [_] (future (io-wait))) (range {tasks})))))
+"""
+
+
+def io_wait():
+    time.sleep(io_seconds)
+    return mal_types.nil
+
+
+def main():
+    mal = common.make_interpreter()
+    stepA_mal.repl_environment.set(mal_types.Symbol("io-wait"), io_wait)
+
+    print(f"{'threads':>7} {'swap!/s':>9}")
+    for threads in thread_counts:
+        seconds, count = common.time_call(
+            mal, contention.format(threads=threads, increments=increments)
+        )
+        assert int(count) == threads * increments, count
+        print(f"{threads:>7} {threads * increments / seconds:>9.0f}")
+
+    print()
+    print(f"{'tasks':>5} {'sequential tasks/s':>18} {'futures tasks/s':>15}")
+    for tasks in task_counts:
+        sequential_time, _ = common.time_call(mal, sequential_io.format(tasks=tasks))
+        concurrent_time, _ = common.time_call(mal, concurrent_io.format(tasks=tasks))
+        print(
+            f"{tasks:>5} {tasks / sequential_time:>18.0f} "
+            f"{tasks / concurrent_time:>15.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
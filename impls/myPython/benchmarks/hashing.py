@@ -0,0 +1,64 @@
+"""Micro-benchmark: collections as hash-map keys, and equality of collections.
+
+Times get with a vector key, and with a hash-map key, of growing size, in maps large
+enough to be stored in a trie (smaller ones compare their keys without hashing them),
+looked up again and again as memoize does, and = on equal vectors and on vectors differing in their
+last item. Collections compute their hash once, so the lookups should not grow with the
+size of the key, and = on collections whose hashes are known differ should not either.
+Run from impls/myPython:
+```
+python3 -m benchmarks.hashing
+```
+"""
+
+import timeit
+
+from benchmarks import common
+from mal_python import stepA_mal
+
+sizes = [10, 1000, 100000]
+number = 1000
+
+setup = """(do
+  (def! make-vector (fn* [n acc] (if (= n 0) acc (make-vector (- n 1) (conj acc n)))))
+  (def! make-map (fn* [n acc] (if (= n 0) acc (make-map (- n 1) (assoc acc n n))))))"""
+
+expressions = {
+    "get vector": "(get by-vector key-vector)",
+    "get map": "(get by-map key-map)",
+    "= equal": "(= key-vector equal-vector)",
+    "= differing": "(= key-vector other-vector)",
+}
+
+
+def main():
+    mal = common.make_interpreter()
+    mal(setup)
+    print(f"{'expression':>12}" + "".join(f"{size:>10}" for size in sizes))
+    print(f"{'':>12}" + "".join(f"{'(us)':>10}" for _ in sizes))
+    times = {name: [] for name in expressions}
+    for size in sizes:
+        mal(f"""(do
+  (def! key-vector (make-vector {size} []))
+  (def! equal-vector (make-vector {size} []))
+  (def! other-vector (assoc key-vector {size - 1} 0))
+  (def! key-map (make-map {size} {{}}))
+  (def! by-vector (assoc (make-map 16 {{}}) key-vector 1))
+  (def! by-map (assoc (make-map 16 {{}}) key-map 1))
+  (assoc (make-map 16 {{}}) equal-vector 1 other-vector 2))""")  # Hashes the keys
+        for name, expression in expressions.items():
+            form = stepA_mal.READ(expression)
+            seconds = timeit.timeit(
+                lambda: stepA_mal.EVAL(form, stepA_mal.repl_environment),
+                number=number,
+            )
+            times[name].append(seconds / number)
+
+    for name, name_times in times.items():
+        print(
+            f"{name:>12}" + "".join(f"{seconds * 1e6:>10.2f}" for seconds in name_times)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark: memory used when streaming through a pipeline of lazy sequences.
+
+Evaluates (first (drop n (filter ... (map ... (range))))), (count (range n)) and
+(reduce + (range n)) for a growing n, and reports the peak memory traced by tracemalloc
+while evaluating each, which should stay flat, and the same for a list of n items built
+eagerly, for comparison.
+Run from impls/myPython:
+```
+python3 -m benchmarks.lazy
+```
+"""
+
+import time
+import tracemalloc
+
+from benchmarks import common
+
+sizes = [10000, 100000, 1000000]
+
+definitions = """
+(do
+  (def! square (fn* [x] (* x x)))
+  (def! odd (fn* [x] (= 1 (- x (* 2 (/ x 2))))))
+  (def! build (fn* [n acc] (if (= n 0) acc (build (- n 1) (cons n acc))))))
+"""
+
+
+def peak_memory(mal, source):
+    """Return (peak bytes, seconds) of evaluating source"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        mal(source)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, time.perf_counter() - start
+
+
+def main():
+    mal = common.make_interpreter()
+    mal(definitions)
+
+    print(
+        f"{'n':>8} {'lazy (KiB)':>11} {'lazy (s)':>9} {'count (KiB)':>12} "
+        f"{'reduce (KiB)':>13} {'eager list (KiB)':>17}"
+    )
+    for size in sizes:
+        lazy_peak, lazy_time = peak_memory(
+            mal, f"(first (drop {size} (filter odd (map square (range)))))"
+        )
+        count_peak, _ = peak_memory(mal, f"(count (range {size}))")
+        reduce_peak, _ = peak_memory(mal, f"(reduce + (range {size}))")
+        eager_peak, _ = peak_memory(mal, f"(count (map square (build {size} ())))")
+        print(
+            f"{size:>8} {lazy_peak / 1024:>11.0f} {lazy_time:>9.2f} "
+            f"{count_peak / 1024:>12.0f} {reduce_peak / 1024:>13.0f} "
+            f"{eager_peak / 1024:>17.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
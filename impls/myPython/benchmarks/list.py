@@ -0,0 +1,40 @@
+"""Benchmark: recursive list processing with cons, first and rest.
+Builds a list with cons and folds it with reduce from lib/reducers.mal, which walks the
+list with first and rest. The time per element should stay roughly constant as the list
+grows.
+Run from impls/myPython:
+```
+python3 -m benchmarks.list
+```
+"""
+
+import os
+
+from benchmarks import common
+
+sizes = [1000, 10000, 100000]
+
+reducers = os.path.join(os.path.dirname(__file__), "..", "..", "lib", "reducers.mal")
+
+definitions = """
+(def! build (fn* [l n] (if (= n 0) l (build (cons n l) (- n 1)))))
+"""
+
+
+def main():
+    mal = common.make_interpreter()
+    mal(f'(load-file "{reducers}")')
+    mal(definitions)
+
+    print(f"{'size':>8} {'cons (us/elem)':>15} {'reduce (us/elem)':>17}")
+    for size in sizes:
+        cons_time, _ = common.time_call(mal, f"(def! l (build () {size}))")
+        reduce_time, _ = common.time_call(mal, "(reduce + 0 l)")
+        print(
+            f"{size:>8} {cons_time / size * 1e6:>15.2f} "
+            f"{reduce_time / size * 1e6:>17.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark: reading source files through the load-file form cache.
+Reads copies of the files of impls/lib and a generated 1 MB source file with the cache disabled,
+with an empty cache (cold, the entries are written), with the entries up to date (warm),
+and after touching the files (the content hash is checked).
+Run from impls/myPython:
+```
+python3 -m benchmarks.load_cache
+```
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+
+from benchmarks import common
+from benchmarks import reader
+from mal_python import form_cache
+
+lib_directory = os.path.join(os.path.dirname(__file__), "..", "..", "lib")
+
+
+def read_all(paths):
+    """Read every form of every file"""
+    return sum(1 for path in paths for _ in form_cache.read_forms(path))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        large_file = os.path.join(directory, "large.mal")
+        with open(large_file, "w") as file:
+            file.write(reader.source_chunk * (1024 * 1024 // len(reader.source_chunk)))
+        lib_files = []
+        for path in sorted(glob.glob(os.path.join(lib_directory, "*.mal"))):
+            lib_files.append(os.path.join(directory, os.path.basename(path)))
+            shutil.copyfile(path, lib_files[-1])  # Copied, as they are touched
+        inputs = [("lib/*.mal", lib_files), ("1 MB file", [large_file])]
+
+        print(
+            f"{'files':>10} {'no cache (ms)':>14} {'cold (ms)':>10} {'warm (ms)':>10} "
+            f"{'touched (ms)':>13}"
+        )
+        for name, paths in inputs:
+            os.environ["MAL_CACHE_DIR"] = ""
+            no_cache_time, _ = common.time_call(read_all, paths)
+
+            os.environ["MAL_CACHE_DIR"] = os.path.join(directory, name[0])
+            cold_time, _ = common.time_call(read_all, paths)
+            warm_time, _ = common.time_call(read_all, paths)
+            for path in paths:
+                os.utime(path)
+            touched_time, _ = common.time_call(read_all, paths)
+
+            print(
+                f"{name:>10} {no_cache_time * 1000:>14.2f} {cold_time * 1000:>10.2f} "
+                f"{warm_time * 1000:>10.2f} {touched_time * 1000:>13.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Micro-benchmark: cost of a variable lookup vs. the nesting depth of its binding.
+
+Compares env.Env.get, which walks the chain of dict based environments, with the
+(depth, slot) addressed frames of the closure engine (analyzer).
+Run from impls/myPython:
+```
+python3 -m benchmarks.lookup_depth
+```
+"""
+
+import timeit
+
+from mal_python import analyzer
+from mal_python import env
+from mal_python import mal_types
+
+depths = [0, 1, 2, 4, 8, 16, 32]
+number = 200000
+
+
+def nested_environment(symbol, depth):
+    environment = env.Env(mal_types.nil, [symbol], [1])
+    for level in range(depth):
+        environment = env.Env(environment, [mal_types.Symbol(f"x{level}")], [0])
+    return environment
+
+
+def nested_frame(symbol, depth):
+    scope = analyzer.Scope(analyzer.GlobalScope(env.Env(mal_types.nil)), [symbol])
+    frame = [None, 1]
+    for level in range(depth):
+        scope = analyzer.Scope(scope, [mal_types.Symbol(f"x{level}")])
+        frame = [frame, 0]
+    return analyzer.analyze_symbol(symbol, scope), frame
+
+
+def main():
+    symbol = mal_types.Symbol("a")
+    print(f"{'depth':>5} {'Env.get (ns)':>14} {'frame (ns)':>12} {'speedup':>8}")
+    for depth in depths:
+        environment = nested_environment(symbol, depth)
+        dict_time = timeit.timeit(lambda: environment.get(symbol), number=number)
+
+        code, frame = nested_frame(symbol, depth)
+        frame_time = timeit.timeit(lambda: code(frame), number=number)
+
+        print(
+            f"{depth:>5} {dict_time / number * 1e9:>14.0f} "
+            f"{frame_time / number * 1e9:>12.0f} {dict_time / frame_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
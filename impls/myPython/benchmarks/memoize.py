@@ -0,0 +1,76 @@
+"""Benchmark: calls of a cheap function on vectors drawn from a small set of
+arguments, uncached, memoized by lib/memoize.mal (keyed by the printed arguments),
+and by the native memoize, unbounded and with a :max-size: evicting least recently
+used arguments when it is smaller than the set of arguments, as they are called in a
+cycle. Then the recursive fib, naive and memoized under its own name.
+Run from impls/myPython:
+```
+python3 -m benchmarks.memoize
+```
+"""
+
+import os
+
+from benchmarks import common
+
+lib_directory = os.path.join(os.path.dirname(__file__), "..", "..", "lib")
+call_counts = [1000, 10000, 100000]
+distinct_arguments = 100
+
+definitions = """
+(do
+  (def! native-memoize memoize)  ; Before memoize.mal redefines memoize
+  (def! total (fn* [v] (reduce + 0 v)))
+  (def! arguments (vec (map (fn* [i] [i (* 2 i) (* 3 i) (* 4 i)]) (range {distinct}))))
+  (def! naive-fib (fn* [n] (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))))
+"""
+
+variants = {
+    "uncached": "total",
+    "lib memoize": "(memoize total)",
+    "native": "(native-memoize total)",
+    "LRU all": "(native-memoize total :max-size {distinct})",
+    "LRU half": "(native-memoize total :max-size {half})",
+}
+
+calls = """
+(let* [f {variant}]
+  (count (doall (map (fn* [i] (f (nth arguments (mod i {distinct}))))
+                     (range {count})))))
+"""
+
+
+def main():
+    mal = common.make_interpreter()
+    mal(definitions.format(distinct=distinct_arguments))
+    mal(f'(load-file "{os.path.join(lib_directory, "memoize.mal")}")')
+    mal("(def! mod (fn* [a b] (- a (* b (/ a b)))))")
+
+    print(f"{'calls':>7}" + "".join(f"{name + ' (ms)':>18}" for name in variants))
+    for count in call_counts:
+        times = []
+        for variant in variants.values():
+            variant = variant.format(
+                distinct=distinct_arguments, half=distinct_arguments // 2
+            )
+            seconds, result = common.time_call(
+                mal,
+                calls.format(variant=variant, distinct=distinct_arguments, count=count),
+            )
+            assert result == str(count), result
+            times.append(seconds)
+        print(f"{count:>7}" + "".join(f"{s * 1000:>18.1f}" for s in times))
+
+    print()
+    print(f"{'fib':>7} {'naive (ms)':>12} {'memoized (ms)':>14}")
+    for n in [15, 20, 25]:
+        mal("(def! fib naive-fib)")  # Recursive calls look up fib
+        naive_time, naive = common.time_call(mal, f"(fib {n})")
+        mal("(def! fib (native-memoize naive-fib))")
+        memoized_time, memoized = common.time_call(mal, f"(fib {n})")
+        assert naive == memoized, (naive, memoized)
+        print(f"{n:>7} {naive_time * 1000:>12.1f} {memoized_time * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Memory benchmark: bytes per element of large collections of mal values.
+
+Builds lists, vectors and hash-maps (with integer keys) of n elements (integers,
+strings, keywords and nil/true/false) and reports the memory allocated while building
+them, traced with tracemalloc, divided by n. The size of single values is reported as well.
+Run from impls/myPython:
+```
+python3 -m benchmarks.memory
+```
+"""
+
+import sys
+import tracemalloc
+
+from mal_python import mal_types
+
+size = 100000
+
+
+def elements(kind):
+    if kind == "int":
+        return list(range(size))
+    if kind == "string":
+        return [mal_types.String(f"s{index}") for index in range(size)]
+    if kind == "keyword":
+        return [mal_types.Keyword(f"ʞk{index}") for index in range(size)]
+    constants = (mal_types.nil, mal_types.true, mal_types.false)
+    return [constants[index % 3] for index in range(size)]
+
+
+def entries(kind):
+    """Alternating integer keys and values of kind"""
+    for index, value in enumerate(elements(kind)):
+        yield index
+        yield value
+
+
+def measure(build):
+    """Return the bytes allocated by build(), and still used by its result"""
+    tracemalloc.start()
+    try:
+        result = build()
+        used, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return used
+
+
+def main():
+    print(f"{'value':>14} {'bytes':>6}")
+    values = {
+        "nil": mal_types.nil,
+        "int": 1000,
+        "String": mal_types.String("abc"),
+        "Symbol": mal_types.Symbol("abc"),
+        "Atom": mal_types.Atom(mal_types.nil),
+        "FunctionState": mal_types.FunctionState(
+            mal_types.nil, mal_types.List(), None, None
+        ),
+    }
+    for name, value in values.items():
+        total = sys.getsizeof(value)
+        if hasattr(value, "__dict__"):
+            total += sys.getsizeof(value.__dict__)
+        print(f"{name:>14} {total:>6}")
+
+    print()
+    print(f"{'elements':>8} {'collection':>10} {'bytes per element':>18}")
+    for kind in ["int", "string", "keyword", "nil/bool"]:
+        for name, build in [
+            ("list", lambda: mal_types.List(elements(kind))),
+            ("vector", lambda: mal_types.Vector(elements(kind))),
+            ("hash-map", lambda: mal_types.HashMap(entries(kind))),
+        ]:
+            print(f"{kind:>8} {name:>10} {measure(build) / size:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
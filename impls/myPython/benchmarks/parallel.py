@@ -0,0 +1,42 @@
+"""Benchmark: a CPU bound function (a naive Fibonacci) mapped over a vector with map,
+and with pmap in a pool of worker processes. The pool is started before timing. The speedup is bounded by
+the number of cores, the pool size can be set with MAL_WORKERS.
+Run from impls/myPython:
+```
+python3 -m benchmarks.parallel
+```
+"""
+
+from benchmarks import common
+from mal_python import parallel
+
+sizes = [8, 32, 128]
+
+definitions = """
+(do
+  (def! fib (fn* [n] (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+  (def! inputs (fn* [n] (vec (map (fn* [_] 18) (range n))))))
+"""
+
+
+def main():
+    mal = common.make_interpreter()
+    mal(definitions)
+    for size in sizes:
+        mal(f"(def! data-{size} (inputs {size}))")
+    mal("(pcalls (fn* [] nil))")  # Start the pool
+
+    print(f"{parallel.worker_count()} workers")
+    print(f"{'items':>6} {'map (ms)':>9} {'pmap (ms)':>10} {'speedup':>8}")
+    for size in sizes:
+        map_time, map_result = common.time_call(mal, f"(map fib data-{size})")
+        pmap_time, pmap_result = common.time_call(mal, f"(pmap fib data-{size})")
+        assert map_result == pmap_result
+        print(
+            f"{size:>6} {map_time * 1000:>9.1f} {pmap_time * 1000:>10.1f} "
+            f"{map_time / pmap_time:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark: reading large mal source files and data literals.
+Throughput (MB/s) should stay roughly constant as the input grows. Reading a
+file form by form should return the first form immediately and use memory
+proportional to the largest form rather than to the file.
+Run from impls/myPython:
+```
+python3 -m benchmarks.reader
+```
+"""
+
+import tempfile
+import tracemalloc
+
+from benchmarks import common
+from mal_python import parser
+
+sizes_mb = [1, 2, 4]
+
+source_chunk = """
+;; Sum the numbers below n
+(def! sum-below (fn* [n acc]
+  (if (= n 0)
+    acc
+    (sum-below (- n 1) (+ acc n)))))
+
+(defmacro! unless (fn* [pred a b] `(if ~pred ~b ~a)))
+(def! greeting "hello, \\"world\\"\\n")
+"""
+
+data_chunk = """{:id 12345 :name "item \\"quoted\\"" :tags [:a :b :c] :scores (1 2 3 -4)}
+"""
+
+
+def make_input(chunk, size_mb):
+    """Return a `(do ...)` form containing chunk repeated to about size_mb megabytes"""
+    repeats = size_mb * 1024 * 1024 // len(chunk)
+    return "(do " + chunk * repeats + ")"
+
+
+def count_forms(forms):
+    """Read every form, keeping none of them"""
+    return sum(1 for _ in forms)
+
+
+def main():
+    print(f"{'input':>8} {'size (MB)':>10} {'tokenize (MB/s)':>16} {'read (MB/s)':>12}")
+    for name, chunk in (("source", source_chunk), ("data", data_chunk)):
+        for size_mb in sizes_mb:
+            text = make_input(chunk, size_mb)
+            megabytes = len(text) / (1024 * 1024)
+            tokenize_time, _ = common.time_call(parser.tokenize, text)
+            read_time, _ = common.time_call(parser.parse_string, text)
+            print(
+                f"{name:>8} {megabytes:>10.1f} {megabytes / tokenize_time:>16.2f} "
+                f"{megabytes / read_time:>12.2f}"
+            )
+
+    print()
+    print(
+        f"{'reading':>8} {'first form (s)':>15} {'all forms (s)':>14} {'peak (MB)':>10}"
+    )
+    with tempfile.NamedTemporaryFile("w", suffix=".mal") as source_file:
+        source_file.write(source_chunk * (1024 * 1024 // len(source_chunk)))
+        source_file.flush()
+
+        tracemalloc.start()
+        with open(source_file.name) as source:
+            start_time, forms = common.time_call(parser.read_forms, source)
+            first_time, _ = common.time_call(next, forms)
+            all_time, _ = common.time_call(count_forms, forms)
+        _, streaming_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        with open(source_file.name) as source:
+            whole_time, _ = common.time_call(
+                parser.parse_string, "(do " + source.read() + ")"
+            )
+        _, whole_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(
+        f"{'streamed':>8} {start_time + first_time:>15.4f} "
+        f"{start_time + first_time + all_time:>14.2f} {streaming_peak / 2**20:>10.2f}"
+    )
+    print(
+        f"{'whole':>8} {whole_time:>15.4f} {whole_time:>14.2f} {whole_peak / 2**20:>10.2f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Benchmark suite: run a set of mal workloads in-process with every engine, report the
+median and 95th percentile times, and compare them with a stored baseline.
+Run from impls/myPython:
+```
+python3 -m benchmarks.suite --json results.json
+python3 -m benchmarks.suite --baseline results.json
+```
+With --baseline, workloads whose median time grew by more than --threshold are reported
+as regressions, and the exit status is 1 if there are any.
+"""
+
+import argparse
+import collections
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+
+from benchmarks import common
+from mal_python import stepA_mal
+
+# The lib files load each other with paths relative to the tests directory
+tests_directory = os.path.join(os.path.dirname(__file__), "..", "..", "tests")
+
+Workload = collections.namedtuple("Workload", ["name", "setup", "expression"])
+
+macro_uses = """
+  (or false nil false nil false nil false nil false nil 4)
+  (cond false 1 nil 2 false 3 nil 4 false 5 nil 6 "else" 7)
+  (-> (list 1 2 3 4 5 6 7 8 9) rest rest rest rest rest rest first)"""
+
+workloads = [
+    Workload(
+        "fib",  # Arithmetic, non tail recursion
+        '(load-file "computations.mal")',
+        "(fib 16)",
+    ),
+    Workload(
+        "count-down",  # Arithmetic, tail recursion
+        "(def! count-down (fn* [n acc] (if (= n 0) acc (count-down (- n 1) (+ acc n)))))",
+        "(count-down 20000 0)",
+    ),
+    Workload(
+        "list-churn",
+        """(do
+  (def! build-list (fn* [n acc] (if (= n 0) acc (build-list (- n 1) (cons n acc)))))
+  (def! sum-list (fn* [l acc] (if (empty? l) acc (sum-list (rest l) (+ acc (first l)))))))""",
+        "(sum-list (map (fn* [x] (* x 2)) (build-list 5000 ())) 0)",
+    ),
+    Workload(
+        "vector-churn",
+        """(do
+  (def! build-vector (fn* [n acc] (if (= n 0) acc (build-vector (- n 1) (conj acc n)))))
+  (def! sum-vector (fn* [v i acc]
+    (if (= i (count v)) acc (sum-vector v (+ i 1) (+ acc (nth v i)))))))""",
+        "(sum-vector (build-vector 5000 []) 0 0)",
+    ),
+    Workload(
+        "map-churn",
+        """(do
+  (def! fill (fn* [m n] (if (= n 0) m (fill (assoc m n (str n)) (- n 1)))))
+  (def! drain (fn* [m n] (if (= n 0) m (drain (dissoc m n) (- n 1)))))
+  (def! count-keys (fn* [m n acc]
+    (if (= n 0) acc (count-keys m (- n 1) (if (contains? m n) (+ acc 1) acc))))))""",
+        "(let* [m (fill {} 2000)] [(count-keys m 2000 0) (count (drain m 2000))])",
+    ),
+    Workload(
+        "macros",  # Every macro use is expanded again each time the form is evaluated
+        """(do
+  (load-file "../lib/load-file-once.mal")
+  (load-file-once "../lib/threading.mal")
+  (load-file-once "../lib/test_cascade.mal"))""",
+        "(do" + macro_uses * 20 + ")",
+    ),
+    Workload(
+        "busywork",  # Macros, atoms and lists, from tests/busywork.mal
+        """(do
+  (load-file "../lib/load-file-once.mal")
+  (load-file-once "../lib/threading.mal")
+  (load-file-once "../lib/test_cascade.mal")
+  (def! do-times (fn* [f n] (if (> n 0) (do (f) (do-times f (- n 1))))))
+  (def! atm (atom (list 0 1 2 3 4 5 6 7 8 9)))
+  (def! busywork (fn* [] (do"""
+        + macro_uses
+        + """
+    (swap! atm (fn* [a] (concat (rest a) (list (first a)))))))))""",
+        "(do-times busywork 300)",
+    ),
+    Workload(
+        "reader",
+        """(do
+  (def! make-data (fn* [n acc]
+    (if (= n 0)
+      acc
+      (make-data (- n 1) (conj acc {:id n :name (str "item " n) :tags [:a :b] :xs (list n -1 "x")})))))
+  (def! data (make-data 2000 []))
+  (def! data-source (pr-str data)))""",
+        "(count (read-string data-source))",
+    ),
+    Workload(
+        "printer",
+        "(def! data (read-string data-source))",
+        "(count (pr-str data))",
+    ),
+]
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def run_workload(mal, workload, warmup, repeat):
+    """Return the times in seconds of repeat evaluations of the workload"""
+    for _ in range(warmup):
+        mal(workload.expression)
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        mal(workload.expression)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_suite(engines, selected_workloads, warmup, repeat):
+    results = {}
+    for engine in engines:
+        mal = common.make_interpreter(engine)
+        results[engine] = {}
+        # Set up every workload, later workloads may use definitions of earlier ones
+        for workload in workloads:
+            mal(workload.setup)
+            if workload.name not in selected_workloads:
+                continue
+            samples = run_workload(mal, workload, warmup, repeat)
+            results[engine][workload.name] = {
+                "median": statistics.median(samples),
+                "p95": percentile(samples, 0.95),
+                "samples": samples,
+            }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return {(engine, workload): relative change of the median} and the regressions"""
+    changes = {}
+    regressions = []
+    for engine, engine_results in results.items():
+        for name, result in engine_results.items():
+            try:
+                baseline_median = baseline[engine][name]["median"]
+            except KeyError:
+                continue
+            change = result["median"] / baseline_median - 1
+            changes[engine, name] = change
+            if change > threshold:
+                regressions.append((engine, name))
+    return changes, regressions
+
+
+def print_results(results, changes, regressions):
+    print(
+        f"{'engine':>8} {'workload':>14} {'median ms':>10} {'p95 ms':>10} {'change':>8}"
+    )
+    for engine, engine_results in results.items():
+        for name, result in engine_results.items():
+            line = (
+                f"{engine:>8} {name:>14} {result['median'] * 1000:>10.2f} "
+                f"{result['p95'] * 1000:>10.2f}"
+            )
+            if (engine, name) in changes:
+                line += f" {changes[engine, name]:>+8.1%}"
+            if (engine, name) in regressions:
+                line += "  REGRESSION"
+            print(line)
+
+
+def parse_arguments(argv):
+    argument_parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks.suite", description=__doc__.splitlines()[0]
+    )
+    argument_parser.add_argument(
+        "--engine",
+        action="append",
+        choices=stepA_mal.engines.keys(),
+        help="engine to run, can be repeated (default: all)",
+    )
+    argument_parser.add_argument(
+        "--workload",
+        action="append",
+        choices=[workload.name for workload in workloads],
+        help="workload to run, can be repeated (default: all)",
+    )
+    argument_parser.add_argument(
+        "--warmup", type=int, default=2, help="untimed runs (default: %(default)s)"
+    )
+    argument_parser.add_argument(
+        "--repeat", type=int, default=10, help="timed runs (default: %(default)s)"
+    )
+    argument_parser.add_argument("--json", help="write the results to this file")
+    argument_parser.add_argument(
+        "--baseline", help="compare with results written by --json"
+    )
+    argument_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown of the median reported as a regression "
+        "(default: %(default)s)",
+    )
+    return argument_parser.parse_args(argv)
+
+
+def main(argv):
+    arguments = parse_arguments(argv)
+    engines = arguments.engine or list(stepA_mal.engines)
+    selected_workloads = arguments.workload or [workload.name for workload in workloads]
+
+    json_path = arguments.json and os.path.abspath(arguments.json)
+    baseline_path = arguments.baseline and os.path.abspath(arguments.baseline)
+    os.chdir(tests_directory)
+    results = run_suite(engines, selected_workloads, arguments.warmup, arguments.repeat)
+
+    changes, regressions = {}, []
+    if baseline_path is not None:
+        with open(baseline_path) as file:
+            baseline = json.load(file)["results"]
+        changes, regressions = compare(results, baseline, arguments.threshold)
+
+    print_results(results, changes, regressions)
+
+    if json_path is not None:
+        with open(json_path, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "warmup": arguments.warmup,
+                    "repeat": arguments.repeat,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,48 @@
+"""Benchmark: a map/filter/sum pipeline over a vector, with the recursive reduce of
+lib/reducers.mal over the intermediate lists, with the native reduce over the same
+lists, and with transduce, which runs the pipeline in one pass.
+Run from impls/myPython:
+```
+python3 -m benchmarks.transducers
+```
+"""
+
+import os
+
+from benchmarks import common
+
+lib_directory = os.path.join(os.path.dirname(__file__), "..", "..", "lib")
+sizes = [1000, 10000, 100000]
+
+definitions = """
+(do
+  (def! inc (fn* [x] (+ x 1)))
+  (def! odd? (fn* [x] (= 1 (- x (* 2 (/ x 2))))))
+  (def! native-reduce reduce)  ; Before reducers.mal redefines reduce
+  (def! build (fn* [n acc] (if (= n 0) acc (build (- n 1) (conj acc n))))))
+"""
+
+pipelines = {
+    "lib reduce": "(reduce + 0 (filter number? (map - data)))",
+    "native reduce": "(native-reduce + 0 (filter number? (map - data)))",
+    "transduce": "(transduce (comp (map -) (filter number?)) + 0 data)",
+}
+
+
+def main():
+    mal = common.make_interpreter()
+    mal(definitions)
+    mal(f'(load-file "{os.path.join(lib_directory, "reducers.mal")}")')
+
+    print(f"{'size':>8}" + "".join(f"{name + ' (ms)':>20}" for name in pipelines))
+    for size in sizes:
+        mal(f"(def! data (build {size} []))")
+        times = []
+        for source in pipelines.values():
+            seconds, _ = common.time_call(mal, source)
+            times.append(seconds)
+        print(f"{size:>8}" + "".join(f"{seconds * 1000:>20.2f}" for seconds in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Benchmark: building a vector with conj and indexing it with nth.
+The time per element should stay roughly constant as the vector grows.
+Run from impls/myPython:
+```
+python3 -m benchmarks.vector
+```
+"""
+
+from benchmarks import common
+
+sizes = [1000, 10000, 100000]
+
+definitions = """
+(do
+  (def! build (fn* [v n] (if (= n 0) v (build (conj v n) (- n 1)))))
+  (def! sum-nth (fn* [v i acc]
+    (if (= i (count v)) acc (sum-nth v (+ i 1) (+ acc (nth v i))))))
+  (def! update-all (fn* [v i]
+    (if (= i (count v)) v (update-all (assoc v i 0) (+ i 1))))))
+"""
+
+
+def main():
+    mal = common.make_interpreter()
+    mal(definitions)
+
+    print(
+        f"{'size':>8} {'conj (us/elem)':>15} {'nth (us/elem)':>14} {'assoc (us/elem)':>16}"
+    )
+    for size in sizes:
+        conj_time, _ = common.time_call(mal, f"(def! v (build [] {size}))")
+        nth_time, _ = common.time_call(mal, "(sum-nth v 0 0)")
+        assoc_time, _ = common.time_call(mal, "(count (update-all v 0))")
+        print(
+            f"{size:>8} {conj_time / size * 1e6:>15.2f} {nth_time / size * 1e6:>14.2f} "
+            f"{assoc_time / size * 1e6:>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
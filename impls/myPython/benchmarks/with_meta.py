@@ -0,0 +1,64 @@
+"""Micro-benchmark: with-meta and defmacro! vs. the size of the value.
+
+Times with-meta on lists, vectors and hash-maps of growing size, and with-meta and
+defmacro! on a function closing over a growing environment, with every engine. Both
+copy the value shallowly, so the times should not grow with the size.
+Run from impls/myPython:
+```
+python3 -m benchmarks.with_meta
+```
+"""
+
+import timeit
+
+from benchmarks import common
+from mal_python import stepA_mal
+
+sizes = [10, 1000, 100000]
+number = 1000
+
+setup = """(do
+  (def! make-list (fn* [n acc] (if (= n 0) acc (make-list (- n 1) (cons n acc)))))
+  (def! make-vector (fn* [n acc] (if (= n 0) acc (make-vector (- n 1) (conj acc n)))))
+  (def! make-map (fn* [n acc] (if (= n 0) acc (make-map (- n 1) (assoc acc n n)))))
+  (def! make-closure (fn* [l v m] (fn* [x] (count l)))))"""
+
+expressions = {
+    "list": "(with-meta data-list {:a 1})",
+    "vector": "(with-meta data-vector {:a 1})",
+    "hash-map": "(with-meta data-map {:a 1})",
+    "closure": "(with-meta data-closure {:a 1})",
+    "defmacro!": "(defmacro! data-macro data-closure)",
+}
+
+
+def main():
+    print(f"{'engine':>8} {'value':>10}" + "".join(f"{size:>10}" for size in sizes))
+    print(f"{'':>8} {'':>10}" + "".join(f"{'(us)':>10}" for _ in sizes))
+    for engine in stepA_mal.engines:
+        mal = common.make_interpreter(engine)
+        mal(setup)
+        times = {name: [] for name in expressions}
+        for size in sizes:
+            mal(f"""(do
+  (def! data-list (make-list {size} ()))
+  (def! data-vector (make-vector {size} []))
+  (def! data-map (make-map {size} {{}}))
+  (def! data-closure (make-closure data-list data-vector data-map)))""")
+            for name, expression in expressions.items():
+                form = stepA_mal.READ(expression)
+                seconds = timeit.timeit(
+                    lambda: stepA_mal.EVAL(form, stepA_mal.repl_environment),
+                    number=number,
+                )
+                times[name].append(seconds / number)
+
+        for name, name_times in times.items():
+            print(
+                f"{engine:>8} {name:>10}"
+                + "".join(f"{seconds * 1e6:>10.2f}" for seconds in name_times)
+            )
+
+
+if __name__ == "__main__":
+    main()
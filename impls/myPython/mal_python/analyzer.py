@@ -0,0 +1,541 @@
+"""Closure-compiling evaluator.
+
+Instead of re-walking the ast on every evaluation (see evaluator.Evaluator), a form is
+analyzed once into a tree of Python closures. Special forms, macro expansion and
+constant literals are resolved at analysis time, so executing the result only does the
+work that depends on the environment.
+Intended use:
+```
+evaluate(mal_type, environment)
+```
+
+Function bodies are analyzed lazily, the first time the function is called, and the
+result is cached on the FunctionState's code object, which is shared by every closure
+created from the same fn* form.
+
+Variables are resolved lexically at analysis time. Names bound by fn*, let* and catch*
+(and by def! inside them) are mapped to a (depth, slot) address. At run time they live
+in frames - Python lists whose first element is the enclosing frame, followed by one
+element per slot. Only names that are not bound locally are looked up in the global
+environment (an env.Env).
+
+Tail calls are returned to the caller as TailCall objects, and executed in a loop by
+invoke (trampolining), so tail recursion does not grow the Python stack.
+
+While profiling, invoke and expand_macro record the calls with the profiler.Profiler of
+their thread. Macros are expanded when a form is analyzed, so their expansions are
+recorded once per form, within the first call of the enclosing function.
+"""
+
+import copy
+
+from mal_python import core
+from mal_python import env
+from mal_python import mal_types
+from mal_python import profiler
+
+
+class Undefined:
+    """Value of a slot that was allocated by def! but not assigned yet"""
+
+    def __repr__(self):
+        return "#<undefined>"
+
+
+undefined = Undefined()
+
+
+class GlobalScope:
+    """The outermost scope. Names are looked up at run time in environment"""
+
+    def __init__(self, environment):
+        self.environment = environment
+
+    def resolve(self, symbol):
+        return None
+
+
+class Scope:
+    """Names bound by a fn*, let* or catch* form, and the frame slots they occupy.
+    Slot 0 of a frame holds the enclosing frame.
+    """
+
+    def __init__(self, outer, names=()):
+        self.outer = outer
+        self.environment = outer.environment
+        self.slots = {}
+        self.defined_slots = set()  # slots allocated by def!, may be unassigned
+        for name in names:
+            self.add(name)
+
+    @property
+    def size(self):
+        return len(self.slots) + 1
+
+    def add(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.slots) + 1
+        return self.slots[name]
+
+    def define(self, name):
+        if name in self.slots:
+            return self.slots[name]
+        slot = self.add(name)
+        self.defined_slots.add(slot)
+        return slot
+
+    def resolve(self, symbol):
+        """Return (depth, slot, may_be_undefined), or None for a global name"""
+        depth = 0
+        scope = self
+        while isinstance(scope, Scope):
+            slot = scope.slots.get(symbol)
+            if slot is not None:
+                return depth, slot, slot in scope.defined_slots
+            depth += 1
+            scope = scope.outer
+        return None
+
+
+class TailCall:
+    """A call in tail position, to be executed by the trampoline in invoke"""
+
+    __slots__ = ("function", "args")
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+
+class Lambda:
+    """The code of a fn* form, shared by all FunctionStates created from it.
+    The body is analyzed on first use and cached.
+    """
+
+    def __init__(self, params, body, outer_scope):
+        self.params = params
+        self.body = body
+        names = [param for param in params if param != "&"]
+        self.scope = Scope(outer_scope, names)
+        self.is_variadic = len(names) != len(params)
+        self.positional_count = len(names) - 1 if self.is_variadic else len(names)
+        self.compiled_body = None
+
+    def compile(self):
+        if self.compiled_body is None:
+            self.compiled_body = analyze(self.body, self.scope, tail=True)
+        return self.compiled_body
+
+    def make_frame(self, outer_frame, args):
+        count = self.positional_count
+        frame = [outer_frame, *args[:count]]
+        if len(args) < count:  # Missing arguments are nil
+            frame.extend([mal_types.nil] * (count - len(args)))
+        if self.is_variadic:
+            frame.append(mal_types.List(args[count:]))
+        if len(frame) < self.scope.size:
+            frame.extend([undefined] * (self.scope.size - len(frame)))
+        return frame
+
+    def captured_variables(self, frame):
+        """Return (variables, environment): the values of the local variables a
+        function of this code captures, by name, read from frame (the frame the function
+        was created in) and its enclosing frames, and the global environment
+        """
+        variables = {}
+        scope = self.scope.outer
+        while isinstance(scope, Scope):
+            for name, slot in scope.slots.items():
+                if name not in variables and frame[slot] is not undefined:
+                    variables[name] = frame[slot]
+            frame = frame[0]
+            scope = scope.outer
+        return variables, scope.environment
+
+
+def invoke(function, args):
+    """Call a FunctionState created by this module, executing tail calls in a loop"""
+    if profiler.profiling:
+        recorder = profiler.current()
+        if recorder is not None:
+            return invoke_recorded(function, args, recorder)
+    while True:
+        code = function.code
+        body = code.compiled_body or code.compile()
+        result = body(code.make_frame(function.env, args))
+        if type(result) is not TailCall:
+            return result
+        function = result.function
+        args = result.args
+
+
+def invoke_recorded(function, args, recorder):
+    """invoke, recording the call and its tail calls with recorder"""
+    recorder.enter_function(function)
+    try:
+        while True:
+            code = function.code
+            body = code.compiled_body or code.compile()
+            result = body(code.make_frame(function.env, args))
+            if type(result) is not TailCall:
+                return result
+            function = result.function
+            args = result.args
+            recorder.tail_call(function)
+    finally:
+        recorder.exit()
+
+
+def run(code, frame):
+    result = code(frame)
+    if type(result) is TailCall:
+        return invoke(result.function, result.args)
+    return result
+
+
+def make_function(code, frame, is_macro=mal_types.false):
+    function = mal_types.FunctionState(code.body, code.params, frame, None, is_macro)
+    function.fn = lambda *args: invoke(function, args)
+    function.code = code
+    return function
+
+
+def name_function(value, key):
+    """Name a function after the first def! of it, as evaluator.Evaluator does, for the
+    profiler
+    """
+    if isinstance(value, mal_types.FunctionState) and value.name is None:
+        value.name = str(key)
+
+
+def not_found(symbol):
+    return env.MissingKeyInEnvironment(f"'{symbol}' not found")
+
+
+def is_macro_call(mal_type, scope):
+    if isinstance(mal_type, mal_types.List) and len(mal_type) > 0:
+        function_name = mal_type[0]
+        if isinstance(function_name, mal_types.Symbol) and not scope.resolve(
+            function_name
+        ):
+            function = scope.environment.data.get(function_name)
+            return isinstance(function, mal_types.FunctionState) and function.is_macro
+
+    return False
+
+
+def expand_macro(mal_type, scope):
+    while is_macro_call(mal_type, scope):
+        function = scope.environment.data[mal_type[0]]
+        recorder = profiler.current()
+        if recorder is not None:
+            mal_type = recorder.expand_macro(function, mal_type[1:])
+        else:
+            mal_type = function(*mal_type[1:])
+
+    return mal_type
+
+
+def analyze_constant(mal_type):
+    return lambda frame: mal_type
+
+
+def analyze_global(symbol, environment):
+    data = environment.data
+
+    def global_(frame):
+        try:
+            return data[symbol]
+        except KeyError:
+            raise not_found(symbol)
+
+    return global_
+
+
+def analyze_symbol(symbol, scope):
+    address = scope.resolve(symbol)
+    if address is None:
+        return analyze_global(symbol, scope.environment)
+
+    depth, slot, may_be_undefined = address
+    if may_be_undefined:
+
+        def defined_local(frame):
+            for _ in range(depth):
+                frame = frame[0]
+            value = frame[slot]
+            if value is undefined:
+                raise not_found(symbol)
+            return value
+
+        return defined_local
+
+    if depth == 0:
+        return lambda frame: frame[slot]
+    elif depth == 1:
+        return lambda frame: frame[0][slot]
+    elif depth == 2:
+        return lambda frame: frame[0][0][slot]
+
+    def local(frame):
+        for _ in range(depth):
+            frame = frame[0]
+        return frame[slot]
+
+    return local
+
+
+def analyze_vector(mal_type, scope):
+    codes = [analyze(item, scope) for item in mal_type]
+    return lambda frame: mal_types.Vector([code(frame) for code in codes])
+
+
+def analyze_hash_map(mal_type, scope):
+    pairs = [(key, analyze(value, scope)) for key, value in mal_type.items()]
+    return lambda frame: mal_types.HashMap.from_pairs(
+        (key, code(frame)) for key, code in pairs
+    )
+
+
+def analyze_def(mal_type, scope, tail):
+    key = mal_type[1]
+    value_code = analyze(mal_type[2], scope)
+
+    if isinstance(scope, GlobalScope):
+        environment = scope.environment
+
+        def define_global(frame):
+            value = value_code(frame)
+            name_function(value, key)
+            environment.set(key, value)
+            return value
+
+        return define_global
+
+    slot = scope.define(key)
+
+    def define(frame):
+        value = value_code(frame)
+        name_function(value, key)
+        frame[slot] = value
+        return value
+
+    return define
+
+
+def analyze_defmacro(mal_type, scope, tail):
+    key = mal_type[1]
+    value_code = analyze(mal_type[2], scope)
+    environment = scope.environment
+
+    def define_macro(frame):
+        function = value_code(frame)
+        name_function(function, key)
+        function = copy.copy(function)  # do not mutate original function
+        function.is_macro = mal_types.true
+        environment.set(key, function)
+        return function
+
+    return define_macro
+
+
+def analyze_let(mal_type, scope, tail):
+    let_scope = Scope(scope)
+    binding_list = mal_type[1]
+    bindings = []
+    for key, unevaluated_value in zip(binding_list[::2], binding_list[1::2]):
+        # Analyze the value before binding the name, so that the value can refer to
+        # an outer variable with the same name
+        code = analyze(unevaluated_value, let_scope)
+        bindings.append((let_scope.add(key), code))
+    body = analyze(mal_type[2], let_scope, tail)
+
+    def let(frame):
+        let_frame = [frame] + [undefined] * (let_scope.size - 1)
+        for slot, code in bindings:
+            let_frame[slot] = code(let_frame)
+        return body(let_frame)
+
+    return let
+
+
+def analyze_do(mal_type, scope, tail):
+    codes = [analyze(item, scope) for item in mal_type[1:-1]]
+    last = analyze(mal_type[-1], scope, tail)
+
+    def do(frame):
+        for code in codes:
+            code(frame)
+        return last(frame)
+
+    return do
+
+
+def analyze_if(mal_type, scope, tail):
+    condition = analyze(mal_type[1], scope)
+    true_statement = analyze(mal_type[2], scope, tail)
+    if len(mal_type) > 3:
+        false_statement = analyze(mal_type[3], scope, tail)
+    else:  # No false expression provided
+        false_statement = analyze_constant(mal_types.nil)
+
+    def if_(frame):
+        condition_value = condition(frame)
+        if condition_value is mal_types.nil or condition_value is mal_types.false:
+            return false_statement(frame)
+        return true_statement(frame)
+
+    return if_
+
+
+def analyze_fn(mal_type, scope, tail):
+    code = Lambda(params=mal_type[1], body=mal_type[2], outer_scope=scope)
+    return lambda frame: make_function(code, frame)
+
+
+def analyze_quote(mal_type, scope, tail):
+    return analyze_constant(mal_type[1])
+
+
+def analyze_quasiquoteexpand(mal_type, scope, tail):
+    return analyze_constant(core.quasiquote(mal_type[1]))
+
+
+def analyze_quasiquote(mal_type, scope, tail):
+    return analyze(core.quasiquote(mal_type[1]), scope, tail)
+
+
+def analyze_macroexpand(mal_type, scope, tail):
+    macro = mal_type[1]
+    return lambda frame: expand_macro(macro, scope)
+
+
+def analyze_try(mal_type, scope, tail):
+    try_statement = analyze(mal_type[1], scope)
+    try:
+        catch_block = mal_type[2]
+    except IndexError:
+        catch_block = None
+    else:
+        catch_scope = Scope(scope, [catch_block[1]])
+        catch_statement = analyze(catch_block[2], catch_scope)
+
+    def try_(frame):
+        try:
+            return try_statement(frame)
+        except Exception as exception:
+            if catch_block is None:
+                raise env.MissingKeyInEnvironment(f"{mal_type[1]} not found")
+
+            exception_value = (
+                exception.value
+                if isinstance(exception, mal_types.MalException)
+                else mal_types.String(str(exception))
+            )
+            catch_frame = [frame, exception_value]
+            catch_frame.extend([undefined] * (catch_scope.size - 2))
+            return catch_statement(catch_frame)
+
+    return try_
+
+
+def analyze_call(mal_type, scope, tail):
+    function_code = analyze(mal_type[0], scope)
+    argument_codes = [analyze(item, scope) for item in mal_type[1:]]
+
+    if len(argument_codes) == 2:
+        first_code, second_code = argument_codes
+
+        def binary_call(frame):
+            function = function_code(frame)
+            first = first_code(frame)
+            second = second_code(frame)
+            if type(function) is mal_types.NativeFunction:
+                return function.binary(first, second)
+            if (
+                tail
+                and isinstance(function, mal_types.FunctionState)
+                and function.code is not None
+            ):
+                return TailCall(function, [first, second])
+            return function(first, second)
+
+        return binary_call
+
+    def call(frame):
+        function = function_code(frame)
+        args = [code(frame) for code in argument_codes]
+        if (
+            tail
+            and isinstance(function, mal_types.FunctionState)
+            and function.code is not None
+        ):
+            return TailCall(function, args)
+        return function(*args)
+
+    return call
+
+
+special_forms = {
+    mal_types.Symbol("def!"): analyze_def,
+    mal_types.Symbol("defmacro!"): analyze_defmacro,
+    mal_types.Symbol("let*"): analyze_let,
+    mal_types.Symbol("do"): analyze_do,
+    mal_types.Symbol("if"): analyze_if,
+    mal_types.Symbol("fn*"): analyze_fn,
+    mal_types.Symbol("quote"): analyze_quote,
+    mal_types.Symbol("quasiquoteexpand"): analyze_quasiquoteexpand,
+    mal_types.Symbol("quasiquote"): analyze_quasiquote,
+    mal_types.Symbol("macroexpand"): analyze_macroexpand,
+    mal_types.Symbol("try*"): analyze_try,
+}
+
+
+def analyze(mal_type, scope, tail=False):
+    """Return a closure that evaluates mal_type when called with a frame of scope.
+
+    In tail position (tail=True) the closure may return a TailCall instead of a value.
+    """
+    if isinstance(mal_type, mal_types.Symbol):
+        return analyze_symbol(mal_type, scope)
+
+    elif isinstance(mal_type, mal_types.Vector):
+        return analyze_vector(mal_type, scope)
+
+    elif isinstance(mal_type, mal_types.HashMap):
+        return analyze_hash_map(mal_type, scope)
+
+    elif not isinstance(mal_type, mal_types.List) or len(mal_type) == 0:
+        return analyze_constant(mal_type)
+
+    mal_type = expand_macro(mal_type, scope)
+    if not isinstance(mal_type, mal_types.List):
+        return analyze(mal_type, scope, tail)
+
+    operation_type = mal_type[0]
+    if type(operation_type) is mal_types.Symbol:
+        special_form = special_forms.get(operation_type)
+        if special_form is not None:
+            return special_form(mal_type, scope, tail)
+
+    return analyze_call(mal_type, scope, tail)
+
+
+def evaluate(mal_type, environment):
+    """Analyze and execute mal_type in the global environment.
+    Forms of a top level do are analyzed and executed one at a time, so macros
+    defined by one form can be used by the following forms.
+    """
+    scope = GlobalScope(environment)
+    mal_type = expand_macro(mal_type, scope)
+
+    if (
+        isinstance(mal_type, mal_types.List)
+        and len(mal_type) > 1
+        and mal_type[0] == "do"
+    ):
+        for item in mal_type[1:-1]:
+            evaluate(item, environment)
+        return evaluate(mal_type[-1], environment)
+
+    return run(analyze(mal_type, scope, tail=True), None)
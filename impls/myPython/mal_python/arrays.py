@@ -0,0 +1,254 @@
+"""Typed arrays: numeric values backed by NumPy arrays, for processing numeric data in
+native loops instead of evaluating a mal function per element.
+
+NumPy is optional (pip install mal_python[numpy]) and is only imported when the first
+typed array is created. Arrays are written #f64[1.5 2.0], #i64[1 2] and
+#bool[true false], and are immutable like the other mal values. The arithmetic core
+functions (+ - * /) work elementwise on them, with numbers broadcast over arrays.
+"""
+
+import operator
+
+from mal_python import mal_types
+
+numpy = None  # Imported by load_numpy
+
+# Reader/printer tag -> NumPy dtype name
+tag_dtypes = {"#f64": "float64", "#i64": "int64", "#bool": "bool"}
+dtype_tags = {dtype: tag for tag, dtype in tag_dtypes.items()}
+
+# NumPy dtype kind -> the dtype name arrays of that kind are converted to
+kind_dtypes = {"f": "float64", "i": "int64", "u": "int64", "b": "bool"}
+
+
+def load_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise mal_types.MalException(
+                mal_types.String(
+                    "typed arrays require NumPy: pip install mal_python[numpy]"
+                )
+            )
+    return numpy
+
+
+def operand(value):
+    if isinstance(value, TypedArray):
+        return value.array
+    if isinstance(value, mal_types.number_types):
+        return value
+    raise mal_types.MalException(
+        mal_types.String(f"expected a number or a typed array, got {value!r}")
+    )
+
+
+def check_lengths(first, second):
+    """Raise unless the operands have the same length, or one of them is a number.
+    NumPy would broadcast an array of length 1 over the other one, or raise.
+    """
+    if (
+        not isinstance(first, mal_types.number_types)
+        and not isinstance(second, mal_types.number_types)
+        and len(first) != len(second)
+    ):
+        raise mal_types.MalException(
+            mal_types.String(
+                f"typed arrays of different lengths, {len(first)} and {len(second)}"
+            )
+        )
+
+
+def elementwise(operation, reflected=False):
+    """Return a TypedArray method applying operation to its elements and a number or
+    the elements of an array of the same length
+    """
+
+    def method(self, other):
+        other = operand(other)
+        check_lengths(self.array, other)
+        if reflected:
+            return TypedArray(operation(other, self.array))
+        return TypedArray(operation(self.array, other))
+
+    return method
+
+
+def unordered(self, other):
+    # < and friends would return a bool array, which is neither true nor false
+    raise mal_types.MalException(
+        mal_types.String(
+            "typed arrays are compared elementwise with array<, array<=, array> "
+            "and array>="
+        )
+    )
+
+
+class TypedArray(mal_types.CachedHash, mal_types.Metadata):
+    """Immutable wrapper of a one dimensional float64, int64 or bool NumPy array"""
+
+    __slots__ = ("array", "metadata", "hash")
+
+    def __init__(self, array):
+        dtype = kind_dtypes.get(array.dtype.kind)
+        if dtype is None:
+            raise mal_types.MalException(
+                mal_types.String(f"unsupported array type {array.dtype}")
+            )
+        if array.dtype != dtype:
+            array = array.astype(dtype)
+        elif array.flags.writeable and array.base is not None:
+            array = array.copy()  # A view of an array that may still be changed
+        array.flags.writeable = False
+        self.array = array
+
+    def __reduce__(self):
+        # The array is made read only again when unpickled
+        return (unpickle, (self.array,))
+
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        return iter(self.array.tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TypedArray(self.array[index])
+        return self.array[index].item()
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, TypedArray)
+            and self.array.dtype == other.array.dtype
+            and not self.hashes_differ(other)
+            and load_numpy().array_equal(self.array, other.array)
+        )
+
+    __hash__ = mal_types.CachedHash.__hash__
+
+    def structural_hash(self):
+        array = self.array
+        if array.dtype == "float64":
+            array = array + 0.0  # -0.0 is = to 0.0, so it must hash the same
+        return hash((array.dtype.name, array.tobytes()))
+
+    def __repr__(self):
+        if self.array.dtype == "bool":
+            items = ("true" if item else "false" for item in self.array.tolist())
+        else:
+            items = map(repr, self.array.tolist())
+        return f"{dtype_tags[self.array.dtype.name]}[{' '.join(items)}]"
+
+    def __neg__(self):
+        return TypedArray(-self.array)
+
+    __add__ = elementwise(operator.add)
+    __radd__ = elementwise(operator.add, reflected=True)
+    __sub__ = elementwise(operator.sub)
+    __rsub__ = elementwise(operator.sub, reflected=True)
+    __mul__ = elementwise(operator.mul)
+    __rmul__ = elementwise(operator.mul, reflected=True)
+    __truediv__ = elementwise(operator.truediv)
+    __rtruediv__ = elementwise(operator.truediv, reflected=True)
+    __lt__ = __le__ = __gt__ = __ge__ = unordered
+
+
+def unpickle(array):
+    """Rebuild a pickled TypedArray, in a process that may not have used NumPy yet"""
+    load_numpy()
+    return TypedArray(array)
+
+
+def from_items(items, dtype):
+    """Return a TypedArray of dtype from mal numbers (or true/false for bool)"""
+    numpy = load_numpy()
+    if dtype == "bool":
+        values = []
+        for item in items:
+            if item is not mal_types.true and item is not mal_types.false:
+                raise mal_types.MalException(
+                    mal_types.String(f"expected true or false, got {item!r}")
+                )
+            values.append(item is mal_types.true)
+    else:
+        values = [operand(item) for item in items]
+    try:
+        return TypedArray(numpy.array(values, dtype=dtype))
+    except OverflowError:
+        raise mal_types.MalException(
+            mal_types.String(f"numbers out of the {dtype} range")
+        )
+
+
+def as_array(value):
+    """Return the NumPy array of a TypedArray, or of a sequence of numbers"""
+    if isinstance(value, TypedArray):
+        return value.array
+    return from_items(value, "float64").array
+
+
+def reduction(name):
+    def reduce(value):
+        array = as_array(value)
+        if not len(array) and name != "sum":
+            raise mal_types.MalException(mal_types.String(f"{name} of empty array"))
+        return getattr(array, name)().item()
+
+    return reduce
+
+
+def comparison(operation):
+    """Return a function comparing the elements of an array with a number or the
+    elements of another array, returning a bool array
+    """
+
+    def compare(first, second):
+        if not isinstance(first, TypedArray) and not isinstance(second, TypedArray):
+            raise mal_types.MalException(mal_types.String("expected a typed array"))
+        first, second = operand(first), operand(second)
+        check_lengths(first, second)
+        return TypedArray(operation(first, second))
+
+    return compare
+
+
+def array_slice(value, start, end=mal_types.nil):
+    for bound in (start, end) if end is not mal_types.nil else (start,):
+        if type(bound) is not int:
+            raise mal_types.MalException(
+                mal_types.String(f"array-slice: {bound!r} is not an integer")
+            )
+    array = as_array(value)
+    return TypedArray(array[start : None if end is mal_types.nil else end])
+
+
+def array_mask(value, mask):
+    """The elements of value where the bool array mask is true"""
+    if not isinstance(mask, TypedArray) or mask.array.dtype != "bool":
+        raise mal_types.MalException(mal_types.String("mask must be a #bool array"))
+    array = as_array(value)
+    check_lengths(array, mask.array)
+    return TypedArray(array[mask.array])
+
+
+namespace = {
+    mal_types.Symbol("f64-array"): lambda items: from_items(items, "float64"),
+    mal_types.Symbol("i64-array"): lambda items: from_items(items, "int64"),
+    mal_types.Symbol("array?"): lambda mal_type: (
+        mal_types.true if isinstance(mal_type, TypedArray) else mal_types.false
+    ),
+    mal_types.Symbol("array-sum"): reduction("sum"),
+    mal_types.Symbol("array-min"): reduction("min"),
+    mal_types.Symbol("array-max"): reduction("max"),
+    mal_types.Symbol("array-mean"): reduction("mean"),
+    mal_types.Symbol("array-slice"): array_slice,
+    mal_types.Symbol("array-mask"): array_mask,
+    mal_types.Symbol("array<"): comparison(operator.lt),
+    mal_types.Symbol("array<="): comparison(operator.le),
+    mal_types.Symbol("array>"): comparison(operator.gt),
+    mal_types.Symbol("array>="): comparison(operator.ge),
+    mal_types.Symbol("array="): comparison(operator.eq),
+}
@@ -0,0 +1,197 @@
+"""Byte buffers: immutable sequences of bytes, for processing large files without
+decoding or even reading all of them.
+
+A buffer is a range of a bytes object or of a read-only memory-mapped file.
+(mmap-file name) maps a file, so its pages are only read from disk when they are
+accessed and can be dropped from memory by the system, which bounds the memory used
+to scan a file by the page cache rather than by the size of the file. subbytes and
+bytes-lines return buffers sharing the data, without copying it. Only bytes->string
+copies, to decode the range it is given.
+
+A mapping has no close function, as the buffers sharing it would then fail: it is
+closed, and the file with it, when the last buffer using it is garbage collected.
+"""
+
+import mmap
+
+from mal_python import mal_types
+from mal_python import sequences
+
+
+class Bytes(mal_types.CachedHash, mal_types.Metadata):
+    """The bytes data[start:end] of a bytes object or mmap.mmap"""
+
+    __slots__ = ("data", "start", "end", "metadata", "hash")
+
+    def __init__(self, data, start=0, end=None):
+        self.data = data
+        self.start = start
+        self.end = len(data) if end is None else end
+
+    def __reduce__(self):
+        # Mapped files are sent and pickled as bytes
+        return (Bytes, (bytes(self.view()),))
+
+    def view(self):
+        """Return a memoryview of the bytes, sharing the data"""
+        return memoryview(self.data)[self.start : self.end]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, end, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("byte buffers are only sliced with a step of 1")
+            return Bytes(self.data, self.start + start, self.start + max(start, end))
+        if not 0 <= index < len(self):
+            raise IndexError(f"byte index {index} out of range")
+        return self.data[self.start + index]
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Bytes)
+            and len(self) == len(other)
+            and not self.hashes_differ(other)
+            and self.view() == other.view()
+        )
+
+    __hash__ = mal_types.CachedHash.__hash__
+
+    def structural_hash(self):
+        return hash(self.view().tobytes())
+
+    def __repr__(self):
+        return f"#<bytes {len(self)}>"
+
+    def find(self, needle, start=0):
+        """Return the index of the first occurrence of needle at or after start (0 or
+        more), or -1, searching the data in place
+        """
+        index = self.data.find(needle, self.start + start, self.end)
+        return -1 if index == -1 else index - self.start
+
+
+def check_buffer(function, value):
+    if not isinstance(value, Bytes):
+        raise mal_types.MalException(
+            mal_types.String(f"{function}: expected a byte buffer, got {value!r}")
+        )
+
+
+def check_index(function, value):
+    if type(value) is not int:
+        raise mal_types.MalException(
+            mal_types.String(f"{function}: expected an integer index, got {value!r}")
+        )
+
+
+def mmap_file(name):
+    """(mmap-file name): the bytes of a file, mapped in memory read-only, until the
+    last buffer using the mapping is garbage collected
+    """
+    with open(str(name), "rb") as file:
+        try:
+            return Bytes(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except ValueError:  # Empty files cannot be mapped
+            return Bytes(b"")
+
+
+def slurp_bytes(name):
+    """(slurp-bytes name): the bytes of a file, read into memory"""
+    with open(str(name), "rb") as file:
+        return Bytes(file.read())
+
+
+def subbytes(buffer, start, end=mal_types.nil):
+    """(subbytes b start) or (subbytes b start end), like subs"""
+    check_buffer("subbytes", buffer)
+    end = len(buffer) if end is mal_types.nil else end
+    check_index("subbytes", start)
+    check_index("subbytes", end)
+    if not 0 <= start <= end <= len(buffer):
+        raise mal_types.MalException(
+            mal_types.String(
+                f"subbytes: range {start} {end} out of bounds for {len(buffer)} bytes"
+            )
+        )
+    return Bytes(buffer.data, buffer.start + start, buffer.start + end)
+
+
+def byte_at(buffer, index):
+    check_buffer("byte-at", buffer)
+    check_index("byte-at", index)
+    try:
+        return buffer[index]
+    except IndexError as error:
+        raise mal_types.MalException(mal_types.String(f"byte-at: {error}"))
+
+
+def bytes_to_string(buffer, encoding=mal_types.String("utf-8")):
+    """(bytes->string b) decodes UTF-8, invalid bytes are replaced by U+FFFD"""
+    check_buffer("bytes->string", buffer)
+    try:
+        return mal_types.String(str(buffer.view(), str(encoding), "replace"))
+    except LookupError:
+        raise mal_types.MalException(
+            mal_types.String(f"bytes->string: unknown encoding {encoding}")
+        )
+
+
+def needle_bytes(needle):
+    if isinstance(needle, Bytes):
+        return needle.view()
+    if isinstance(needle, mal_types.String):
+        return str(needle).encode()
+    raise mal_types.MalException(
+        mal_types.String(f"bytes-find: expected a string or buffer, got {needle!r}")
+    )
+
+
+def bytes_find(buffer, needle, start=0):
+    """(bytes-find b needle) or (bytes-find b needle start): the index of a string
+    (encoded in UTF-8) or bytes in b, at or after start, or nil
+    """
+    check_buffer("bytes-find", buffer)
+    check_index("bytes-find", start)
+    if start < 0:
+        raise mal_types.MalException(
+            mal_types.String(f"bytes-find: negative start {start}")
+        )
+    index = buffer.find(needle_bytes(needle), start)
+    return mal_types.nil if index == -1 else index
+
+
+def lines(buffer):
+    """Yield the lines of buffer, without their line feed, as buffers"""
+    data, position, end = buffer.data, buffer.start, buffer.end
+    while position < end:
+        line_end = data.find(b"\n", position, end)
+        if line_end == -1:
+            yield Bytes(data, position, end)
+            return
+        yield Bytes(data, position, line_end)
+        position = line_end + 1
+
+
+def bytes_lines(buffer):
+    check_buffer("bytes-lines", buffer)
+    return sequences.LazySeq(lines(buffer))
+
+
+namespace = {
+    mal_types.Symbol("mmap-file"): mmap_file,
+    mal_types.Symbol("slurp-bytes"): slurp_bytes,
+    mal_types.Symbol("subbytes"): subbytes,
+    mal_types.Symbol("byte-at"): byte_at,
+    mal_types.Symbol("bytes->string"): bytes_to_string,
+    mal_types.Symbol("bytes-find"): bytes_find,
+    mal_types.Symbol("bytes-lines"): bytes_lines,
+    mal_types.Symbol("bytes?"): lambda mal_type: (
+        mal_types.true if isinstance(mal_type, Bytes) else mal_types.false
+    ),
+}
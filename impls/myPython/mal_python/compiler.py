@@ -0,0 +1,375 @@
+"""Bytecode compiler for the stack based virtual machine in vm.py.
+Intended use:
+```
+code = FunctionCode(params, body, scope)
+bytecode, constants = code.compile()
+```
+
+A form is compiled into a flat list of integers, read as (opcode, argument) pairs, and
+a pool of constants that arguments can refer to. Special forms and macros are resolved
+at compile time, like in analyzer.py.
+
+Every function call gets one frame - a Python list whose first element is the frame of
+the enclosing function, followed by one slot per local name. Parameters and the names
+bound by let*, catch* and def! in the body are all given their own slot in the frame of
+the function, so that let* and try* do not create frames at run time. Variables of
+enclosing functions (upvalues) are addressed by (depth, slot), following the chain of
+enclosing frames. Closures keep a reference to the frame they were created in.
+
+Function bodies are compiled the first time the function is called, so the macros used in
+a body can be defined after the function.
+"""
+
+from mal_python import analyzer
+from mal_python import core
+from mal_python import mal_types
+
+# Opcodes. Arguments that are not used are 0
+CONST = 0  # Push constants[argument]
+LOAD_LOCAL = 1  # Push frame[argument]
+LOAD_PARENT = 2  # Push frame[0][argument]
+LOAD_OUTER = 3  # Push a slot of an enclosing frame, constants[argument] = (depth, slot)
+LOAD_DEFINED = 4  # Push a slot set by def!, constants[argument] = (depth, slot, name)
+LOAD_GLOBAL = 5  # Push the global variable named constants[argument]
+STORE_LOCAL = 6  # Pop into frame[argument]
+DEFINE_LOCAL = 7  # Store the top of the stack in frame[argument], without popping it
+DEFINE_GLOBAL = 8  # Set the global named constants[argument] to the top of the stack
+DEFINE_MACRO = 9  # Like DEFINE_GLOBAL, with a macro copy of the function
+POP = 10  # Discard the top of the stack
+JUMP = 11  # Continue at argument
+JUMP_IF_FALSE = 12  # Pop, and continue at argument if the value is nil or false
+MAKE_CLOSURE = 13  # Push a function of the FunctionCode constants[argument]
+CALL = 14  # Call with argument args. The stack holds the function, followed by the args
+TAIL_CALL = 15  # CALL and RETURN, replacing the frame of the caller
+RETURN = 16  # Return the top of the stack to the caller
+BUILD_VECTOR = 17  # Replace the top argument values of the stack with a vector of them
+BUILD_MAP = 18  # Replace the values for the keys in constants[argument] with a hash-map
+SETUP_TRY = 19  # Install a handler, constants[argument] is (handler, catch slot, form)
+POP_TRY = 20  # Remove the handler installed by the matching SETUP_TRY
+MACROEXPAND = 21  # Push the expansion of constants[argument], which is (form, scope)
+
+opcode_names = {
+    value: name for name, value in list(globals().items()) if name.isupper()
+}
+
+
+class Scope:
+    """Names bound by a fn* form (a frame scope), or by a let* or catch* form in its body
+    (a block scope), and the slots of the function's frame they occupy.
+    Slot 0 of a frame holds the enclosing frame.
+    """
+
+    def __init__(self, outer, frame_scope=None, names=(), script=False):
+        self.outer = outer
+        self.environment = outer.environment
+        self.frame_scope = frame_scope or self
+        self.script = script  # Top level code, def! sets global variables
+        self.slots = {}
+        if frame_scope is None:
+            self.size = 1
+            self.defined_slots = set()  # slots allocated by def!, may be unassigned
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        frame_scope = self.frame_scope
+        slot = self.slots[name] = frame_scope.size
+        frame_scope.size += 1
+        return slot
+
+    def define(self, name):
+        if name in self.slots:
+            return self.slots[name]
+        slot = self.add(name)
+        self.frame_scope.defined_slots.add(slot)
+        return slot
+
+    def resolve(self, symbol):
+        """Return (depth, slot, may_be_undefined), or None for a global name"""
+        depth = 0
+        scope = self
+        while isinstance(scope, Scope):
+            slot = scope.slots.get(symbol)
+            if slot is not None:
+                return depth, slot, slot in scope.frame_scope.defined_slots
+            if scope.frame_scope is scope:
+                depth += 1
+            scope = scope.outer
+        return None
+
+
+class FunctionCode:
+    """The code of a fn* form, shared by all functions created from it.
+    The body is compiled on first use, into compiled: a (bytecode, constants) pair,
+    set in one assignment so threads calling the function never see half of it.
+    """
+
+    def __init__(self, params, body, outer_scope, script=False):
+        self.params = params
+        self.body = body
+        names = [param for param in params if param != "&"]
+        self.scope = Scope(outer_scope, names=names, script=script)
+        self.is_variadic = len(names) != len(params)
+        self.positional_count = len(names) - 1 if self.is_variadic else len(names)
+        self.globals = outer_scope.environment.data
+        self.compiled = None
+
+    def compile(self):
+        if self.compiled is None:
+            compiler = Compiler()
+            compiler.compile(self.body, self.scope, tail=True)
+            self.compiled = compiler.bytecode, compiler.constants
+        return self.compiled
+
+    def make_frame(self, outer_frame, args):
+        count = self.positional_count
+        frame = [outer_frame, *args[:count]]
+        if len(args) < count:  # Missing arguments are nil
+            frame.extend([mal_types.nil] * (count - len(args)))
+        if self.is_variadic:
+            frame.append(mal_types.List(args[count:]))
+        if len(frame) < self.scope.size:
+            frame.extend([analyzer.undefined] * (self.scope.size - len(frame)))
+        return frame
+
+    def captured_variables(self, frame):
+        """Return (variables, environment): the values of the local variables a
+        function of this code captures, by name, read from frame (the frame the function
+        was created in) and its enclosing frames, and the global environment
+        """
+        variables = {}
+        scope = self.scope.outer
+        while isinstance(scope, Scope):
+            for name, slot in scope.slots.items():
+                if name not in variables and frame[slot] is not analyzer.undefined:
+                    variables[name] = frame[slot]
+            if scope.frame_scope is scope:  # Block scopes share the function's frame
+                frame = frame[0]
+            scope = scope.outer
+        return variables, scope.environment
+
+
+def disassemble(code):
+    """Return the compiled bytecode of a FunctionCode as readable text"""
+    bytecode, constants = code.compile()
+    lines = []
+    for pc in range(0, len(bytecode), 2):
+        opcode, argument = bytecode[pc : pc + 2]
+        line = f"{pc:>5} {opcode_names[opcode]:<14} {argument}"
+        if opcode in Compiler.constant_opcodes:
+            line += f" ({constants[argument]!r})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class Compiler:
+    """Compile forms into bytecode.
+    In tail position (tail=True) the generated code returns the value of the form,
+    with RETURN or TAIL_CALL. Otherwise it leaves the value on the stack.
+    """
+
+    constant_opcodes = {
+        CONST,
+        LOAD_OUTER,
+        LOAD_DEFINED,
+        LOAD_GLOBAL,
+        DEFINE_GLOBAL,
+        DEFINE_MACRO,
+        MAKE_CLOSURE,
+        BUILD_MAP,
+        SETUP_TRY,
+        MACROEXPAND,
+    }
+
+    def __init__(self):
+        self.bytecode = []
+        self.constants = []
+        self.constant_indices = {}  # id of constant -> index in constants
+
+    def emit(self, opcode, argument=0):
+        """Append an instruction, and return the index of its argument for patching"""
+        self.bytecode.append(opcode)
+        self.bytecode.append(argument)
+        return len(self.bytecode) - 1
+
+    def patch(self, argument_index, argument=None):
+        """Set the argument of an emitted instruction, by default to the next pc"""
+        if argument is None:
+            argument = len(self.bytecode)
+        self.bytecode[argument_index] = argument
+
+    def constant(self, value):
+        index = self.constant_indices.get(id(value))
+        if index is None:
+            index = self.constant_indices[id(value)] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def emit_return(self, tail):
+        if tail:
+            self.emit(RETURN)
+
+    def compile_constant(self, mal_type, tail):
+        self.emit(CONST, self.constant(mal_type))
+        self.emit_return(tail)
+
+    def compile_symbol(self, symbol, scope, tail):
+        address = scope.resolve(symbol)
+        if address is None:
+            self.emit(LOAD_GLOBAL, self.constant(symbol))
+        else:
+            depth, slot, may_be_undefined = address
+            if may_be_undefined:
+                self.emit(LOAD_DEFINED, self.constant((depth, slot, symbol)))
+            elif depth == 0:
+                self.emit(LOAD_LOCAL, slot)
+            elif depth == 1:
+                self.emit(LOAD_PARENT, slot)
+            else:
+                self.emit(LOAD_OUTER, self.constant((depth, slot)))
+        self.emit_return(tail)
+
+    def compile_vector(self, mal_type, scope, tail):
+        for item in mal_type:
+            self.compile(item, scope)
+        self.emit(BUILD_VECTOR, len(mal_type))
+        self.emit_return(tail)
+
+    def compile_hash_map(self, mal_type, scope, tail):
+        keys = []
+        for key, value in mal_type.items():
+            keys.append(key)
+            self.compile(value, scope)
+        self.emit(BUILD_MAP, self.constant(tuple(keys)))
+        self.emit_return(tail)
+
+    def compile_def(self, mal_type, scope, tail):
+        key = mal_type[1]
+        self.compile(mal_type[2], scope)
+        if scope.script:
+            self.emit(DEFINE_GLOBAL, self.constant(key))
+        else:
+            self.emit(DEFINE_LOCAL, scope.define(key))
+        self.emit_return(tail)
+
+    def compile_defmacro(self, mal_type, scope, tail):
+        self.compile(mal_type[2], scope)
+        self.emit(DEFINE_MACRO, self.constant(mal_type[1]))
+        self.emit_return(tail)
+
+    def compile_let(self, mal_type, scope, tail):
+        let_scope = Scope(scope, scope.frame_scope)
+        binding_list = mal_type[1]
+        for key, unevaluated_value in zip(binding_list[::2], binding_list[1::2]):
+            # Compile the value before binding the name, so that the value can refer to
+            # an outer variable with the same name
+            self.compile(unevaluated_value, let_scope)
+            self.emit(STORE_LOCAL, let_scope.add(key))
+        self.compile(mal_type[2], let_scope, tail)
+
+    def compile_do(self, mal_type, scope, tail):
+        if len(mal_type) == 1:
+            return self.compile_constant(mal_types.nil, tail)
+        for item in mal_type[1:-1]:
+            self.compile(item, scope)
+            self.emit(POP)
+        self.compile(mal_type[-1], scope, tail)
+
+    def compile_if(self, mal_type, scope, tail):
+        self.compile(mal_type[1], scope)
+        false_jump = self.emit(JUMP_IF_FALSE)
+        self.compile(mal_type[2], scope, tail)
+        if not tail:
+            end_jump = self.emit(JUMP)
+        self.patch(false_jump)
+        if len(mal_type) > 3:
+            self.compile(mal_type[3], scope, tail)
+        else:  # No false expression provided
+            self.compile_constant(mal_types.nil, tail)
+        if not tail:
+            self.patch(end_jump)
+
+    def compile_fn(self, mal_type, scope, tail):
+        code = FunctionCode(params=mal_type[1], body=mal_type[2], outer_scope=scope)
+        self.emit(MAKE_CLOSURE, self.constant(code))
+        self.emit_return(tail)
+
+    def compile_quote(self, mal_type, scope, tail):
+        self.compile_constant(mal_type[1], tail)
+
+    def compile_quasiquoteexpand(self, mal_type, scope, tail):
+        self.compile_constant(core.quasiquote(mal_type[1]), tail)
+
+    def compile_quasiquote(self, mal_type, scope, tail):
+        self.compile(core.quasiquote(mal_type[1]), scope, tail)
+
+    def compile_macroexpand(self, mal_type, scope, tail):
+        self.emit(MACROEXPAND, self.constant((mal_type[1], scope)))
+        self.emit_return(tail)
+
+    def compile_try(self, mal_type, scope, tail):
+        setup = self.emit(SETUP_TRY)
+        self.compile(mal_type[1], scope)
+        self.emit(POP_TRY)
+        if tail:
+            self.emit(RETURN)
+        else:
+            end_jump = self.emit(JUMP)
+
+        handler = len(self.bytecode)
+        try:
+            catch_block = mal_type[2]
+        except IndexError:
+            catch_slot = None
+        else:
+            catch_scope = Scope(scope, scope.frame_scope)
+            catch_slot = catch_scope.add(catch_block[1])
+            self.compile(catch_block[2], catch_scope, tail)
+
+        self.patch(setup, self.constant((handler, catch_slot, mal_type[1])))
+        if not tail:
+            self.patch(end_jump)
+
+    def compile_call(self, mal_type, scope, tail):
+        for item in mal_type:
+            self.compile(item, scope)
+        self.emit(TAIL_CALL if tail else CALL, len(mal_type) - 1)
+
+    special_forms = {
+        mal_types.Symbol("def!"): compile_def,
+        mal_types.Symbol("defmacro!"): compile_defmacro,
+        mal_types.Symbol("let*"): compile_let,
+        mal_types.Symbol("do"): compile_do,
+        mal_types.Symbol("if"): compile_if,
+        mal_types.Symbol("fn*"): compile_fn,
+        mal_types.Symbol("quote"): compile_quote,
+        mal_types.Symbol("quasiquoteexpand"): compile_quasiquoteexpand,
+        mal_types.Symbol("quasiquote"): compile_quasiquote,
+        mal_types.Symbol("macroexpand"): compile_macroexpand,
+        mal_types.Symbol("try*"): compile_try,
+    }
+
+    def compile(self, mal_type, scope, tail=False):
+        if isinstance(mal_type, mal_types.Symbol):
+            return self.compile_symbol(mal_type, scope, tail)
+
+        elif isinstance(mal_type, mal_types.Vector):
+            return self.compile_vector(mal_type, scope, tail)
+
+        elif isinstance(mal_type, mal_types.HashMap):
+            return self.compile_hash_map(mal_type, scope, tail)
+
+        elif not isinstance(mal_type, mal_types.List) or len(mal_type) == 0:
+            return self.compile_constant(mal_type, tail)
+
+        mal_type = analyzer.expand_macro(mal_type, scope)
+        if not isinstance(mal_type, mal_types.List):
+            return self.compile(mal_type, scope, tail)
+
+        operation_type = mal_type[0]
+        if type(operation_type) is mal_types.Symbol:
+            special_form = self.special_forms.get(operation_type)
+            if special_form is not None:
+                return special_form(self, mal_type, scope, tail)
+
+        return self.compile_call(mal_type, scope, tail)
@@ -0,0 +1,163 @@
+"""Futures and promises: values computed or delivered by other threads, for overlapping
+waits on I/O. Threads do not speed up CPU bound mal code, see parallel.py for that.
+
+(future body...) evaluates body in a thread of a pool shared by all futures, and
+(promise) creates a value delivered once by (deliver p value), from any thread.
+Dereferencing either waits until the value is available, or at most a timeout with
+(deref x timeout-ms timeout-value). An exception thrown by the body of a future is
+thrown again by every deref of the future.
+
+The pool has MAL_THREADS threads (64 by default) and is started by the first future.
+Futures waiting on other futures each hold a thread, so the pool is larger than the
+number of cores.
+
+Atoms, in mal_types, are safe to update from several threads: swap! applies its
+function to the current value outside of any lock, and retries if another thread
+changed the atom in the meantime.
+"""
+
+import os
+
+from mal_python import mal_types
+from mal_python import sequences
+
+default_thread_count = 64
+
+pool = None  # concurrent.futures.ThreadPoolExecutor, started by submit
+
+
+def submit(function):
+    global pool
+    if pool is None:
+        from concurrent import futures  # Only imported by programs using threads
+
+        pool = futures.ThreadPoolExecutor(
+            int(os.environ.get("MAL_THREADS") or default_thread_count),
+            thread_name_prefix="mal-future",
+        )
+    return pool.submit(function)
+
+
+class Pending:
+    """Base class of futures and promises, wrapping a concurrent.futures.Future"""
+
+    __slots__ = ("future",)
+
+    def get(self, timeout_ms=None, timeout_value=mal_types.nil):
+        """Wait for the value, at most timeout_ms milliseconds if given"""
+        from concurrent import futures
+
+        try:
+            return self.future.result(None if timeout_ms is None else timeout_ms / 1000)
+        except futures.TimeoutError:
+            return timeout_value
+
+    def is_realized(self):
+        return self.future.done()
+
+    def __repr__(self):
+        if not self.future.done():
+            return f"#<{self.kind} pending>"
+        if self.future.exception() is not None:
+            return f"#<{self.kind} failed>"
+        return f"#<{self.kind} {self.future.result()!r}>"
+
+
+class Future(Pending):
+    """Value of a function called in a thread of the pool"""
+
+    __slots__ = ()
+    kind = "future"
+
+    def __init__(self, function):
+        self.future = submit(function)
+
+    def cancel(self):
+        return self.future.cancel()
+
+
+class Promise(Pending):
+    """Value delivered once, by any thread"""
+
+    __slots__ = ()
+    kind = "promise"
+
+    def __init__(self):
+        from concurrent import futures
+
+        self.future = futures.Future()
+
+    def deliver(self, value):
+        """Deliver value, and return the promise, or nil if it was already delivered"""
+        from concurrent import futures
+
+        try:
+            self.future.set_result(value)
+        except futures.InvalidStateError:
+            return mal_types.nil
+        return self
+
+
+def future(*body):
+    """The future macro: (future body...) is (future-call (fn* [] (do body...)))"""
+    return mal_types.List(
+        [
+            mal_types.Symbol("future-call"),
+            mal_types.List(
+                [
+                    mal_types.Symbol("fn*"),
+                    mal_types.Vector(),
+                    mal_types.List([mal_types.Symbol("do"), *body]),
+                ]
+            ),
+        ]
+    )
+
+
+def deref(reference, *timeout):
+    """(deref reference), or (deref reference timeout-ms timeout-value) to wait at most
+    timeout-ms for a future or a promise
+    """
+    if timeout and not isinstance(reference, Pending):
+        raise mal_types.MalException(
+            mal_types.String("deref with a timeout requires a future or a promise")
+        )
+    return reference.get(*timeout)
+
+
+def compare_and_set(atom, expected, mal_value):
+    return (
+        mal_types.true if atom.compare_and_set(expected, mal_value) else mal_types.false
+    )
+
+
+def is_realized(value):
+    """true if the value of a future, promise or lazy sequence is available"""
+    if isinstance(value, Pending):
+        realized = value.is_realized()
+    elif isinstance(value, sequences.LazySeq):
+        realized = value.is_head_realized()
+    else:
+        raise mal_types.MalException(
+            mal_types.String(f"realized? of {type(value).__name__}")
+        )
+    return mal_types.true if realized else mal_types.false
+
+
+namespace = {
+    mal_types.Symbol("future-call"): Future,
+    mal_types.Symbol("future?"): lambda mal_type: (
+        mal_types.true if isinstance(mal_type, Future) else mal_types.false
+    ),
+    mal_types.Symbol("future-done?"): lambda future: (
+        mal_types.true if future.is_realized() else mal_types.false
+    ),
+    mal_types.Symbol("future-cancel"): lambda future: (
+        mal_types.true if future.cancel() else mal_types.false
+    ),
+    mal_types.Symbol("promise"): Promise,
+    mal_types.Symbol("deliver"): lambda promise, value: promise.deliver(value),
+    mal_types.Symbol("realized?"): is_realized,
+    mal_types.Symbol("deref"): deref,
+    mal_types.Symbol("compare-and-set!"): compare_and_set,
+}
@@ -1,10 +1,20 @@
 import copy
+import functools
 import operator
 import time
 
+from mal_python import arrays
+from mal_python import buffers
+from mal_python import concurrency
+from mal_python import eventloop
 from mal_python import mal_types
+from mal_python import memoize
+from mal_python import parallel
 from mal_python import printer
+from mal_python import profiler
 from mal_python import parser
+from mal_python import sequences
+from mal_python import transducers
 
 
 class IndexOutOfBounds(Exception):
@@ -12,7 +22,59 @@ class IndexOutOfBounds(Exception):
 
 
 def true_false(x):
-    return mal_types.TrueType() if x else mal_types.FalseType()
+    return mal_types.true if x else mal_types.false
+
+
+def divide(dividend, divisor):
+    """Integer division truncates towards zero, as in the other mal implementations.
+    Exact for integers of any size.
+    """
+    if type(dividend) is int and type(divisor) is int:
+        quotient = abs(dividend) // abs(divisor)
+        return quotient if (dividend < 0) == (divisor < 0) else -quotient
+    return dividend / divisor
+
+
+def add(*numbers):
+    return sum(numbers)
+
+
+def subtract(first, *numbers):
+    if not numbers:
+        return -first
+    for number in numbers:
+        first -= number
+    return first
+
+
+def multiply(*numbers):
+    return functools.reduce(operator.mul, numbers, 1)
+
+
+def divide_all(first, *numbers):
+    if not numbers:
+        return divide(1, first)
+    for number in numbers:
+        first = divide(first, number)
+    return first
+
+
+def comparison(compare):
+    """Return the binary and variadic forms of a comparison: (< a b c) is true if
+    a < b and b < c
+    """
+
+    def binary(first, second):
+        return mal_types.true if compare(first, second) else mal_types.false
+
+    def variadic(first, *numbers):
+        for number in numbers:
+            if not compare(first, number):
+                return mal_types.false
+            first = number
+        return mal_types.true
+
+    return variadic, binary
 
 
 def prstr(*items):
@@ -34,7 +96,7 @@ def prn(*items):
         [str(printer.print_string(item, print_readably=True)) for item in items]
     )
     print(joined_string)
-    return mal_types.Nil()
+    return mal_types.nil
 
 
 def println(*items):
@@ -42,7 +104,7 @@ def println(*items):
         [str(printer.print_string(item, print_readably=False)) for item in items]
     )
     print(joined_string)
-    return mal_types.Nil()
+    return mal_types.nil
 
 
 def slurp(string):
@@ -60,15 +122,29 @@ def reset(atom, mal_value):
 
 
 def swap(atom, function, *args):
-    atom.set(function(atom.get(), *args))
-    return atom.get()
+    """Apply function to the value of atom, retrying if another thread changed it
+    in the meantime, and return the new value
+    """
+    while True:
+        value = atom.get()
+        new_value = function(value, *args)
+        if atom.compare_and_set(value, new_value):
+            return new_value
 
 
 def concat(*lists):
-    new_list = []
-    for l in lists:
-        new_list.extend(l)
-    return mal_types.List(new_list)
+    """The last list is shared with the result, the others are copied"""
+    if not lists:
+        return mal_types.List()
+
+    *copied_lists, last_list = lists
+    if not isinstance(last_list, mal_types.List):
+        last_list = mal_types.List(last_list)
+
+    new_items = []
+    for l in copied_lists:
+        new_items.extend(l)
+    return last_list.prepend(tuple(new_items))
 
 
 def quasiquote(mal_type, ignore_unquote=False):
@@ -103,7 +179,7 @@ def quasiquote(mal_type, ignore_unquote=False):
         )
 
     if isinstance(mal_type, mal_types.Vector):
-        new_list = mal_types.List(mal_type.list)
+        new_list = mal_types.List(mal_type)
         return mal_types.List(
             [mal_types.Symbol("vec"), quasiquote(new_list, ignore_unquote=True)]
         )
@@ -115,6 +191,14 @@ def quasiquote(mal_type, ignore_unquote=False):
     return mal_type
 
 
+def cons(new_element, original_list):
+    if isinstance(original_list, sequences.LazySeq):
+        return sequences.cons(new_element, original_list)
+    if not isinstance(original_list, mal_types.List):
+        original_list = mal_types.List(original_list)
+    return original_list.cons(new_element)
+
+
 def nth(list_type, index):
     try:
         return list_type[index]
@@ -126,12 +210,17 @@ def first(list_type):
     try:
         return list_type[0]
     except IndexError:
-        return mal_types.Nil()
+        return mal_types.nil
     except TypeError:
-        return mal_types.Nil()
+        return mal_types.nil
 
 
 def rest(list_type):
+    if isinstance(list_type, mal_types.List) or isinstance(
+        list_type, sequences.LazySeq
+    ):
+        return list_type.rest()
+
     try:
         return mal_types.List(list_type[1:])
     except IndexError:
@@ -140,6 +229,37 @@ def rest(list_type):
         return mal_types.List()
 
 
+def mal_not(mal_type):
+    return true_false(mal_type is mal_types.nil or mal_type is mal_types.false)
+
+
+def cond(*clauses):
+    """The cond macro. (cond test1 expr1 test2 expr2 ...) expands to
+    (if test1 expr1 (cond test2 expr2 ...)), and (cond) to nil.
+    """
+    if not clauses:
+        return mal_types.nil
+    if len(clauses) < 2:
+        raise mal_types.MalException(mal_types.String("odd number of forms to cond"))
+    return mal_types.List(
+        [
+            mal_types.Symbol("if"),
+            clauses[0],
+            clauses[1],
+            mal_types.List([mal_types.Symbol("cond"), *clauses[2:]]),
+        ]
+    )
+
+
+def native_macro(name, function):
+    """Return a macro implemented by a Python function"""
+    macro = mal_types.FunctionState(
+        mal_types.nil, mal_types.List(), None, function, mal_types.true
+    )
+    macro.name = name
+    return macro
+
+
 def make_keyword(value):
     if isinstance(value, mal_types.Keyword):
         return value
@@ -152,34 +272,32 @@ def throw(err):
 
 
 def get(hash_map, key):
-    try:
-        return hash_map.list[hash_map.list.index(key) + 1]
-    except AttributeError:  # .list throws (hash_map type doesn't have list member)
-        pass
-    except ValueError:  # .index throws (key not in hash_map)
-        pass
+    if isinstance(hash_map, mal_types.HashMap):
+        return hash_map.get(key, mal_types.nil)
 
-    return mal_types.Nil()
+    return mal_types.nil
 
 
-def assoc(hash_map, *args):
+def assoc(collection, *args):
     """
-    Return a new HashMap, merging new key, value pairs into hash the existing hash_map, taking care to replace new values for exciting keys.
+    Return a new HashMap, merging new key, value pairs into the existing hash_map, replacing the values of existing keys.
+    For a Vector, the keys are indices, and return a new Vector with the values at those indices replaced.
     """
-    new_list = list(args)
-    for key, value in hash_map.items():
-        if key not in new_list[::2]:
-            new_list += [key, value]
-    return mal_types.HashMap(new_list)
+    if isinstance(collection, mal_types.Vector):
+        for index, value in zip(args[::2], args[1::2]):
+            try:
+                collection = collection.assoc_index(index, value)
+            except IndexError:
+                raise IndexOutOfBounds(
+                    f"index {index} out of range for Vector of length {len(collection)}"
+                )
+        return collection
 
+    return collection.assoc(*args)
 
-def dissoc(hash_map, *keys):
-    new_list = []
-    for key, value in hash_map.items():
-        if key not in keys:
-            new_list += [key, value]
 
-    return mal_types.HashMap(new_list)
+def dissoc(hash_map, *keys):
+    return hash_map.dissoc(*keys)
 
 
 def readline(string):
@@ -187,21 +305,24 @@ def readline(string):
 
 
 def with_meta(mal_type, meta_data):
-    copy_of_object = copy.deepcopy(mal_type)
-    copy_of_object.meta = meta_data
+    copy_of_object = copy.copy(mal_type)  # Shares the items, or closure environment
+    try:
+        copy_of_object.meta = meta_data
+    except AttributeError:  # Only collections and functions have metadata
+        raise mal_types.MalException(
+            mal_types.String(f"with-meta: {type(mal_type).__name__} has no metadata")
+        )
     return copy_of_object
 
 
 def meta(mal_type):
     if (
-        isinstance(mal_type, mal_types.List)
-        or isinstance(mal_type, mal_types.Vector)
-        or isinstance(mal_type, mal_types.HashMap)
+        isinstance(mal_type, mal_types.Metadata)
         or isinstance(mal_type, mal_types.FunctionState)
         or isinstance(mal_type, mal_types.NativeFunction)
     ):
         return mal_type.meta
-    return mal_types.Nil()
+    return mal_types.nil
 
 
 def ismacro(mal_type):
@@ -217,42 +338,76 @@ def isfn(mal_type):
     return callable(mal_type)
 
 
+def empty(mal_type):
+    if isinstance(mal_type, sequences.LazySeq):
+        return mal_type.empty()  # Only realizes the first node
+    return len(mal_type) == 0
+
+
+def mal_map(function, *list_types):
+    """Lazy on lazy sequences, eager otherwise: the function is called by map, e.g.
+    inside a try*, as in the other mal implementations. With several sequences, the
+    function is called with an item of each, until the shortest ends. A transducer
+    without a sequence.
+    """
+    if not list_types:
+        return transducers.mapping(function)
+    iterators = [sequences.items(list_type) for list_type in list_types]
+    if any(isinstance(list_type, sequences.LazySeq) for list_type in list_types):
+        return sequences.LazySeq(map(function, *iterators))
+    return mal_types.List([function(*items) for items in zip(*iterators)])
+
+
 def conj(mal_type, *args):
     if isinstance(mal_type, mal_types.List):
-        return mal_types.List(list(args[::-1]) + mal_type.list)
+        return mal_type.prepend(args[::-1])
     elif isinstance(mal_type, mal_types.Vector):
-        return mal_types.Vector(mal_type.list + list(args))
+        for item in args:
+            mal_type = mal_type.conj(item)
+        return mal_type
+    elif isinstance(mal_type, sequences.LazySeq):
+        return sequences.conj(mal_type, *args)
+    elif mal_type is mal_types.nil:  # As an empty list
+        return mal_types.List(args[::-1])
+    raise mal_types.MalException(
+        mal_types.String(f"conj: cannot add items to {type(mal_type).__name__}")
+    )
 
 
 def seq(mal_type):
+    if isinstance(mal_type, sequences.LazySeq):
+        return mal_types.nil if mal_type.empty() else mal_type
+
     if len(mal_type) == 0:
-        return mal_types.Nil()
+        return mal_types.nil
 
     if isinstance(mal_type, mal_types.List):
         return mal_type
 
     if isinstance(mal_type, mal_types.Vector):  # convert Vector to List
-        return mal_types.List(mal_type.list)
+        return mal_types.List(mal_type)
 
     if isinstance(mal_type, mal_types.String):  # convert string to List of characters
         return mal_types.List([mal_types.String(char) for char in mal_type])
 
+    return mal_types.List(mal_type)  # Typed arrays and byte buffers
+
 
 namespace = {
-    mal_types.Symbol("+"): mal_types.NativeFunction(operator.add),
-    mal_types.Symbol("-"): mal_types.NativeFunction(operator.sub),
-    mal_types.Symbol("*"): mal_types.NativeFunction(operator.mul),
-    mal_types.Symbol("/"): mal_types.NativeFunction(operator.truediv),
+    mal_types.Symbol("+"): mal_types.NativeFunction(add, operator.add),
+    mal_types.Symbol("-"): mal_types.NativeFunction(subtract, operator.sub),
+    mal_types.Symbol("*"): mal_types.NativeFunction(multiply, operator.mul),
+    mal_types.Symbol("/"): mal_types.NativeFunction(divide_all, divide),
+    mal_types.Symbol("<"): mal_types.NativeFunction(*comparison(operator.lt)),
+    mal_types.Symbol("<="): mal_types.NativeFunction(*comparison(operator.le)),
+    mal_types.Symbol(">"): mal_types.NativeFunction(*comparison(operator.gt)),
+    mal_types.Symbol(">="): mal_types.NativeFunction(*comparison(operator.ge)),
     mal_types.Symbol("prn"): lambda *x: prn(*x),
     mal_types.Symbol("list"): lambda *x: mal_types.List(x),
     mal_types.Symbol("list?"): lambda *x: true_false(isinstance(x[0], mal_types.List)),
-    mal_types.Symbol("empty?"): lambda *x: true_false(len(x[0]) == 0),
+    mal_types.Symbol("empty?"): lambda *x: true_false(empty(x[0])),
     mal_types.Symbol("count"): lambda *x: len(x[0]),
     mal_types.Symbol("="): lambda *x: true_false(x[0] == x[1]),
-    mal_types.Symbol("<"): lambda *x: true_false(x[0] < x[1]),
-    mal_types.Symbol("<="): lambda *x: true_false(x[0] <= x[1]),
-    mal_types.Symbol(">"): lambda *x: true_false(x[0] > x[1]),
-    mal_types.Symbol(">="): lambda *x: true_false(x[0] >= x[1]),
     mal_types.Symbol("pr-str"): lambda *x: prstr(*x),
     mal_types.Symbol("str"): lambda *x: str_function(*x),
     mal_types.Symbol("prn"): lambda *x: prn(*x),
@@ -261,31 +416,26 @@ namespace = {
     mal_types.Symbol("slurp"): lambda x: slurp(x),
     mal_types.Symbol("atom"): lambda x: mal_types.Atom(x),
     mal_types.Symbol("atom?"): lambda x: true_false(isinstance(x, mal_types.Atom)),
-    mal_types.Symbol("deref"): lambda x: x.get(),
     mal_types.Symbol("reset!"): lambda atom, mal_value: reset(atom, mal_value),
     mal_types.Symbol("swap!"): lambda atom, function, *args: swap(
         atom, function, *args
     ),
-    mal_types.Symbol("cons"): lambda new_element, original_list: mal_types.List(
-        [new_element] + original_list.list
+    mal_types.Symbol("cons"): lambda new_element, original_list: cons(
+        new_element, original_list
     ),
     mal_types.Symbol("concat"): lambda *lists: concat(*lists),
-    mal_types.Symbol("vec"): lambda vector: mal_types.Vector(vector.list),
+    mal_types.Symbol("vec"): lambda vector: mal_types.Vector(vector),
     mal_types.Symbol("nth"): lambda list_type, index: nth(list_type, index),
     mal_types.Symbol("first"): lambda list_type: first(list_type),
     mal_types.Symbol("rest"): lambda list_type: rest(list_type),
     mal_types.Symbol("apply"): lambda function, *args: function(*args[:-1], *args[-1]),
-    mal_types.Symbol("map"): lambda function, list_type: mal_types.List(
-        [function(item) for item in list_type]
-    ),
-    mal_types.Symbol("nil?"): lambda mal_type: true_false(
-        isinstance(mal_type, mal_types.Nil)
-    ),
-    mal_types.Symbol("true?"): lambda mal_type: true_false(
-        isinstance(mal_type, mal_types.TrueType)
+    mal_types.Symbol("map"): lambda function, *list_types: mal_map(
+        function, *list_types
     ),
+    mal_types.Symbol("nil?"): lambda mal_type: true_false(mal_type is mal_types.nil),
+    mal_types.Symbol("true?"): lambda mal_type: true_false(mal_type is mal_types.true),
     mal_types.Symbol("false?"): lambda mal_type: true_false(
-        isinstance(mal_type, mal_types.FalseType)
+        mal_type is mal_types.false
     ),
     mal_types.Symbol("keyword?"): lambda mal_type: true_false(
         isinstance(mal_type, mal_types.Keyword)
@@ -300,19 +450,19 @@ namespace = {
         isinstance(mal_type, mal_types.HashMap)
     ),
     mal_types.Symbol("sequential?"): lambda mal_type: true_false(
-        isinstance(mal_type, mal_types.List) or isinstance(mal_type, mal_types.Vector)
+        isinstance(mal_type, mal_types.List)
+        or isinstance(mal_type, mal_types.Vector)
+        or isinstance(mal_type, sequences.LazySeq)
     ),
     mal_types.Symbol("symbol"): lambda mal_type: mal_types.Symbol(mal_type.string),
     mal_types.Symbol("vector"): lambda *args: mal_types.Vector(args),
     mal_types.Symbol("keyword"): lambda string: make_keyword(string),
     mal_types.Symbol("hash-map"): lambda *args: mal_types.HashMap(args),
-    mal_types.Symbol("assoc"): lambda hash_map, *args: assoc(hash_map, *args),
+    mal_types.Symbol("assoc"): lambda collection, *args: assoc(collection, *args),
     mal_types.Symbol("dissoc"): lambda hash_map, *keys: dissoc(hash_map, *keys),
     mal_types.Symbol("throw"): lambda err: throw(err),
     mal_types.Symbol("get"): lambda hash_map, key: get(hash_map, key),
-    mal_types.Symbol("contains?"): lambda hash_map, key: true_false(
-        key in hash_map.list[::2]
-    ),
+    mal_types.Symbol("contains?"): lambda hash_map, key: true_false(key in hash_map),
     mal_types.Symbol("keys"): lambda hash_map: hash_map.keys(),
     mal_types.Symbol("vals"): lambda hash_map: hash_map.values(),
     mal_types.Symbol("readline"): lambda string: readline(string),
@@ -320,15 +470,31 @@ namespace = {
     mal_types.Symbol("with-meta"): lambda mal_type, meta_data: with_meta(
         mal_type, meta_data
     ),
-    mal_types.Symbol("time-ms"): lambda: time.time() * 1000,
+    mal_types.Symbol("time-ms"): lambda: int(time.time() * 1000),
     mal_types.Symbol("string?"): lambda mal_type: true_false(
         isinstance(mal_type, mal_types.String)
     ),
     mal_types.Symbol("number?"): lambda mal_type: true_false(
-        isinstance(mal_type, mal_types.Int)
+        isinstance(mal_type, mal_types.number_types)
     ),
     mal_types.Symbol("fn?"): lambda mal_type: true_false(isfn(mal_type)),
     mal_types.Symbol("macro?"): lambda mal_type: true_false(ismacro(mal_type)),
     mal_types.Symbol("conj"): lambda mal_type, *args: conj(mal_type, *args),
     mal_types.Symbol("seq"): lambda mal_type: seq(mal_type),
+    mal_types.Symbol("not"): lambda mal_type: mal_not(mal_type),
+    mal_types.Symbol("cond"): native_macro("cond", cond),
+    mal_types.Symbol("lazy-seq"): native_macro("lazy-seq", sequences.lazy_seq),
+    mal_types.Symbol("pvalues"): native_macro("pvalues", parallel.pvalues),
+    mal_types.Symbol("future"): native_macro("future", concurrency.future),
+    mal_types.Symbol("profile"): native_macro("profile", profiler.profile),
+    mal_types.Symbol("*host-language*"): mal_types.String("python3"),
 }
+namespace.update(arrays.namespace)
+namespace.update(buffers.namespace)
+namespace.update(sequences.namespace)
+namespace.update(transducers.namespace)
+namespace.update(parallel.namespace)
+namespace.update(concurrency.namespace)
+namespace.update(eventloop.namespace)
+namespace.update(memoize.namespace)
+namespace.update(profiler.namespace)
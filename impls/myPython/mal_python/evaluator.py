@@ -3,6 +3,7 @@ import copy
 from mal_python import core
 from mal_python import env
 from mal_python import mal_types
+from mal_python import profiler
 
 
 def is_macro_call(mal_type, environment):
@@ -12,12 +13,12 @@ def is_macro_call(mal_type, environment):
             try:
                 function = environment.get(function_name)
             except env.MissingKeyInEnvironment:
-                return mal_types.FalseType()
+                return mal_types.false
 
             if isinstance(function, mal_types.FunctionState) and function.is_macro:
-                return mal_types.TrueType()
+                return mal_types.true
 
-    return mal_types.FalseType()
+    return mal_types.false
 
 
 def eval_ast(mal_type, environment):
@@ -41,13 +42,9 @@ def eval_ast(mal_type, environment):
         )
 
     elif isinstance(mal_type, mal_types.HashMap):
-        eval_only_values = (
-            lambda index, item: item
-            if index % 2 == 0
-            else Evaluator(item, environment).EVAL()
-        )
-        return mal_types.HashMap(
-            [eval_only_values(index, item) for index, item in enumerate(mal_type)]
+        return mal_types.HashMap.from_pairs(
+            (key, Evaluator(value, environment).EVAL())
+            for key, value in mal_type.items()
         )
 
     return mal_type
@@ -57,11 +54,19 @@ def expand_macro(mal_type, environment):
     while is_macro_call(mal_type, environment):
         function = environment.get(mal_type[0])
         args = mal_type[1:]
-        mal_type = function(*args)
+        recorder = profiler.current()
+        if recorder is not None:
+            mal_type = recorder.expand_macro(function, args)
+        else:
+            mal_type = function(*args)
 
     return mal_type
 
 
+def evaluate(mal_type, environment):
+    return Evaluator(mal_type, environment).EVAL()
+
+
 class Evaluator:
     """Evaluate a mal expression.
     Intended use:
@@ -73,6 +78,8 @@ class Evaluator:
     Tail Call Optimization (TCO) to reduce the recursion depth.
     """
 
+    profiled = False  # Evaluating the body of a function call recorded by the profiler
+
     def __init__(self, mal_type, environment):
         self.mal_type = mal_type
         self.environment = environment
@@ -104,6 +111,11 @@ class Evaluator:
         key = self.mal_type[1]
         unevaluated_value = self.mal_type[2]
         evaluated_value = Evaluator(unevaluated_value, self.environment).EVAL()
+        if (
+            isinstance(evaluated_value, mal_types.FunctionState)
+            and evaluated_value.name is None
+        ):
+            evaluated_value.name = str(key)
         self.environment.set(key, evaluated_value)
         return evaluated_value
 
@@ -111,8 +123,10 @@ class Evaluator:
         key = self.mal_type[1]
         unevaluated_value = self.mal_type[2]
         function = Evaluator(unevaluated_value, self.environment).EVAL()
-        function = copy.deepcopy(function)  # do not mutate original function
-        function.is_macro = mal_types.TrueType()
+        if function.name is None:
+            function.name = str(key)
+        function = copy.copy(function)  # do not mutate original function
+        function.is_macro = mal_types.true
         self.environment.set(key, function)
         return function
 
@@ -140,14 +154,12 @@ class Evaluator:
         """
         unevaluated_condition = self.mal_type[1]
         condition = Evaluator(unevaluated_condition, self.environment).EVAL()
-        if isinstance(condition, mal_types.Nil) or isinstance(
-            condition, mal_types.FalseType
-        ):
+        if condition is mal_types.nil or condition is mal_types.false:
             try:
                 false_statement = self.mal_type[3]
                 self.mal_type = false_statement
             except IndexError:  # No false expression provided
-                return mal_types.Nil()
+                return mal_types.nil
         else:
             true_statement = self.mal_type[2]
             self.mal_type = true_statement
@@ -158,12 +170,18 @@ class Evaluator:
             exprs = mal_types.List([*args])
             new_environment = env.Env(self.environment, binds, exprs)
             function_body = self.mal_type[2]
-            return Evaluator(function_body, new_environment).EVAL()
+            evaluator = Evaluator(function_body, new_environment)
+            recorder = profiler.current()
+            if recorder is not None:
+                evaluator.profiled = True
+                return recorder.call(function, evaluator.EVAL)
+            return evaluator.EVAL()
 
         params = self.mal_type[1]
         body = self.mal_type[2]
         fn = closure
-        return mal_types.FunctionState(body, params, self.environment, fn)
+        function = mal_types.FunctionState(body, params, self.environment, fn)
+        return function
 
     def process_quasiquote(self):
         quasiquote_returned = core.quasiquote(self.mal_type[1])
@@ -178,13 +196,52 @@ class Evaluator:
         operands = evaluated_list[1:]
 
         if isinstance(function, mal_types.FunctionState):
-            self.mal_type = function.mal_type
-            self.environment = env.Env(
+            new_environment = env.Env(
                 outer=function.env, binds=function.params, exprs=operands
             )
+            recorder = profiler.current()
+            if recorder is not None:
+                if not self.profiled:
+                    evaluator = Evaluator(function.mal_type, new_environment)
+                    evaluator.profiled = True
+                    return recorder.call(function, evaluator.EVAL)
+                recorder.tail_call(function)
+
+            self.mal_type = function.mal_type
+            self.environment = new_environment
+        elif type(function) is mal_types.NativeFunction and len(operands) == 2:
+            return function.binary(operands[0], operands[1])
         else:
             return function(*operands)
 
+    def process_quote(self):
+        return self.mal_type[1]
+
+    def process_quasiquoteexpand(self):
+        """Supposed to be used for debugging - in practice used to pass the tests"""
+        return core.quasiquote(self.mal_type[1])
+
+    def process_macroexpand(self):
+        macro = self.mal_type[1]
+        return expand_macro(macro, self.environment)
+
+    # Special form handlers return None in order to continue evaluation in the while
+    # loop, or something other than None to finalize the evaluation.
+    # Symbols are interned, so looking them up compares by identity.
+    special_forms = {
+        mal_types.Symbol("try*"): process_try,
+        mal_types.Symbol("def!"): process_def,
+        mal_types.Symbol("defmacro!"): process_defmacro,
+        mal_types.Symbol("let*"): process_let,
+        mal_types.Symbol("do"): process_do,
+        mal_types.Symbol("if"): process_if,
+        mal_types.Symbol("fn*"): process_fn,
+        mal_types.Symbol("quote"): process_quote,
+        mal_types.Symbol("quasiquoteexpand"): process_quasiquoteexpand,
+        mal_types.Symbol("quasiquote"): process_quasiquote,
+        mal_types.Symbol("macroexpand"): process_macroexpand,
+    }
+
     def EVAL(self):
         while True:
             if not isinstance(self.mal_type, mal_types.List):
@@ -199,49 +256,18 @@ class Evaluator:
 
                 operation_type = self.mal_type[0]
 
-                if operation_type == "try*":
-                    return self.process_try()
-
-                if operation_type == "def!":
-                    return self.process_def()
-
-                if operation_type == "defmacro!":
-                    return self.process_defmacro()
-
-                elif operation_type == "let*":
-                    self.process_let()
-
-                elif operation_type == "do":
-                    self.process_do()
-
-                elif operation_type == "if":
-                    return_value = self.process_if()
-                    if return_value is not None:
-                        return return_value
-                    # otherwise, continue while loop
-
-                elif operation_type == "fn*":
-                    return self.process_fn()
-
-                elif operation_type == "quote":
-                    return self.mal_type[1]
-
-                # Supposed to be used for debugging - in practice used to pass the tests
-                elif operation_type == "quasiquoteexpand":
-                    return core.quasiquote(self.mal_type[1])
-
-                elif operation_type == "quasiquote":
-                    self.process_quasiquote()
-
-                elif operation_type == "macroexpand":
-                    macro = self.mal_type[1]
-                    return expand_macro(macro, self.environment)
-
-                else:  # "regular" list
-                    return_value = self.process_regular_list()
-                    if return_value is not None:
-                        return return_value
-                    # otherwise, continue while loop
+                process = (
+                    self.special_forms.get(operation_type)
+                    if type(operation_type) is mal_types.Symbol
+                    else None
+                )
+                if process is None:  # "regular" list
+                    process = Evaluator.process_regular_list
+
+                return_value = process(self)
+                if return_value is not None:
+                    return return_value
+                # otherwise, continue while loop
 
             else:  # mal_type is empty List
                 return self.mal_type
@@ -0,0 +1,175 @@
+"""Non-blocking I/O: builtins that start reading or writing a file, running a
+subprocess or waiting, and return at once a task, whose value deref (or await) waits
+for. Scripts start all the I/O they need, then wait for the results, so the waits
+overlap instead of running one after another.
+
+The I/O runs in an asyncio event loop, in a thread of its own, started by the first
+task. stepA_mal.main owns the loop: before exiting, it waits for the tasks still
+running, at most stop_timeout seconds (or until Ctrl-C), cancels those left, and stops
+the loop. File reads and writes are run by the default executor of the
+loop, as asyncio has no asynchronous file I/O. Mal code itself only runs in the thread
+that evaluates it.
+"""
+
+import threading
+import time
+
+from mal_python import concurrency
+from mal_python import mal_types
+
+loop = None  # asyncio event loop, started by start
+thread = None  # Thread running the loop
+stop_timeout = 5  # Seconds stop waits for the running tasks before cancelling them
+
+
+class Task(concurrency.Pending):
+    """Result of a coroutine run by the event loop"""
+
+    __slots__ = ()
+    kind = "task"
+
+    def __init__(self, coroutine):
+        import asyncio
+
+        self.future = asyncio.run_coroutine_threadsafe(coroutine, start())
+
+
+def start():
+    """Start the event loop, if not started yet, and return it"""
+    global loop, thread
+    if loop is None:
+        import asyncio  # Only imported by programs doing asynchronous I/O
+
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(
+            target=loop.run_forever, name="mal-event-loop", daemon=True
+        )
+        thread.start()
+    return loop
+
+
+async def finish_tasks(timeout):
+    """Wait for the running tasks, at most timeout seconds, then cancel the others"""
+    import asyncio
+
+    current = asyncio.current_task()
+    tasks = [task for task in asyncio.all_tasks() if task is not current]
+    if not tasks:
+        return
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+def stop():
+    """Wait for the running tasks, at most stop_timeout seconds, cancel the others,
+    then stop the event loop
+    """
+    global loop, thread
+    if loop is None:
+        return
+    import asyncio
+
+    try:
+        asyncio.run_coroutine_threadsafe(finish_tasks(stop_timeout), loop).result()
+    except KeyboardInterrupt:  # Ctrl-C while waiting: cancel the tasks at once
+        asyncio.run_coroutine_threadsafe(finish_tasks(0), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+    loop = thread = None
+
+
+def read_file(name):
+    try:
+        with open(name, "r") as file:
+            return mal_types.String(file.read())
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Could not open file {name}")
+
+
+def write_file(name, string):
+    with open(name, "w") as file:
+        file.write(string)
+    return mal_types.nil
+
+
+async def in_executor(function, *args):
+    return await loop.run_in_executor(None, function, *args)
+
+
+def slurp_async(name):
+    """(slurp-async name): a task reading a file, like slurp"""
+    return Task(in_executor(read_file, str(name)))
+
+
+def spit_async(name, string):
+    """(spit-async name string): a task writing string to a file, returning nil"""
+    return Task(in_executor(write_file, str(name), str(string)))
+
+
+async def run_process(program, args):
+    import asyncio
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            program,
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError as error:
+        raise mal_types.MalException(
+            mal_types.String(f"sh-async: cannot run {program}: {error.strerror}")
+        )
+    try:
+        out, err = await process.communicate()
+    except asyncio.CancelledError:  # Do not leave the process running
+        process.kill()
+        await process.wait()
+        raise
+    return mal_types.HashMap(
+        [
+            mal_types.Keyword(":exit"),
+            process.returncode,
+            mal_types.Keyword(":out"),
+            mal_types.String(out.decode(errors="replace")),
+            mal_types.Keyword(":err"),
+            mal_types.String(err.decode(errors="replace")),
+        ]
+    )
+
+
+def sh_async(program, *args):
+    """(sh-async program args...): a task running a program, returning a hash-map of
+    its :exit status, and its standard :out and :err output
+    """
+    return Task(run_process(str(program), [str(arg) for arg in args]))
+
+
+async def wait(seconds):
+    import asyncio
+
+    await asyncio.sleep(seconds)
+    return mal_types.nil
+
+
+def sleep(milliseconds):
+    time.sleep(milliseconds / 1000)
+    return mal_types.nil
+
+
+namespace = {
+    mal_types.Symbol("slurp-async"): slurp_async,
+    mal_types.Symbol("spit-async"): spit_async,
+    mal_types.Symbol("sh-async"): sh_async,
+    mal_types.Symbol("sleep-async"): lambda milliseconds: Task(
+        wait(milliseconds / 1000)
+    ),
+    mal_types.Symbol("sleep"): sleep,
+    mal_types.Symbol("task?"): lambda mal_type: (
+        mal_types.true if isinstance(mal_type, Task) else mal_types.false
+    ),
+    mal_types.Symbol("await"): concurrency.deref,
+}
@@ -0,0 +1,127 @@
+"""On-disk cache of the forms read from source files by load-file.
+Intended use:
+```
+for mal_type in read_forms(path):
+    ...
+```
+
+The forms of each file are pickled into the cache directory (~/.mal/cache, or the
+MAL_CACHE_DIR environment variable, an empty value disables the cache), under a name
+derived from the absolute path of the file. An entry is used without reading the source
+when the modification time and size of the file are unchanged, or after reading it when
+the SHA-256 hash of its content is unchanged. Otherwise the file is read and evaluated
+form by form, and the entry is written once all forms have been read.
+
+Forms are cached as read, before macro expansion: the expansion depends on the macros
+defined when the file is loaded.
+"""
+
+import contextlib
+import hashlib
+import os
+import pickle
+
+from mal_python import parser
+
+cache_format = 2  # Change when the reader or the pickled mal types change
+default_cache_directory = os.path.join(os.path.expanduser("~"), ".mal", "cache")
+
+
+def cache_directory():
+    """Return the cache directory, or None if the cache is disabled"""
+    return os.environ.get("MAL_CACHE_DIR", default_cache_directory) or None
+
+
+def cache_path(directory, path):
+    return os.path.join(
+        directory, hashlib.sha256(path.encode()).hexdigest()[:32] + ".pickle"
+    )
+
+
+def read_entry(entry_path, path):
+    """Return (mtime_ns, size, digest, forms) of a cache entry, or None"""
+    try:
+        with open(entry_path, "rb") as file:
+            format_, entry_source, *entry = pickle.load(file)
+    except Exception:  # Missing, unreadable or corrupt entry
+        return None
+
+    if format_ != cache_format or entry_source != path:
+        return None
+    return entry
+
+
+def write_entry(entry_path, path, stat, digest, forms):
+    """Write a cache entry atomically, ignoring errors - the cache is optional"""
+    import tempfile  # Only needed, and imported, when the cache is updated
+
+    directory = os.path.dirname(entry_path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        file = tempfile.NamedTemporaryFile("wb", dir=directory, delete=False)
+    except OSError:
+        return
+
+    try:
+        with file:
+            pickle.dump(
+                (cache_format, path, stat.st_mtime_ns, stat.st_size, digest, forms),
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(file.name, entry_path)
+    except (OSError, pickle.PicklingError, RecursionError):
+        with contextlib.suppress(OSError):
+            os.remove(file.name)
+
+
+def hashed_lines(source, digest):
+    for line in source:
+        digest.update(line.encode())
+        yield line
+
+
+def read_and_cache(source, name, entry_path, path, stat):
+    """Yield the forms of source as they are read, and cache them once all are read"""
+    digest = hashlib.sha256()
+    forms = []
+    with source:
+        for mal_type in parser.read_forms(hashed_lines(source, digest), name):
+            forms.append(mal_type)
+            yield mal_type
+
+    write_entry(entry_path, path, stat, digest.hexdigest(), forms)
+
+
+def read_and_close(source, name):
+    """Yield the forms of source as they are read, closing it once all are read"""
+    with source:
+        yield from parser.read_forms(source, name)
+
+
+def read_forms(file_name):
+    """Return an iterator over the top level forms of a source file.
+    Raises FileNotFoundError if the file does not exist.
+    """
+    directory = cache_directory()
+    if directory is None:
+        # Opened here, so a missing file raises before the first form is read
+        return read_and_close(open(file_name, "r"), file_name)
+
+    path = os.path.abspath(file_name)
+    stat = os.stat(path)
+    entry_path = cache_path(directory, path)
+    entry = read_entry(entry_path, path)
+
+    if entry is not None:
+        mtime_ns, size, digest, forms = entry
+        if (mtime_ns, size) == (stat.st_mtime_ns, stat.st_size):
+            return iter(forms)
+
+        with open(path, "r") as file:
+            content = file.read().encode()
+        if hashlib.sha256(content).hexdigest() == digest:  # Only the mtime changed
+            write_entry(entry_path, path, stat, digest, forms)
+            return iter(forms)
+
+    return read_and_cache(open(path, "r"), file_name, entry_path, path, stat)
@@ -1,3 +1,8 @@
+import threading
+import weakref
+
+from mal_python import persistent
+
 closing_paren_style = {"(": ")", "[": "]", "{": "}"}
 
 
@@ -19,58 +24,119 @@ class UnrecognizedSymbol(Exception):
 
 
 class Atom:
+    """Mutable reference, safe to update from several threads: compare_and_set is
+    atomic, and swap! retries it until its update is applied to the current value
+    """
+
+    __slots__ = ("mal_value", "lock")
+
     def __init__(self, mal_value):
         self.mal_value = mal_value
+        self.lock = threading.Lock()
 
     def __repr__(self):
         return f"(atom {self.get()})"
 
+    def __reduce__(self):
+        return (Atom, (self.mal_value,))
+
     def get(self):
         return self.mal_value
 
     def set(self, mal_value):
-        self.mal_value = mal_value
+        with self.lock:  # Not in the middle of a compare_and_set
+            self.mal_value = mal_value
+
+    def compare_and_set(self, expected, mal_value):
+        """Set the value to mal_value if it is expected: the same object, or an equal
+        number, as numbers are not interned. Return whether it was set
+        """
+        with self.lock:
+            current = self.mal_value
+            if current is not expected and not (
+                type(current) in number_types
+                and type(expected) in number_types
+                and current == expected
+            ):
+                return False
+            self.mal_value = mal_value
+            return True
+
+
+class Singleton:
+    """Base class for types that have a single, immutable instance: calling the class
+    returns the instance, e.g. Nil() is nil, so values can be compared with is.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls):
+        instance = cls.__dict__.get("instance")
+        if instance is None:
+            instance = super().__new__(cls)
+            cls.instance = instance
+        return instance
+
+    def __eq__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return hash(type(self))
+
+    def __copy__(self):
+        return self
 
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (type(self), ())
+
+
+class Nil(Singleton):
+    __slots__ = ()
 
-class Nil:
     def __repr__(self):
         return "nil"
 
     def __len__(self):
         return 0
 
-    def __eq__(self, other):
-        return isinstance(other, Nil)
+    def __hash__(self):
+        return hash(None)
 
 
-class TrueType:
+class TrueType(Singleton):
+    __slots__ = ()
+
     def __repr__(self):
         return "true"
 
-    def __eq__(self, other):
-        return isinstance(other, TrueType)
-
     def __bool__(self):
         return True
 
 
-class FalseType:
+class FalseType(Singleton):
+    __slots__ = ()
+
     def __repr__(self):
         return "false"
 
-    def __eq__(self, other):
-        return isinstance(other, FalseType)
-
     def __bool__(self):
         return False
 
 
-class Int(int):
-    def __new__(cls, value):
-        return int.__new__(cls, value)
+nil = Nil()
+true = TrueType()
+false = FalseType()
+
+
+number_types = (int, float)  # Numbers are plain Python ints and floats
 
 
 class String:
+    __slots__ = ("string",)
+
     def __init__(self, *args):
         self.string = str(*args)
 
@@ -81,6 +147,9 @@ class String:
             return self.string == other
         return False
 
+    def __hash__(self):
+        return hash(self.string)
+
     def __iter__(self):
         for item in self.string:
             yield item
@@ -92,154 +161,252 @@ class String:
         return self.string
 
 
-class Symbol:
-    def __init__(self, string=""):
-        self.string = string
-
-    def __eq__(self, other):
-        if isinstance(other, Symbol) or isinstance(other, str):
-            return self.string == other
-        return False
+class Interned:
+    """Base class for types that have a single instance per name.
+    Instances with the same name are the same object, so they compare by identity, and
+    their hash is computed once.
+    """
+
+    __slots__ = ("string", "hash", "__weakref__")  # Weak references for interned
+    lock = threading.Lock()  # Held while creating instances
+
+    def __new__(cls, string=""):
+        instance = cls.interned.get(string)
+        if instance is None:
+            with Interned.lock:
+                # Another thread may have created it since the first lookup
+                instance = cls.interned.get(string)
+                if instance is None:
+                    instance = super().__new__(cls)
+                    instance.string = string
+                    instance.hash = hash(string)
+                    cls.interned[string] = instance
+        return instance
 
     def __hash__(self):
-        return hash(self.string)
+        return self.hash
 
     def __repr__(self):
         return self.string
 
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (type(self), (self.string,))
 
-class ListVariant:
-    def __init__(self, *args):
-        self.list = list(*args)
-        self.meta = Nil()
 
-    def append(self, item):
-        self.list.append(item)
+class Symbol(Interned):
+    __slots__ = ()
+    interned = weakref.WeakValueDictionary()
 
     def __eq__(self, other):
-        return self.list == other
+        if self is other:
+            return True
+        if isinstance(other, str):
+            return self.string == other
+        return False
 
-    def __iter__(self):
-        for item in self.list:
-            yield item
+    __hash__ = Interned.__hash__
 
-    def __len__(self):
-        return len(self.list)
 
-    def __repr__(self):
-        return " ".join([repr(x) for x in self.list])
+class Metadata:
+    """Base class of the collections, which can carry metadata.
+    Subclasses have a metadata slot, only set by with-meta: the persistent collections
+    create most instances without calling __init__.
+    """
 
+    __slots__ = ()
 
-class Keyword:
-    def __init__(self, string):
-        self.string = string
+    @property
+    def meta(self):
+        try:
+            return self.metadata
+        except AttributeError:
+            return nil
 
-    def __eq__(self, other):
-        return isinstance(other, Keyword) and self.string == other.string
+    @meta.setter
+    def meta(self, value):
+        self.metadata = value
 
-    def __hash__(self):
-        return hash(self.string)
 
-    def __repr__(self):
-        return self.string
+class CachedHash:
+    """Base class of the immutable collections, which compute their hash once, with
+    structural_hash, and keep it in a hash slot of the subclass.
+    Subclasses defining __eq__ set __hash__ = CachedHash.__hash__.
+    """
 
+    __slots__ = ()
 
-class List(ListVariant):
-    open_paren = "("
-    close_paren = ")"
+    def __hash__(self):
+        try:
+            return self.hash
+        except AttributeError:
+            self.hash = self.structural_hash()
+            return self.hash
+
+    def hashes_differ(self, other):
+        """True if both hashes are already computed and differ, so self != other"""
+        try:
+            return self.hash != other.hash
+        except AttributeError:
+            return False
+
+    def __getstate__(self):
+        # The state of the slots without the hash: hashes of strings differ between
+        # processes, so a pickled hash would be wrong in a pmap worker
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get("__slots__", ()):
+                if name != "hash" and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return None, state
+
+
+class ListVariant(CachedHash, Metadata):
+    """Base class of the sequential types, List and Vector. Lists and vectors with
+    equal items are equal, and have the same hash.
+    """
+
+    __slots__ = ()
 
-    def __init__(self, *args):
-        super().__init__(*args)
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if (
+            not isinstance(other, ListVariant)
+            or len(self) != len(other)
+            or self.hashes_differ(other)
+        ):
+            return False
+        return all(
+            item is other_item or item == other_item
+            for item, other_item in zip(self, other)
+        )
 
-    def __getitem__(self, indices):
-        if isinstance(indices, slice):
-            return List([item for item in self.list[indices]])
-        return self.list[indices]
+    __hash__ = CachedHash.__hash__
 
-    def __hash__(self):
-        return hash(tuple(self.list))
+    def structural_hash(self):
+        return hash(tuple(self))
 
     def __repr__(self):
-        return self.open_paren + super().__repr__() + self.close_paren
+        return self.open_paren + " ".join([repr(x) for x in self]) + self.close_paren
 
-    def index(self, index):
-        return self.list.index(index)
+    def index(self, value):
+        for index, item in enumerate(self):
+            if item == value:
+                return index
+        raise ValueError(f"{value} not found")
 
 
-class Vector(ListVariant):
-    open_paren = "["
-    close_paren = "]"
+class Keyword(Interned):
+    __slots__ = ()
+    interned = weakref.WeakValueDictionary()
 
-    def __init__(self, *args):
-        super().__init__(*args)
+    def __eq__(self, other):
+        return self is other
 
-    def __getitem__(self, indices):
-        if isinstance(indices, slice):
-            return Vector([item for item in self.list[indices]])
-        return self.list[indices]
+    __hash__ = Interned.__hash__
 
-    def __hash__(self):
-        return hash(tuple(self.list))
 
-    def __repr__(self):
-        return self.open_paren + super().__repr__() + self.close_paren
+class List(ListVariant, persistent.PersistentList):
+    """Persistent list, created from an iterable of items"""
 
-    def index(self, index):
-        return self.list.index(index)
+    __slots__ = ("metadata", "hash")
+    open_paren = "("
+    close_paren = ")"
 
+    def __copy__(self):
+        # Share the chunks, PersistentList.__reduce__ copies the items into a new one
+        new_list = self.create(self.items, self.offset, self.more)
+        new_list.meta = self.meta
+        return new_list
 
-class HashMap(ListVariant):
-    open_paren = "{"
-    close_paren = "}"
 
-    def __init__(self, *args):
-        super().__init__(*args)
+class Vector(ListVariant, persistent.PersistentVector):
+    """Persistent vector, created from an iterable of items"""
 
-    def __getitem__(self, indices):
-        if isinstance(indices, slice):
-            return HashMap([item for item in self.list[indices]])
-        return self.list[indices]
+    __slots__ = ("metadata", "hash")
+    open_paren = "["
+    close_paren = "]"
 
-    def __eq__(self, other):
-        return (
-            isinstance(other, HashMap)
-            and set(self.keys()) == set(other.keys())
-            and set(self.values()) == set(other.values())
-        )
 
-    def __hash__(self):
-        return hash(tuple(self.list))
+class HashMap(CachedHash, Metadata, persistent.PersistentHashMap):
+    """Map from mal values to mal values.
+    Created from alternating keys and values, e.g. HashMap([key1, value1, key2, value2])
+    """
 
-    def __repr__(self):
-        return self.open_paren + super().__repr__() + self.close_paren
+    __slots__ = ("metadata", "hash")
+    open_paren = "{"
+    close_paren = "}"
 
-    def items(self):
-        return List(zip(self.keys(), self.values()))
+    def __eq__(self, other):
+        if isinstance(other, HashMap) and self.hashes_differ(other):
+            return False
+        return persistent.PersistentHashMap.__eq__(self, other)
+
+    __hash__ = CachedHash.__hash__
+    structural_hash = persistent.PersistentHashMap.__hash__
+
+    def __copy__(self):
+        # Share the trie, __reduce__ rebuilds it
+        new_map = self.create(self.count, self.pairs, self.root)
+        new_map.meta = self.meta
+        return new_map
+
+    def __reduce__(self):
+        # Rebuild the trie from the items, as it is laid out by the hashes of the keys
+        # and hashes of strings differ between processes (e.g. in pmap workers)
+        reduced = type(self).from_pairs, (tuple(self.items()),)
+        if hasattr(self, "metadata"):
+            return reduced + ((None, {"metadata": self.metadata}),)
+        return reduced
+
+    def __repr__(self):
+        return (
+            self.open_paren
+            + " ".join(f"{key!r} {value!r}" for key, value in self.items())
+            + self.close_paren
+        )
 
     def keys(self):
-        return List(self.list[::2])
+        return List(key for key, _ in self.items())
 
     def values(self):
-        return List(self.list[1::2])
+        return List(value for _, value in self.items())
 
 
 class FunctionState:
-    def __init__(self, mal_type, params, env, fn, is_macro=FalseType()):
+    __slots__ = ("mal_type", "params", "env", "fn", "is_macro", "meta", "code", "name")
+
+    def __init__(self, mal_type, params, env, fn, is_macro=false):
         self.mal_type = mal_type
         self.params = params
         self.env = env
         self.fn = fn
         self.is_macro = is_macro
-        self.meta = Nil()
+        self.meta = nil
+        self.code = None  # Compiled code, used by engines other than the tree walker
+        self.name = None  # Name given by the first def! of the function
 
     def __call__(self, *args):
         return self.fn(*args)
 
 
 class NativeFunction:
-    def __init__(self, function):
+    """Numeric core function. The engines call binary directly on calls with two
+    arguments, skipping the variadic function.
+    """
+
+    __slots__ = ("function", "binary", "meta")
+
+    def __init__(self, function, binary):
         self.function = function
-        self.meta = Nil()
+        self.binary = binary
+        self.meta = nil
 
     def __call__(self, *args):
-        return Int(self.function(*args))
+        return self.function(*args)
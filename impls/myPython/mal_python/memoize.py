@@ -0,0 +1,178 @@
+"""Native memoize: a function caching the results of another one, by arguments.
+
+(memoize f) caches every result, (memoize f :max-size n) keeps the n most recently
+used results, and (memoize f :ttl ms) results computed at most ms milliseconds ago.
+The arguments are keyed by their types and by their structural hash and equality, as
+for hash-map keys: (f 1) and (f 1.0), or (f [1]) and (f (list 1)), are cached
+separately, as f may tell them apart (e.g. str does). Items inside collections are
+compared with =. Calls with arguments that cannot be hashed are not cached.
+
+A recursive function memoized under its own name, (def! fib (memoize fib)), caches
+its recursive calls too, as they look up the new definition. The cache and the counts
+are only locked while they are read or updated, never during a call, so recursive
+calls and calls from several threads do not wait for each other (threads missing the
+same arguments at the same time may both call the function). (memoize-stats f)
+returns the :hits, :misses, :evictions and :size of the cache.
+"""
+
+import collections
+import threading
+import time
+
+from mal_python import mal_types
+
+missing = object()
+
+
+class Memoized:
+    """Callable caching the results of function, keyed by (arguments, their types).
+    With a max_size, the cache is kept in least recently used first order, and with a
+    ttl (seconds), each entry is a (result, expiry time) pair, stored in expiry order
+    unless hits reorder them.
+    """
+
+    __slots__ = (
+        "function",
+        "max_size",
+        "ttl",
+        "cache",
+        "lock",
+        "hits",
+        "misses",
+        "evictions",
+    )
+
+    def __init__(self, function, max_size=None, ttl=None):
+        self.function = function
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache = (
+            collections.OrderedDict() if max_size is not None or ttl is not None else {}
+        )
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __reduce__(self):
+        # Sent to pmap workers with an empty cache
+        return (Memoized, (self.function, self.max_size, self.ttl))
+
+    def __call__(self, *args):
+        key = args, tuple(map(type, args))  # 1 == 1.0, but (str 1) is not (str 1.0)
+        try:
+            hash(key)
+        except TypeError:  # Unhashable arguments
+            with self.lock:
+                self.misses += 1
+            return self.function(*args)
+        with self.lock:
+            result = self.lookup(key)
+        if result is not missing:
+            return result
+        result = self.function(*args)
+        with self.lock:
+            self.store(key, result)
+        return result
+
+    def lookup(self, key):
+        """Return the cached result for key, or missing. Called with the lock held."""
+        entry = self.cache.get(key, missing)
+        if entry is not missing and self.ttl is not None:
+            result, expiry = entry
+            if time.monotonic() >= expiry:
+                del self.cache[key]
+                self.evictions += 1
+                entry = missing
+            else:
+                entry = result
+        if entry is missing:
+            self.misses += 1
+            return missing
+        self.hits += 1
+        if self.max_size is not None:
+            self.cache.move_to_end(key)
+        return entry
+
+    def store(self, key, result):
+        """Cache result, evicting the expired results and the least recently used ones
+        beyond max_size. Called with the lock held.
+        """
+        cache = self.cache
+        if self.ttl is None:
+            cache[key] = result
+        else:
+            now = time.monotonic()
+            self.purge(now)
+            cache[key] = (result, now + self.ttl)
+            cache.move_to_end(key)  # If another thread stored it since the lookup
+        if self.max_size is not None:
+            cache.move_to_end(key)
+            while len(cache) > self.max_size:
+                cache.popitem(last=False)
+                self.evictions += 1
+
+    def purge(self, now):
+        """Evict the expired results at the front of the cache, so results that are
+        never looked up again do not stay cached. Called with the lock held.
+        """
+        cache = self.cache
+        while cache:
+            key = next(iter(cache))
+            if now < cache[key][1]:
+                break
+            del cache[key]
+            self.evictions += 1
+
+    def stats(self):
+        return mal_types.HashMap(
+            [
+                mal_types.Keyword(":hits"),
+                self.hits,
+                mal_types.Keyword(":misses"),
+                self.misses,
+                mal_types.Keyword(":evictions"),
+                self.evictions,
+                mal_types.Keyword(":size"),
+                len(self.cache),
+            ]
+        )
+
+
+def memoize(function, *options):
+    """(memoize f), (memoize f :max-size n :ttl ms): a memoized version of f"""
+    if len(options) % 2:
+        raise mal_types.MalException(
+            mal_types.String("memoize: options are :max-size and :ttl, with values")
+        )
+    max_size = ttl = None
+    for name, value in zip(options[::2], options[1::2]):
+        if name == mal_types.Keyword(":max-size"):
+            if type(value) is not int or value < 1:
+                raise mal_types.MalException(
+                    mal_types.String(f"memoize: :max-size {value!r} is not positive")
+                )
+            max_size = value
+        elif name == mal_types.Keyword(":ttl"):
+            if not isinstance(value, mal_types.number_types) or value <= 0:
+                raise mal_types.MalException(
+                    mal_types.String(f"memoize: :ttl {value!r} is not positive")
+                )
+            ttl = value / 1000
+        else:
+            raise mal_types.MalException(
+                mal_types.String(f"memoize: unknown option {name!r}")
+            )
+    return Memoized(function, max_size, ttl)
+
+
+def stats(memoized):
+    if not isinstance(memoized, Memoized):
+        raise mal_types.MalException(
+            mal_types.String("memoize-stats: the argument is not memoized")
+        )
+    return memoized.stats()
+
+
+namespace = {
+    mal_types.Symbol("memoize"): memoize,
+    mal_types.Symbol("memoize-stats"): stats,
+}
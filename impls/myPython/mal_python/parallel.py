@@ -0,0 +1,350 @@
+"""Parallel evaluation: pmap, pcalls and pvalues call mal functions in a pool of worker
+processes, so that CPU bound work is spread over the cores despite the GIL.
+
+Each worker process runs its own interpreter, with the same engine. The pool is started
+by the first parallel call. Workers only return results: side effects, like printing or
+changing an atom, happen in the worker.
+
+Values are sent with pickle. The core functions, and the other globals defined at
+startup, are sent by name. A function defined in mal is sent as its fn* form and the
+values of the local variables it captures, and is rebuilt in the worker by evaluating
+the fn* form. Each call sends the current values of the globals defined since startup
+that the functions sent refer to, and of the globals their values refer to in turn. A
+global that cannot be sent (a promise, an unrealized lazy sequence...) is left
+undefined in the workers, which only fails if it is used. The items of pmap are sent
+in chunks, so that the cost of a message is shared by many calls.
+
+The pool has one worker per core, or the number in the MAL_WORKERS environment
+variable.
+"""
+
+import importlib
+import io
+import math
+import os
+import pickle
+
+from mal_python import env
+from mal_python import mal_types
+from mal_python import sequences
+
+chunks_per_worker = 4  # Default number of pmap chunks sent to each worker
+
+# Workers start from a new process rather than a fork of the interpreter: they set up
+# their own interpreter anyway, and forked workers run noticeably slower
+start_method = "forkserver" if os.name == "posix" else "spawn"
+
+environment = None  # The global environment, set by setup
+evaluate = None  # evaluate function of the engine
+builtins = {}  # Name -> value of the globals defined at startup
+builtin_names = {}  # id(value) -> name of the builtins sent by name
+in_worker = False  # True in worker processes, which run parallel calls sequentially
+
+pool = None  # concurrent.futures.ProcessPoolExecutor, started by current_pool
+
+
+def setup(global_environment, engine_evaluate):
+    """Record the global environment, once the core functions are defined in it"""
+    global environment, evaluate
+    environment = global_environment
+    evaluate = engine_evaluate
+    builtins.clear()
+    builtins.update(environment.data)
+    builtin_names.clear()
+    builtin_names.update(
+        (id(value), name) for name, value in builtins.items() if callable(value)
+    )
+
+
+class Pickler(pickle.Pickler):
+    """Pickler of mal values, recording the symbols in the bodies of the functions it
+    pickles in symbols
+    """
+
+    def __init__(self, file):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.symbols = set()
+
+    def persistent_id(self, obj):
+        return builtin_names.get(id(obj))
+
+    def reducer_override(self, obj):
+        if type(obj) is mal_types.FunctionState and (
+            obj.code is not None or obj.env is not None  # Not a native macro
+        ):
+            self.symbols.update(form_symbols(obj.mal_type))
+            variables = captured_variables(obj)
+            # The variables are set once the function exists, as they may refer to it
+            return (
+                rebuild_function,
+                (
+                    obj.params,
+                    obj.mal_type,
+                    obj.is_macro,
+                    obj.name,
+                    obj.meta,
+                    bool(variables),
+                ),
+                variables,
+                None,
+                None,
+                set_captured_variables,
+            )
+        if type(obj) is sequences.LazySeq:
+            if not obj.is_realized():  # It may be unbounded
+                raise pickle.PicklingError("cannot send an unrealized lazy sequence")
+            return mal_types.List, (tuple(obj),)
+        return NotImplemented
+
+
+class Unpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        return builtins[pid]
+
+
+def dumps_recording(value):
+    """Return the pickled value, and the symbols in the bodies of its functions"""
+    file = io.BytesIO()
+    pickler = Pickler(file)
+    try:
+        pickler.dump(value)
+    except (pickle.PicklingError, TypeError, AttributeError) as error:
+        raise mal_types.MalException(
+            mal_types.String(f"cannot send a value to a worker process: {error}")
+        )
+    return file.getvalue(), pickler.symbols
+
+
+def dumps(value):
+    return dumps_recording(value)[0]
+
+
+def loads(data):
+    return Unpickler(io.BytesIO(data)).load()
+
+
+class CapturedVariables(dict):
+    """Global variables of a function rebuilt by rebuild_function: the variables it
+    captured, then the global environment
+    """
+
+    __slots__ = ("globals",)
+
+    def __init__(self, global_variables):
+        super().__init__()
+        self.globals = global_variables
+
+    def __missing__(self, key):
+        return self.globals[key]
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self.globals
+
+    def get(self, key, default=None):
+        if super().__contains__(key):
+            return super().__getitem__(key)
+        return self.globals.get(key, default)
+
+
+def form_symbols(form):
+    """Yield the symbols of a form"""
+    if isinstance(form, mal_types.Symbol):
+        yield form
+    elif isinstance(form, (mal_types.List, mal_types.Vector)):
+        for item in form:
+            yield from form_symbols(item)
+    elif isinstance(form, mal_types.HashMap):
+        for key, value in form.items():
+            yield from form_symbols(key)
+            yield from form_symbols(value)
+
+
+def dumps_definitions(symbols):
+    """Return [(name, pickled value or None)], in order of definition, of the globals
+    named by symbols that were defined since setup, and of the globals their values
+    refer to. The value is None for the globals that cannot be sent.
+    """
+    definitions = {}
+    pending = set(symbols)
+    while pending:
+        name = pending.pop()
+        value = environment.data.get(name, builtins)
+        if value is builtins or builtins.get(name) is value or name in definitions:
+            continue
+        try:
+            definitions[name], value_symbols = dumps_recording(value)
+        except (mal_types.MalException, RecursionError):
+            definitions[name] = None
+            continue
+        pending.update(value_symbols)
+    return [
+        (name, definitions[name]) for name in environment.data if name in definitions
+    ]
+
+
+def define(definitions):
+    """Set the globals sent by dumps_definitions, in a worker"""
+    for name, data in definitions:
+        if data is None:
+            environment.data.pop(name, None)  # Left by an earlier call
+        else:
+            environment.set(name, loads(data))
+
+
+def captured_variables(function):
+    """Return {name: value} of the local variables captured by function"""
+    if function.code is None:  # Created by the tree walking evaluator
+        variables, function_environment = {}, function.env
+    else:
+        variables, function_environment = function.code.captured_variables(function.env)
+
+    while (
+        isinstance(function_environment, env.Env)
+        and function_environment is not environment
+    ):
+        for name, value in function_environment.data.items():
+            variables.setdefault(name, value)
+        function_environment = function_environment.outer
+    return variables
+
+
+def rebuild_function(params, body, is_macro, name, meta, captures):
+    """Evaluate the fn* form of a function sent by another process"""
+    function_environment = environment
+    if captures:
+        function_environment = env.Env(environment)
+        function_environment.data = CapturedVariables(environment.data)
+
+    function = evaluate(
+        mal_types.List([mal_types.Symbol("fn*"), params, body]), function_environment
+    )
+    function.is_macro = is_macro
+    function.name = name
+    function.meta = meta
+    return function
+
+
+def set_captured_variables(function, variables):
+    if function.code is None:
+        function.env.data.update(variables)
+    else:
+        function.code.scope.environment.data.update(variables)
+
+
+def worker_count():
+    return int(os.environ.get("MAL_WORKERS") or os.cpu_count() or 1)
+
+
+def current_pool():
+    """Return the pool, starting it if it is not started yet"""
+    global pool
+    if environment is None:
+        raise mal_types.MalException(
+            mal_types.String("parallel calls require a global environment")
+        )
+    if pool is None:
+        # Only imported by programs running in parallel
+        from concurrent import futures
+        import multiprocessing
+
+        pool = futures.ProcessPoolExecutor(
+            worker_count(),
+            multiprocessing.get_context(start_method),
+            initializer=start_worker,
+            initargs=(evaluate.__module__,),
+        )
+    return pool
+
+
+def start_worker(engine_module):
+    """Set up the interpreter of a worker process"""
+    global in_worker
+    from mal_python import stepA_mal
+
+    in_worker = True
+    stepA_mal.EVAL = importlib.import_module(engine_module).evaluate
+    stepA_mal.repl_environment.data.clear()
+    stepA_mal.define_new_forms()  # Calls setup with the new environment
+
+
+def run_chunk(payload):
+    """Set the globals of (definitions, pickled (function, args lists)), then call the
+    function with each list of arguments, in a worker. Return the pickled
+    (True, results), or (False, value) if a mal exception was thrown.
+    """
+    definitions, task = payload
+    define(definitions)  # Before the task, as rebuilding functions may use macros
+    function, args_lists = loads(task)
+    try:
+        return dumps((True, [function(*args) for args in args_lists]))
+    except mal_types.MalException as exception:
+        return dumps((False, exception.value))
+
+
+def run(tasks):
+    """Run (function, args lists) tasks in the pool, and return all the results in
+    order. Tasks are run in the current process in a worker.
+    """
+    if in_worker:
+        return [
+            function(*args) for function, args_lists in tasks for args in args_lists
+        ]
+
+    pickled_tasks = []
+    symbols = set()
+    for task in tasks:
+        pickled_task, task_symbols = dumps_recording(task)
+        pickled_tasks.append(pickled_task)
+        symbols.update(task_symbols)
+    definitions = dumps_definitions(symbols)
+    payloads = [(definitions, pickled_task) for pickled_task in pickled_tasks]
+    results = []
+    for result in current_pool().map(run_chunk, payloads):
+        completed, value = loads(result)
+        if not completed:
+            raise mal_types.MalException(value)
+        results.extend(value)
+    return results
+
+
+def pmap_chunked(chunk_size, function, *collections):
+    """pmap, sending chunk_size items to a worker at a time"""
+    args_lists = list(zip(*map(sequences.items, collections)))
+    if chunk_size is mal_types.nil:
+        chunk_size = math.ceil(len(args_lists) / (worker_count() * chunks_per_worker))
+    chunk_size = max(chunk_size, 1)
+    tasks = [
+        (function, args_lists[start : start + chunk_size])
+        for start in range(0, len(args_lists), chunk_size)
+    ]
+    return mal_types.List(run(tasks))
+
+
+def pmap(function, *collections):
+    """(pmap f colls...) is (map f colls...), with f called in the worker processes"""
+    return pmap_chunked(mal_types.nil, function, *collections)
+
+
+def pcalls(*functions):
+    """Call functions without arguments in the worker processes, return the results"""
+    return mal_types.List(run([(function, [()]) for function in functions]))
+
+
+def pvalues(*forms):
+    """The pvalues macro: (pvalues a b) is (pcalls (fn* [] a) (fn* [] b))"""
+    return mal_types.List(
+        [
+            mal_types.Symbol("pcalls"),
+            *(
+                mal_types.List([mal_types.Symbol("fn*"), mal_types.Vector(), form])
+                for form in forms
+            ),
+        ]
+    )
+
+
+namespace = {
+    mal_types.Symbol("pmap"): pmap,
+    mal_types.Symbol("pmap-chunked"): pmap_chunked,
+    mal_types.Symbol("pcalls"): pcalls,
+}
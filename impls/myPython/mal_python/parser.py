@@ -1,107 +1,118 @@
+import re
+
+from mal_python import arrays
 from mal_python import mal_types
 
-special_charecters = "[]{}()'`~^@"
+token_pattern = re.compile(
+    r"""[\s,]*"""  # whitespace and commas are skipped
+    r"""(~@|[\[\]{}()'`~^@]"""  # special characters
+    r"""|"(?:\\.|[^\\"])*("?)"""  # strings, group 2 is the closing "
+    r"""|;[^\n]*"""  # comments
+    r"""|[^\s\[\]{}()'"`,;]*)""",  # symbols, numbers and keywords
+    re.DOTALL,
+)
+
+
+def position_message(message, name, line, column):
+    """Add where in the source an error happened to its message"""
+    if name is None:
+        return f"{message} at line {line}, column {column}"
+    return f"{message} at {name}:{line}:{column}"
+
+
+def scan_tokens(chunks, name=None):
+    """Yield (token, line, column) for every mal token in an iterable of text chunks
+
+    The scanner walks the input once with a compiled pattern, so the cost is
+    linear in the length of the input and no part of it is copied except the
+    tokens themselves. Only the unscanned tail of the current chunk is kept,
+    so a file object can be passed in and read line by line.
+    """
+
+    chunks = iter(chunks)
+    match = token_pattern.match
+    buffer = ""
+    position = 0  # Where scanning continues in buffer
+    counted = 0  # Newlines before this offset in buffer are counted in line
+    line = 1
+    line_start = 0  # Offset in buffer where the current line starts
+    at_end = False
+
+    while not at_end:
+        chunk = next(chunks, None)
+        if chunk is None:
+            at_end = True
+        else:
+            # Drop what was scanned already, keeping a partially read token
+            newlines = buffer.count("\n", counted, position)
+            if newlines:
+                line += newlines
+                line_start = buffer.rfind("\n", counted, position) + 1
+            line_start -= position
+            counted = 0
+            buffer = buffer[position:] + chunk
+            position = 0
+
+        end = len(buffer)
+        while position < end:
+            token_match = match(buffer, position)
+            if token_match.end() == end and not at_end:
+                break  # The token might continue in the next chunk
+
+            token = token_match.group(1)
+            if not token:  # Only whitespace was left
+                position = end
+                break
+
+            start = token_match.start(1)
+            position = token_match.end()
+            newlines = buffer.count("\n", counted, start)
+            if newlines:
+                line += newlines
+                line_start = buffer.rfind("\n", counted, start) + 1
+            counted = start
+
+            first_char = token[0]
+            if first_char == ";":
+                continue
+            if first_char == '"' and not token_match.group(2):
+                raise ValueError(
+                    position_message('unbalanced "', name, line, start - line_start + 1)
+                )
+
+            yield token, line, start - line_start + 1
+
 
+def tokenize(line):
+    """parse a line of text into a list of mal tokens"""
+    return [token for token, _, _ in scan_tokens((line,))]
 
-class PeakableIterator:
-    """Class to iterate through tokens"""
 
-    def __init__(self, elements):
-        self.elements = elements
-        self.current_index = 0
+class TokenReader:
+    """Class to iterate through tokens as they are scanned"""
+
+    def __init__(self, chunks, name=None):
+        self.name = name
+        self.tokens = scan_tokens(chunks, name)
+        self.current = next(self.tokens, None)
+        self.line = self.column = 1  # Where the last token returned by next starts
 
     def peek(self):
         """Return current token, without advancing to the next token"""
-        return self.elements[self.current_index]
+        return self.current[0]
 
     def next(self):
         """Return current token, and advance to the next token"""
-        current_value = self.elements[self.current_index]
-        self.current_index += 1
+        current_value, self.line, self.column = self.current
+        self.current = next(self.tokens, None)
 
         return current_value
 
     def empty(self):
-        return self.current_index >= len(self.elements)
-
-
-def remove_white_spaces(line):
-    return line.lstrip(" \t\n\r,")
-
-
-def tokenize(line):
-    """parse a line of text into a list of mal tokens"""
-
-    tokens = []
-
-    line = remove_white_spaces(line)
-
-    while line:
-
-        # ~@
-        if line[:2] == "~@":
-            tokens.append("~@")
-            line = line[2:]
-
-        # Special characters
-        elif line[0] in special_charecters:
-            tokens.append(line[0])
-            line = line[1:]
-
-        # Comment
-        elif line[0] == ";":
-            EOF_index = line.find(chr(10))
-            if EOF_index == -1:  # No end of line, ignore all rest of line
-                line = ""
-            else:
-                line = line[EOF_index:]  # ignore current comment
-
-        # Double quotes
-        elif line[0] == '"':
-            tmp_start_index = 1
-            while True:
-                next_double_quote_index = line.find('"', tmp_start_index)
-                if next_double_quote_index == -1:
-                    raise ValueError('unbalanced "')
-
-                if (
-                    line[next_double_quote_index - 1] != "\\"
-                    or line[next_double_quote_index - 2 : next_double_quote_index]
-                    == "\\\\"
-                ):  # Found closing "
-                    tokens.append(line[: next_double_quote_index + 1])
-                    line = line[next_double_quote_index + 1 :]
-                    break
-                else:
-                    # Found \" - continue searching for closing "
-                    tmp_start_index = next_double_quote_index + 1
-
-        # Non-special character sequence
-        else:
-            end_sequence_chars_indices = sorted(
-                [
-                    line.find(char)
-                    for char in (special_charecters + " '\",;")
-                    if line.find(char) != -1
-                ]
-            )
-
-            if not end_sequence_chars_indices:  # line is one long sequence
-                tokens.append(line)
-                line = ""
-
-            else:
-                first_end_sequence_char_index = end_sequence_chars_indices[0]
-                tokens.append(line[:first_end_sequence_char_index])
-                line = line[first_end_sequence_char_index:]
-
-        line = remove_white_spaces(line)
+        return self.current is None
 
-    return tokens
-
-
-def remove_new_lines(tokens):
-    return [token.rstrip() for token in tokens]
+    def error(self, message, line, column):
+        return ValueError(position_message(message, self.name, line, column))
 
 
 quote_symbol_to_word = {
@@ -131,30 +142,52 @@ def parse_with_meta(peakable_iterator):
     return mal_types.List([mal_types.Symbol("with-meta"), second_arg, first_arg])
 
 
+def parse_typed_array(peakable_iterator):
+    """#f64[1.5 2], #i64[1 2] or #bool[true false]"""
+    tag = peakable_iterator.next()
+    line, column = peakable_iterator.line, peakable_iterator.column
+    if peakable_iterator.empty() or peakable_iterator.peek() != "[":
+        raise peakable_iterator.error(f"expected [ after {tag}", line, column)
+    items = parse_list(peakable_iterator)
+    try:
+        return arrays.from_items(items, arrays.tag_dtypes[tag])
+    except mal_types.MalException as exception:
+        raise peakable_iterator.error(f"{tag}: {exception.value}", line, column)
+
+
 def parse_list(peakable_iterator):
     open_paren = peakable_iterator.next()  # This should be the opening paren type ( [ {
+    line, column = peakable_iterator.line, peakable_iterator.column
 
     if open_paren == mal_types.List.open_paren:
-        mal_list_variant = mal_types.List()
+        list_variant_type = mal_types.List
     elif open_paren == mal_types.Vector.open_paren:
-        mal_list_variant = mal_types.Vector()
+        list_variant_type = mal_types.Vector
     elif open_paren == mal_types.HashMap.open_paren:
-        mal_list_variant = mal_types.HashMap()
+        list_variant_type = mal_types.HashMap
     else:
         raise ValueError(f"Unrecognized open paren {open_paren}")
 
+    items = []
+    close_paren = list_variant_type.close_paren
     while True:
         if peakable_iterator.empty():
-            raise ValueError(f'unbalanced "{mal_list_variant.open_paren}"')
-
-        mal_object = parse_tokens(peakable_iterator)
+            raise peakable_iterator.error(
+                f'unbalanced "{list_variant_type.open_paren}"', line, column
+            )
 
-        if mal_object == mal_list_variant.close_paren:
+        if peakable_iterator.peek() == close_paren:
+            peakable_iterator.next()
             break
 
-        mal_list_variant.append(mal_object)
+        items.append(parse_tokens(peakable_iterator))
+
+    if list_variant_type is mal_types.HashMap and len(items) % 2 != 0:
+        raise peakable_iterator.error(
+            "hash-map literal requires an even number of forms", line, column
+        )
 
-    return mal_list_variant
+    return list_variant_type(items)
 
 
 def isNumber(string):
@@ -163,30 +196,31 @@ def isNumber(string):
     )
 
 
+def parse_number(token):
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
 slash_preceded_charecters = ["\\", '"']
 
 
+escape_pattern = re.compile(r"\\(.?)", re.DOTALL)
+escaped_charecters = {"n": "\n", "\\": "\\", '"': '"'}
+
+
+def replace_escape(escape_match):
+    char = escape_match.group(1)
+    if not char:  # Backslash at the end of the string
+        raise ValueError('unbalanced "')
+    return escaped_charecters.get(char) or "\\" + char
+
+
 def remove_escape_backslash(input_string):
-    output_string = ""
-    iterator = iter(input_string)
-    for char in iterator:
-        if char == "\\":
-            next_char = next(iterator, None)
-            if next_char in slash_preceded_charecters:
-                char = next_char  # skip the '\' character
-            elif next_char == "n":
-                output_string += chr(10)
-                char = next_char = ""
-            else:  # "undo" advancing the iterator
-                output_string += char
-                char = next_char
-
-        try:
-            output_string += char
-        except TypeError:  # char is NoneType
-            raise ValueError('unbalanced "')
-
-    return "".join(output_string)
+    if "\\" not in input_string:
+        return input_string
+    return escape_pattern.sub(replace_escape, input_string)
 
 
 def parse_single_token(peakable_iterator):
@@ -194,7 +228,7 @@ def parse_single_token(peakable_iterator):
 
     token = peakable_iterator.next()
     if isNumber(token):
-        return mal_types.Int(token)
+        return parse_number(token)
 
     elif token[0] == '"':
         return mal_types.String(remove_escape_backslash(token[1:-1]))
@@ -203,13 +237,13 @@ def parse_single_token(peakable_iterator):
         return mal_types.Keyword(token)
 
     elif token == "nil":
-        return mal_types.Nil()
+        return mal_types.nil
 
     elif token == "true":
-        return mal_types.TrueType()
+        return mal_types.true
 
     elif token == "false":
-        return mal_types.FalseType()
+        return mal_types.false
 
     else:
         return mal_types.Symbol(token)
@@ -229,12 +263,23 @@ def parse_tokens(peakable_iterator):
         return parse_quote(peakable_iterator)
     elif next_token == "^":
         return parse_with_meta(peakable_iterator)
+    elif next_token in arrays.tag_dtypes:
+        return parse_typed_array(peakable_iterator)
     else:
         return parse_single_token(peakable_iterator)
 
 
 def parse_string(line):
-    tokens = tokenize(line)
-    tokens = remove_new_lines(tokens)
-    peakable_iterator = PeakableIterator(tokens)
+    peakable_iterator = TokenReader((line,))
     return parse_tokens(peakable_iterator)
+
+
+def read_forms(chunks, name=None):
+    """Yield the top level forms of a source one at a time, as soon as each is read
+
+    chunks is an iterable of text such as an open file, name is used in error messages.
+    """
+
+    peakable_iterator = TokenReader(chunks, name)
+    while not peakable_iterator.empty():
+        yield parse_tokens(peakable_iterator)
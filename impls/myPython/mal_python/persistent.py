@@ -0,0 +1,540 @@
+"""Persistent (immutable, structure sharing) data structures backing the mal collection
+types. "Modifying" operations return a new instance, which shares all unchanged parts
+with the original.
+"""
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+HASH_MASK = 0xFFFFFFFF  # Keys are distributed by the lower 32 bits of their hash
+
+# Maps with up to this many entries are stored as a tuple of (key, value) pairs, which
+# keeps them in insertion order. Larger maps are stored in a hash array mapped trie.
+ARRAY_MAP_SIZE = 8
+
+
+def bit_position(key_hash, shift):
+    return 1 << ((key_hash >> shift) & MASK)
+
+
+def bit_index(bitmap, bit):
+    """Index into a node's entries of the entry whose bit in bitmap is bit"""
+    return bin(bitmap & (bit - 1)).count("1")
+
+
+def keys_equal(key, other):
+    return key is other or key == other
+
+
+class BitmapIndexedNode:
+    """A node of the hash array mapped trie.
+    bitmap has a bit set for each of the WIDTH possible slots of this level that is in
+    use. entries holds one entry per set bit, in bit order. An entry is either a
+    (key_hash, key, value) tuple or a child node.
+    """
+
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+    def get(self, shift, key_hash, key, default):
+        bit = bit_position(key_hash, shift)
+        if not self.bitmap & bit:
+            return default
+
+        entry = self.entries[bit_index(self.bitmap, bit)]
+        if type(entry) is tuple:
+            if entry[0] == key_hash and keys_equal(entry[1], key):
+                return entry[2]
+            return default
+        return entry.get(shift + BITS, key_hash, key, default)
+
+    def assoc(self, shift, key_hash, key, value):
+        """Return (new node, whether a new key was added)"""
+        bit = bit_position(key_hash, shift)
+        index = bit_index(self.bitmap, bit)
+        entries = self.entries
+
+        if not self.bitmap & bit:
+            new_entries = entries[:index] + ((key_hash, key, value),) + entries[index:]
+            return BitmapIndexedNode(self.bitmap | bit, new_entries), True
+
+        entry = entries[index]
+        if type(entry) is tuple:
+            if entry[0] == key_hash and keys_equal(entry[1], key):
+                if entry[2] is value:
+                    return self, False
+                new_entry = (key_hash, key, value)
+                added = False
+            else:
+                new_entry = create_node(shift + BITS, entry, (key_hash, key, value))
+                added = True
+        else:
+            new_entry, added = entry.assoc(shift + BITS, key_hash, key, value)
+            if new_entry is entry:
+                return self, False
+
+        new_entries = entries[:index] + (new_entry,) + entries[index + 1 :]
+        return BitmapIndexedNode(self.bitmap, new_entries), added
+
+    def without(self, shift, key_hash, key):
+        """Return a node without key, self if key is missing, or None if empty"""
+        bit = bit_position(key_hash, shift)
+        if not self.bitmap & bit:
+            return self
+
+        index = bit_index(self.bitmap, bit)
+        entries = self.entries
+        entry = entries[index]
+        if type(entry) is tuple:
+            if entry[0] != key_hash or not keys_equal(entry[1], key):
+                return self
+            new_entry = None
+        else:
+            new_entry = entry.without(shift + BITS, key_hash, key)
+            if new_entry is entry:
+                return self
+            new_entry = collapse(new_entry)
+
+        if new_entry is None:
+            if len(entries) == 1:
+                return None
+            new_entries = entries[:index] + entries[index + 1 :]
+            return BitmapIndexedNode(self.bitmap ^ bit, new_entries)
+
+        new_entries = entries[:index] + (new_entry,) + entries[index + 1 :]
+        return BitmapIndexedNode(self.bitmap, new_entries)
+
+    def __iter__(self):
+        for entry in self.entries:
+            if type(entry) is tuple:
+                yield entry
+            else:
+                yield from entry
+
+
+class HashCollisionNode:
+    """Entries of keys whose 32 bit hashes are identical"""
+
+    __slots__ = ("key_hash", "entries")
+
+    def __init__(self, key_hash, entries):
+        self.key_hash = key_hash
+        self.entries = entries
+
+    def find(self, key):
+        for index, entry in enumerate(self.entries):
+            if keys_equal(entry[1], key):
+                return index
+        return -1
+
+    def get(self, shift, key_hash, key, default):
+        index = self.find(key)
+        return default if index == -1 else self.entries[index][2]
+
+    def assoc(self, shift, key_hash, key, value):
+        if key_hash != self.key_hash:
+            # Push this node one level down, next to the new key
+            node = BitmapIndexedNode(bit_position(self.key_hash, shift), (self,))
+            return node.assoc(shift, key_hash, key, value)
+
+        index = self.find(key)
+        entries = self.entries
+        if index == -1:
+            return (
+                HashCollisionNode(key_hash, entries + ((key_hash, key, value),)),
+                True,
+            )
+        if entries[index][2] is value:
+            return self, False
+        new_entries = entries[:index] + ((key_hash, key, value),) + entries[index + 1 :]
+        return HashCollisionNode(key_hash, new_entries), False
+
+    def without(self, shift, key_hash, key):
+        index = self.find(key)
+        if index == -1:
+            return self
+        if len(self.entries) == 1:
+            return None
+        entries = self.entries[:index] + self.entries[index + 1 :]
+        return HashCollisionNode(self.key_hash, entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+
+def create_node(shift, entry, other_entry):
+    """Return a node holding two entries whose keys differ"""
+    if entry[0] == other_entry[0]:
+        return HashCollisionNode(entry[0], (entry, other_entry))
+
+    node, _ = empty_node.assoc(shift, *entry)
+    node, _ = node.assoc(shift, *other_entry)
+    return node
+
+
+def collapse(node):
+    """A node with a single (key_hash, key, value) entry is replaced by the entry"""
+    if node is not None and len(node.entries) == 1:
+        entry = node.entries[0]
+        if type(entry) is tuple:
+            return entry
+    return node
+
+
+empty_node = BitmapIndexedNode(0, ())
+
+
+class PersistentHashMap:
+    """Immutable map.
+
+    Small maps (up to ARRAY_MAP_SIZE entries) are stored as a tuple of (key, value)
+    pairs and iterate in insertion order. Larger maps are stored in a hash array mapped
+    trie, with O(log32 n) get, assoc and dissoc, and iterate in hash order.
+    keys(), values() and items() always iterate in the same order.
+    """
+
+    __slots__ = ("count", "pairs", "root")
+
+    def __init__(self, items=()):
+        """items are alternating keys and values"""
+        iterator = iter(items)
+        self.init_from(PersistentHashMap.empty.assoc_pairs(zip(iterator, iterator)))
+
+    def init_from(self, other):
+        self.count = other.count
+        self.pairs = other.pairs
+        self.root = other.root
+
+    @classmethod
+    def create(cls, count, pairs, root):
+        new_map = object.__new__(cls)
+        new_map.count = count
+        new_map.pairs = pairs
+        new_map.root = root
+        return new_map
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        return cls.create(0, (), None).assoc_pairs(pairs)
+
+    def get(self, key, default=None):
+        if self.root is None:
+            for pair_key, value in self.pairs:
+                if keys_equal(pair_key, key):
+                    return value
+            return default
+        return self.root.get(0, hash(key) & HASH_MASK, key, default)
+
+    def assoc_pairs(self, pairs):
+        count, array_pairs, root = self.count, self.pairs, self.root
+        for key, value in pairs:
+            if root is None:
+                for index, (pair_key, _) in enumerate(array_pairs):
+                    if keys_equal(pair_key, key):
+                        array_pairs = (
+                            array_pairs[:index]
+                            + ((key, value),)
+                            + array_pairs[index + 1 :]
+                        )
+                        break
+                else:
+                    if count < ARRAY_MAP_SIZE:
+                        array_pairs += ((key, value),)
+                        count += 1
+                        continue
+
+                    # Too large for an array map - move all pairs into a trie
+                    root = empty_node
+                    for pair_key, pair_value in array_pairs:
+                        root, _ = root.assoc(
+                            0, hash(pair_key) & HASH_MASK, pair_key, pair_value
+                        )
+                    array_pairs = ()
+
+            if root is not None:
+                root, added = root.assoc(0, hash(key) & HASH_MASK, key, value)
+                count += added
+
+        return self.create(count, array_pairs, root)
+
+    def assoc(self, *items):
+        """Return a new map with the alternating keys and values of items added"""
+        iterator = iter(items)
+        return self.assoc_pairs(zip(iterator, iterator))
+
+    def dissoc(self, *keys):
+        """Return a new map without keys. Missing keys are ignored"""
+        count, pairs, root = self.count, self.pairs, self.root
+        for key in keys:
+            if root is None:
+                remaining = tuple(
+                    pair for pair in pairs if not keys_equal(pair[0], key)
+                )
+                count -= len(pairs) - len(remaining)
+                pairs = remaining
+            else:
+                new_root = root.without(0, hash(key) & HASH_MASK, key)
+                if new_root is not root:
+                    count -= 1
+                    root = new_root if new_root is not None else empty_node
+
+        if count == self.count:
+            return self
+        return self.create(count, pairs, root)
+
+    def items(self):
+        if self.root is None:
+            return iter(self.pairs)
+        return ((key, value) for _, key, value in self.root)
+
+    def __contains__(self, key):
+        return self.get(key, missing) is not missing
+
+    def __iter__(self):
+        return (key for key, _ in self.items())
+
+    def __len__(self):
+        return self.count
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, PersistentHashMap) or len(self) != len(other):
+            return False
+        for key, value in self.items():
+            other_value = other.get(key, missing)
+            if other_value is missing or not keys_equal(value, other_value):
+                return False
+        return True
+
+    def __hash__(self):
+        # Independent of the iteration order
+        return hash(sum(hash(pair) for pair in self.items()) & HASH_MASK)
+
+
+missing = object()
+PersistentHashMap.empty = PersistentHashMap.create(0, (), None)
+
+
+class PersistentVector:
+    """Immutable vector, stored in a bit-partitioned trie of WIDTH-way nodes (tuples)
+    plus a tail buffer of up to WIDTH values.
+    Indexing, assoc and conj (append) take O(log32 n) time, effectively constant.
+    Appending copies at most the tail and one path of the trie.
+    """
+
+    __slots__ = ("count", "shift", "root", "tail")
+
+    def __init__(self, items=()):
+        items = tuple(items)
+        count = len(items)
+        tail_offset = ((count - 1) >> BITS) << BITS if count else 0
+
+        # Build the trie bottom up, from WIDTH values leaves
+        nodes = [items[index : index + WIDTH] for index in range(0, tail_offset, WIDTH)]
+        shift = BITS
+        while len(nodes) > WIDTH:
+            nodes = [
+                tuple(nodes[index : index + WIDTH])
+                for index in range(0, len(nodes), WIDTH)
+            ]
+            shift += BITS
+
+        self.count = count
+        self.shift = shift
+        self.root = tuple(nodes)
+        self.tail = items[tail_offset:]
+
+    @classmethod
+    def create(cls, count, shift, root, tail):
+        vector = object.__new__(cls)
+        vector.count = count
+        vector.shift = shift
+        vector.root = root
+        vector.tail = tail
+        return vector
+
+    def nth(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("vector index out of range")
+
+        tail_offset = self.count - len(self.tail)
+        if index >= tail_offset:
+            return self.tail[index - tail_offset]
+
+        node = self.root
+        for level in range(self.shift, 0, -BITS):
+            node = node[(index >> level) & MASK]
+        return node[index & MASK]
+
+    def conj(self, value):
+        """Return a new vector with value appended"""
+        if len(self.tail) < WIDTH:
+            return self.create(
+                self.count + 1, self.shift, self.root, self.tail + (value,)
+            )
+
+        # The tail is full - push it into the trie
+        shift = self.shift
+        if (self.count >> BITS) > (1 << shift):  # The trie is full - add a level
+            root = (self.root, new_path(shift, self.tail))
+            shift += BITS
+        else:
+            root = self.push_tail(shift, self.root, self.tail)
+        return self.create(self.count + 1, shift, root, (value,))
+
+    def push_tail(self, level, parent, tail_node):
+        sub_index = ((self.count - 1) >> level) & MASK
+        if level == BITS:
+            node_to_insert = tail_node
+        elif sub_index < len(parent):
+            node_to_insert = self.push_tail(level - BITS, parent[sub_index], tail_node)
+        else:
+            node_to_insert = new_path(level - BITS, tail_node)
+        return parent[:sub_index] + (node_to_insert,) + parent[sub_index + 1 :]
+
+    def assoc_index(self, index, value):
+        """Return a new vector with the value at index replaced.
+        index may also be the length of the vector, which appends value.
+        """
+        if index == self.count:
+            return self.conj(value)
+        if not 0 <= index < self.count:
+            raise IndexError("vector index out of range")
+
+        tail_offset = self.count - len(self.tail)
+        if index >= tail_offset:
+            tail_index = index - tail_offset
+            tail = self.tail[:tail_index] + (value,) + self.tail[tail_index + 1 :]
+            return self.create(self.count, self.shift, self.root, tail)
+
+        root = assoc_path(self.shift, self.root, index, value)
+        return self.create(self.count, self.shift, root, self.tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return type(self)(self.nth(i) for i in range(*index.indices(self.count)))
+        return self.nth(index)
+
+    def __iter__(self):
+        yield from iterate_leaves(self.shift, self.root)
+        yield from self.tail
+
+    def __len__(self):
+        return self.count
+
+
+def new_path(level, node):
+    """Return a chain of single child nodes of height level, ending with node"""
+    for _ in range(0, level, BITS):
+        node = (node,)
+    return node
+
+
+def assoc_path(level, node, index, value):
+    sub_index = (index >> level) & MASK
+    if level == 0:
+        new_child = value
+    else:
+        new_child = assoc_path(level - BITS, node[sub_index], index, value)
+    return node[:sub_index] + (new_child,) + node[sub_index + 1 :]
+
+
+def iterate_leaves(level, node):
+    if level == 0:
+        yield from node
+    else:
+        for child in node:
+            yield from iterate_leaves(level - BITS, child)
+
+
+class PersistentList:
+    """Immutable list, made of a chain of chunks: the items of the list are
+    items[offset:], followed by the items of the list more (if not None).
+
+    first, rest and cons take O(1) time and share structure with the original list:
+    rest advances offset (or moves on to more), and cons creates a single item chunk
+    whose more is the original list. Lists created from an iterable are a single
+    chunk, so nth is O(1) on them, and O(number of chunks) in general.
+    """
+
+    __slots__ = ("items", "offset", "more", "count")
+
+    def __init__(self, items=()):
+        self.items = tuple(items)
+        self.offset = 0
+        self.more = None
+        self.count = len(self.items)
+
+    @classmethod
+    def create(cls, items, offset, more):
+        new_list = object.__new__(cls)
+        new_list.items = items
+        new_list.offset = offset
+        new_list.more = more
+        new_list.count = len(items) - offset + (more.count if more else 0)
+        return new_list
+
+    def first(self):
+        if self.count == 0:
+            raise IndexError("first of empty list")
+        return self.items[self.offset]
+
+    def rest(self):
+        if self.offset + 1 < len(self.items):
+            return self.create(self.items, self.offset + 1, self.more)
+        if self.more:
+            return self.more
+        return self.create((), 0, None)
+
+    def cons(self, value):
+        """Return a new list with value in front of the items of this list"""
+        return self.create((value,), 0, self if self.count else None)
+
+    def prepend(self, values):
+        """Return a new list with values (a tuple) in front of the items of this list"""
+        if not values:
+            return self
+        return self.create(values, 0, self if self.count else None)
+
+    def nth(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("list index out of range")
+
+        chunk = self
+        while True:
+            chunk_length = len(chunk.items) - chunk.offset
+            if index < chunk_length:
+                return chunk.items[chunk.offset + index]
+            index -= chunk_length
+            chunk = chunk.more
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.start == 1 and index.stop is None and index.step is None:
+                return self.rest()
+            return type(self)(tuple(self)[index])
+        return self.nth(index)
+
+    def __iter__(self):
+        chunk = self
+        while chunk is not None:
+            items = chunk.items
+            for index in range(chunk.offset, len(items)):
+                yield items[index]
+            chunk = chunk.more
+
+    def __len__(self):
+        return self.count
+
+    def __reduce__(self):
+        # Copy and pickle as a single chunk, avoiding recursion through long chains
+        return (type(self), (tuple(self),))
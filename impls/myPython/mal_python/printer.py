@@ -26,4 +26,16 @@ def print_string(mal_type, print_readably):
             + mal_type.close_paren
         )
 
+    elif isinstance(mal_type, mal_types.HashMap):
+        return (
+            mal_type.open_paren
+            + " ".join(
+                print_string(key, print_readably)
+                + " "
+                + print_string(value, print_readably)
+                for key, value in mal_type.items()
+            )
+            + mal_type.close_paren
+        )
+
     return str(mal_type)
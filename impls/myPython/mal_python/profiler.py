@@ -0,0 +1,201 @@
+"""Profiler for mal functions, used by the three engines (evaluator.py, analyzer.py and
+vm.py).
+
+A Profiler records, for each function (all functions created by the same fn* form are
+counted together), the number of calls, the inclusive time (including the functions it
+calls) and the exclusive time (excluding them), and the time spent expanding each macro.
+The time of every call stack is kept as well, and can be written in the collapsed stack
+format read by flame graph tools, e.g. https://github.com/brendangregg/FlameGraph:
+```
+fib;fib;fib 1234
+```
+where the number is the exclusive time in microseconds.
+
+Each thread has its own Profiler, or none: (profile expr) only records the calls made by
+the thread evaluating it, not those of the futures it starts. The engines check the
+number of profiling threads before looking up the Profiler of their thread, so calls are
+not slowed down by the thread local lookup while nothing is profiled.
+"""
+
+import collections
+import threading
+import time
+
+from mal_python import mal_types
+
+local = threading.local()  # local.profiler: the Profiler of the thread, if any
+profiling = 0  # Number of threads with a Profiler
+profiling_lock = threading.Lock()
+
+
+class FunctionProfile:
+    """Accumulated statistics of a function, times in nanoseconds"""
+
+    __slots__ = ("label", "body", "calls", "inclusive", "exclusive")
+
+    def __init__(self, label, body):
+        self.label = label
+        self.body = body  # Keeps the body alive, its id is the key of the profile
+        self.calls = 0
+        self.inclusive = 0
+        self.exclusive = 0
+
+
+class Record:
+    """A call that has not returned yet"""
+
+    __slots__ = ("profile", "path", "start", "child_time")
+
+    def __init__(self, profile, path, start):
+        self.profile = profile
+        self.path = path  # Labels of the calls on the stack, separated by ;
+        self.start = start
+        self.child_time = 0
+
+
+def function_label(function):
+    if function.name is not None:
+        return function.name
+    return f"(fn* {function.params!r})"
+
+
+class Profiler:
+    def __init__(self):
+        self.functions = {}  # id of function body -> FunctionProfile
+        self.macros = {}  # id of macro body -> FunctionProfile of its expansions
+        self.collapsed_stacks = collections.Counter()  # path -> exclusive time
+        self.stack = []  # Records of the calls that have not returned yet
+        self.active = collections.Counter()  # FunctionProfile -> records on the stack
+
+    def get_profile(self, profiles, function, label):
+        profile = profiles.get(id(function.mal_type))
+        if profile is None:
+            profile = profiles[id(function.mal_type)] = FunctionProfile(
+                label, function.mal_type
+            )
+        return profile
+
+    def enter(self, profile):
+        profile.calls += 1
+        self.active[profile] += 1
+        path = f"{self.stack[-1].path};{profile.label}" if self.stack else profile.label
+        self.stack.append(Record(profile, path, time.perf_counter_ns()))
+
+    def exit(self):
+        record = self.stack.pop()
+        elapsed = time.perf_counter_ns() - record.start
+        exclusive = elapsed - record.child_time
+        profile = record.profile
+
+        self.active[profile] -= 1
+        if not self.active[profile]:  # Count recursive calls once
+            profile.inclusive += elapsed
+        profile.exclusive += exclusive
+        self.collapsed_stacks[record.path] += exclusive
+        if self.stack:
+            self.stack[-1].child_time += elapsed
+
+    def enter_function(self, function):
+        self.enter(self.get_profile(self.functions, function, function_label(function)))
+
+    def call(self, function, run, *args):
+        """Return run(*args), which runs the body of function, recording the call"""
+        self.enter_function(function)
+        try:
+            return run(*args)
+        finally:
+            self.exit()
+
+    def tail_call(self, function):
+        """Replace the call on top of the stack by a tail call of function"""
+        if self.stack:
+            self.exit()
+        self.enter_function(function)
+
+    def unwind(self, depth):
+        """Exit the calls above the first depth calls of the stack, e.g. the calls a
+        caught exception returned from
+        """
+        while len(self.stack) > depth:
+            self.exit()
+
+    def expand_macro(self, function, args):
+        label = f"macroexpand {function_label(function)}"
+        self.enter(self.get_profile(self.macros, function, label))
+        try:
+            return function(*args)
+        finally:
+            self.exit()
+
+    def report(self):
+        """Return a table of the functions and macros, slowest first"""
+        lines = [
+            f"{'calls':>10} {'inclusive ms':>13} {'exclusive ms':>13}  function",
+        ]
+        for profiles in (self.functions, self.macros):
+            for profile in sorted(
+                profiles.values(), key=lambda profile: profile.inclusive, reverse=True
+            ):
+                lines.append(
+                    f"{profile.calls:>10} {profile.inclusive / 1e6:>13.3f} "
+                    f"{profile.exclusive / 1e6:>13.3f}  {profile.label}"
+                )
+        return "\n".join(lines)
+
+    def write_collapsed_stacks(self, file):
+        for path, exclusive in self.collapsed_stacks.items():
+            file.write(f"{path} {exclusive // 1000}\n")
+
+
+def current():
+    """Return the Profiler of the current thread, or None"""
+    if not profiling:
+        return None
+    return getattr(local, "profiler", None)
+
+
+def record(function, *args):
+    """Call function(*args), recording the calls of mal functions in the current thread.
+    Returns the value and the Profiler.
+    """
+    global profiling
+    outer_profiler = getattr(local, "profiler", None)
+    local.profiler = recorded = Profiler()
+    with profiling_lock:
+        profiling += 1
+    try:
+        value = function(*args)
+    finally:
+        local.profiler = outer_profiler
+        with profiling_lock:
+            profiling -= 1
+    return value, recorded
+
+
+def profile_call(function, *filename):
+    """(profile-call f) calls f without arguments, prints the time spent in each
+    function and returns the value. (profile-call f filename) also writes the call
+    stacks to filename in collapsed stack format.
+    """
+    value, recorded = record(function)
+    print(recorded.report())
+    if filename:
+        with open(str(filename[0]), "w") as file:
+            recorded.write_collapsed_stacks(file)
+    return value
+
+
+def profile(expr, *filename):
+    """The profile macro: (profile expr) is (profile-call (fn* [] expr))"""
+    return mal_types.List(
+        [
+            mal_types.Symbol("profile-call"),
+            mal_types.List([mal_types.Symbol("fn*"), mal_types.Vector(), expr]),
+            *filename,
+        ]
+    )
+
+
+namespace = {
+    mal_types.Symbol("profile-call"): profile_call,
+}
@@ -0,0 +1,380 @@
+"""Lazy sequences: sequences whose items are computed when they are first needed, so
+large or unbounded data can be processed without holding all of it in memory.
+
+A LazySeq is a chain of nodes, like a List. An unrealized node has a source: either an
+iterator, from which realizing the node pulls a chunk of up to chunk_size items, or a
+thunk (from lazy-seq) returning a sequence. Realized nodes keep their items, so every
+item is computed once however many times the sequence is walked. Walking a sequence
+only refers to the current node, so the items that were walked past are freed unless
+the head of the sequence is kept, e.g. in a def! or as the argument of the function
+walking it. (range start end step) of integers is a Range, which computes its items
+from a Python range instead, so it takes the same memory however much of it is walked.
+
+A sequence can be shared by several threads (e.g. futures): each node is realized under
+a lock of its own, so its source is used by one thread, once.
+"""
+
+import itertools
+import threading
+
+from mal_python import mal_types
+
+chunk_size = 32
+
+
+class LazySeq(mal_types.ListVariant):
+    """Lazy sequence, created from an iterator of items, or with from_thunk"""
+
+    __slots__ = (
+        "thunk",
+        "iterator",
+        "items",
+        "offset",
+        "more",
+        "lock",
+        "metadata",
+        "hash",
+    )
+    open_paren = "("
+    close_paren = ")"
+
+    def __init__(self, iterator=None):
+        self.thunk = None
+        self.iterator = iterator
+        self.items = None  # Realized items of the node are items[offset:]
+        self.offset = 0
+        self.more = None  # The following node, None at the end of the sequence
+        self.lock = threading.RLock()  # Held while realizing, None once realized
+
+    @classmethod
+    def from_thunk(cls, thunk):
+        """Return a sequence of the items of the sequence (or nil) returned by thunk"""
+        lazy_seq = cls()
+        lazy_seq.thunk = thunk
+        return lazy_seq
+
+    @classmethod
+    def create(cls, items, offset, more):
+        """Return a realized node"""
+        lazy_seq = object.__new__(cls)  # Without a lock
+        lazy_seq.thunk = lazy_seq.iterator = lazy_seq.lock = None
+        lazy_seq.items = items
+        lazy_seq.offset = offset
+        lazy_seq.more = more
+        return lazy_seq
+
+    def realize(self):
+        """Compute the items of this node, if not done yet. A realized node is either
+        empty (and the last node) or has at least one item.
+        items is set last, as other threads read it without the lock.
+        """
+        if self.items is not None:
+            return
+        lock = self.lock
+        if lock is None:  # Realized since items was read
+            return
+
+        with lock:
+            if self.items is not None:  # Realized by another thread
+                return
+            if self.thunk is not None:
+                value = self.thunk()
+                if isinstance(value, LazySeq):
+                    value.realize()
+                    self.offset = value.offset
+                    self.more = value.more
+                    self.items = value.items
+                else:
+                    self.items = tuple(items(value))  # A list, vector or nil
+                self.thunk = None
+            else:
+                chunk = tuple(itertools.islice(self.iterator, chunk_size))
+                if len(chunk) == chunk_size:
+                    self.more = LazySeq(self.iterator)
+                self.items = chunk
+                self.iterator = None
+            self.lock = None
+
+    def is_realized(self):
+        """True if all the nodes of the sequence are realized"""
+        if self.items is None:
+            return False
+        node = self.more
+        while node is not None and type(node) is not Range:
+            if node.items is None:
+                return False
+            node = node.more
+        return True
+
+    def is_head_realized(self):
+        """True if the first node is realized"""
+        return self.items is not None
+
+    def __copy__(self):
+        # Shares the items, realized once by whichever of the two is used first
+        return LazySeq.from_thunk(lambda: self)
+
+    def empty(self):
+        self.realize()
+        return not self.items
+
+    def first(self):
+        self.realize()
+        if not self.items:
+            return mal_types.nil
+        return self.items[self.offset]
+
+    def rest(self):
+        self.realize()
+        if self.offset + 1 < len(self.items):
+            return self.create(self.items, self.offset + 1, self.more)
+        if self.more is not None:
+            return self.more
+        return mal_types.List()
+
+    def __iter__(self):
+        return walk(self)
+
+    def __len__(self):
+        self.realize()
+        return len(self.items) - self.offset + count_items(self.more)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.start == 1 and index.stop is None and index.step is None:
+                return self.rest()
+            return mal_types.List(tuple(self)[index])
+        if index < 0:
+            raise IndexError("negative index of a lazy sequence")
+
+        node = self
+        while node is not None:
+            node.realize()
+            length = len(node.items) - node.offset
+            if index < length:
+                return node.items[node.offset + index]
+            index -= length
+            node = node.more
+        raise IndexError("lazy sequence index out of range")
+
+
+def walk(node):
+    """Yield the items of a LazySeq. Only the current node is referred to."""
+    while node is not None:
+        if type(node) is Range:
+            yield from node.range
+            return
+        node.realize()
+        items = node.items
+        for index in range(node.offset, len(items)):
+            yield items[index]
+        node = node.more
+
+
+def count_items(node):
+    """Return the number of items from node (a LazySeq or None) to the end. Only the
+    current node is referred to.
+    """
+    count = 0
+    while node is not None:
+        if type(node) is Range:
+            return count + len(node.range)
+        node.realize()
+        count += len(node.items) - node.offset
+        node = node.more
+    return count
+
+
+class Range(LazySeq):
+    """Sequence of the integers of a Python range. The items are computed from the
+    range, so walking, counting or reducing a Range keeps none of them.
+    """
+
+    __slots__ = ("range",)
+
+    def __init__(self, int_range):
+        self.thunk = self.iterator = self.items = self.more = self.lock = None
+        self.offset = 0
+        self.range = int_range
+
+    def realize(self):
+        # As a node, for code walking the nodes of a LazySeq ending with a Range. Threads
+        # realizing it at the same time compute the same items
+        if self.items is None:
+            if len(self.range) > chunk_size:
+                self.more = Range(self.range[chunk_size:])
+            self.items = tuple(self.range[:chunk_size])
+
+    def is_realized(self):
+        return True
+
+    def is_head_realized(self):
+        return True
+
+    def __copy__(self):
+        return Range(self.range)
+
+    def empty(self):
+        return not self.range
+
+    def first(self):
+        if not self.range:
+            return mal_types.nil
+        return self.range[0]
+
+    def rest(self):
+        if len(self.range) > 1:
+            return Range(self.range[1:])
+        return mal_types.List()
+
+    def __iter__(self):
+        return iter(self.range)
+
+    def __len__(self):
+        return len(self.range)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.start == 1 and index.stop is None and index.step is None:
+                return self.rest()
+            return mal_types.List(self.range[index])
+        if index < 0:
+            raise IndexError("negative index of a lazy sequence")
+        return self.range[index]
+
+
+def items(collection):
+    """Return an iterator over the items of a sequence, hash-map or nil. The items of a
+    hash-map are its entries, as [key value] vectors.
+    """
+    if collection is mal_types.nil:
+        return iter(())
+    if isinstance(collection, mal_types.HashMap):
+        return (mal_types.Vector(entry) for entry in collection.items())
+    return iter(collection)
+
+
+def is_true(value):
+    return value is not mal_types.nil and value is not mal_types.false
+
+
+def cons(item, lazy_seq):
+    return LazySeq.create((item,), 0, lazy_seq)
+
+
+def conj(lazy_seq, *new_items):
+    """The sequence with new_items prepended one by one, as by cons: (conj s 1 2) is
+    (2 1 ...)
+    """
+    if not new_items:  # An empty node would end the sequence
+        return lazy_seq
+    return LazySeq.create(new_items[::-1], 0, lazy_seq)
+
+
+def mal_range(*args):
+    """(range) counts from 0 up forever, (range end), (range start end) and
+    (range start end step) are as in Python
+    """
+    if not args:
+        return LazySeq(itertools.count())
+    if all(type(arg) is int for arg in args):
+        return Range(range(*args))
+    return LazySeq(float_range(*args))
+
+
+def float_range(start, end=None, step=1):
+    if end is None:
+        start, end = 0, start
+    index = 0
+    value = start
+    while (step > 0 and value < end) or (step < 0 and value > end):
+        yield value
+        index += 1
+        value = start + index * step
+
+
+def iterate(function, value):
+    """x, (f x), (f (f x)), ..."""
+    while True:
+        yield value
+        value = function(value)
+
+
+def lazy_seq(*body):
+    """The lazy-seq macro: (lazy-seq body...) is a sequence of the items of the
+    sequence returned by body, evaluated when the sequence is first used
+    """
+    return mal_types.List(
+        [
+            mal_types.Symbol("lazy-seq*"),
+            mal_types.List(
+                [
+                    mal_types.Symbol("fn*"),
+                    mal_types.Vector(),
+                    mal_types.List([mal_types.Symbol("do"), *body]),
+                ]
+            ),
+        ]
+    )
+
+
+def check_count(name, count):
+    """Return the count of take or drop, 0 if negative, as in Clojure"""
+    if type(count) is not int:
+        raise mal_types.MalException(
+            mal_types.String(f"{name}: count {count!r} is not an integer")
+        )
+    return max(count, 0)
+
+
+# take, drop and filter are lazy on a lazy sequence, and eager otherwise, like map
+
+
+def take(count, collection):
+    if isinstance(collection, Range):
+        return Range(collection.range[: check_count("take", count)])
+    iterator = itertools.islice(items(collection), check_count("take", count))
+    if isinstance(collection, LazySeq):
+        return LazySeq(iterator)
+    return mal_types.List(iterator)
+
+
+def drop(count, collection):
+    if isinstance(collection, Range):
+        return Range(collection.range[check_count("drop", count) :])
+    iterator = itertools.islice(items(collection), check_count("drop", count), None)
+    if isinstance(collection, LazySeq):
+        return LazySeq(iterator)
+    return mal_types.List(iterator)
+
+
+def mal_filter(predicate, collection):
+    if isinstance(collection, LazySeq):
+        return LazySeq(item for item in items(collection) if is_true(predicate(item)))
+    return mal_types.List(
+        [item for item in items(collection) if is_true(predicate(item))]
+    )
+
+
+def doall(lazy_seq):
+    """Realize every item of a sequence, and return it"""
+    if isinstance(lazy_seq, LazySeq):
+        node = lazy_seq
+        while node is not None and type(node) is not Range:
+            node.realize()
+            node = node.more
+    return lazy_seq
+
+
+namespace = {
+    mal_types.Symbol("lazy-seq*"): LazySeq.from_thunk,
+    mal_types.Symbol("range"): mal_range,
+    mal_types.Symbol("iterate"): lambda function, value: LazySeq(
+        iterate(function, value)
+    ),
+    mal_types.Symbol("drop"): drop,
+    mal_types.Symbol("doall"): doall,
+    mal_types.Symbol("lazy-seq?"): lambda mal_type: (
+        mal_types.true if isinstance(mal_type, LazySeq) else mal_types.false
+    ),
+}
@@ -1,25 +1,42 @@
 #!/usr/bin/python3
 
+import time
+
+startup_start = time.perf_counter()
+
+import argparse
+import importlib
 import os
-import readline
 import sys
 
 from mal_python import core
 from mal_python import env
 from mal_python import evaluator
+from mal_python import eventloop
+from mal_python import form_cache
 from mal_python import mal_types
+from mal_python import parallel
 from mal_python import printer
+from mal_python import profiler
 from mal_python import parser
 
+# Seconds spent in each phase of the startup, reported by --startup-stats
+startup_times = {"imports": time.perf_counter() - startup_start}
+
 history_size = 1000
 history_directory = os.path.join(os.path.expanduser("~"), ".mal")
 history_filename = ".history"
 
 
 class CommandHistory:
-    """Set up command history, even between mal invocations"""
+    """Set up command history, even between mal invocations.
+    Only used by the REPL, so readline is only imported in interactive mode.
+    """
 
     def __init__(self):
+        import readline
+
+        self.readline = readline
         os.makedirs(history_directory, exist_ok=True)
         self.history_filename = os.path.join(history_directory, history_filename)
 
@@ -27,14 +44,29 @@ class CommandHistory:
             open(self.history_filename, "a").close()
 
     def open_history_file(self):
-        readline.read_history_file(self.history_filename)
-        readline.set_history_length(history_size)
+        self.readline.read_history_file(self.history_filename)
+        self.readline.set_history_length(history_size)
 
     def save_history_file(self):
-        readline.write_history_file(self.history_filename)
+        self.readline.write_history_file(self.history_filename)
+
+
+repl_environment = env.Env(mal_types.nil)
+
+# Execution engines, selectable with --engine or the MAL_ENGINE environment variable.
+# Name -> module providing evaluate(mal_type, environment), imported when selected
+engines = {
+    "tree": "mal_python.evaluator",  # Tree walking evaluator
+    "closure": "mal_python.analyzer",  # Analyze forms into closures once, then execute
+    "vm": "mal_python.vm",  # Compile forms to bytecode, run by a stack based machine
+}
+
+
+def load_engine(name):
+    return importlib.import_module(engines[name]).evaluate
 
 
-repl_environment = env.Env(mal_types.Nil())
+EVAL = evaluator.evaluate
 
 
 def READ(line):
@@ -47,45 +79,45 @@ def PRINT(mal_type):
 
 def read_eval_print(line):
     read = READ(line)
-    evaluated = evaluator.Evaluator(read, repl_environment).EVAL()
+    evaluated = EVAL(read, repl_environment)
     printed = PRINT(evaluated)
     return printed
 
 
-def set_argv():
+def set_argv(argv):
     """Add command line arguments. If none are given, add empty list"""
-    try:
-        args = mal_types.List([mal_types.String(arg) for arg in sys.argv[2:]])
-    except IndexError:
-        args = mal_types.List([])
-
+    args = mal_types.List([mal_types.String(arg) for arg in argv])
     repl_environment.set("*ARGV*", args)
 
 
 def load_core_forms():
-    for key, value in core.namespace.items():
-        repl_environment.set(key, value)
+    repl_environment.data.update(core.namespace)
 
 
 def define_new_forms():
-    read_eval_print("(def! not (fn* (a) (if a false true)))")
-
-    read_eval_print(
-        '(def! load-file (fn* (f) (eval (read-string (str "(do " (slurp f) "\nnil)")))))'
-    )
-
     def mal_eval(mal_type):
-        return evaluator.Evaluator(mal_type, repl_environment).EVAL()
+        return EVAL(mal_type, repl_environment)
 
     repl_environment.set("eval", mal_eval)
 
-    read_eval_print(
-        "(defmacro! cond (fn* (& xs) (if (> (count xs) 0) (list 'if (first xs) (if (> (count xs) 1) (nth xs 1) (throw \"odd number of forms to cond\")) (cons 'cond (rest (rest xs)))))))"
-    )
+    def load_file(file_name):
+        """Evaluate the forms of a file one at a time, as they are read.
+        The forms are cached on disk, see form_cache.
+        """
+        try:
+            forms = form_cache.read_forms(str(file_name))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Could not open file {file_name}")
+
+        for mal_type in forms:
+            EVAL(mal_type, repl_environment)
+
+        return mal_types.nil
 
-    read_eval_print('(def! *host-language* "python3")')
+    repl_environment.set("load-file", load_file)
 
     load_core_forms()
+    parallel.setup(repl_environment, EVAL)
 
 
 def print_startup_header():
@@ -114,18 +146,94 @@ def repl_loop():
             return
 
 
-def main():
+def parse_arguments(argv):
+    argument_parser = argparse.ArgumentParser(
+        prog="mal", description="An interpreter for the mal language."
+    )
+    argument_parser.add_argument(
+        "--engine",
+        choices=engines.keys(),
+        default=os.environ.get("MAL_ENGINE", "tree"),
+        help="execution engine (default: %(default)s)",
+    )
+    argument_parser.add_argument(
+        "--profile",
+        metavar="OUTPUT",
+        help="run filename, print the time spent in each function "
+        "and write the call stacks to OUTPUT in collapsed stack (flame graph) format",
+    )
+    argument_parser.add_argument(
+        "--startup-stats",
+        action="store_true",
+        help="print the time taken by each phase of the startup to stderr",
+    )
+    argument_parser.add_argument(
+        "filename", nargs="?", help="mal file to run. Starts a REPL if omitted"
+    )
+    argument_parser.add_argument(
+        "args", nargs=argparse.REMAINDER, help="arguments available as *ARGV*"
+    )
+    arguments = argument_parser.parse_args(argv)
+    if arguments.profile is not None and arguments.filename is None:
+        argument_parser.error("--profile requires a filename")
+    return arguments
+
+
+def timed(phase, function, *args):
+    """Call function, recording the time it takes as a startup phase"""
+    start = time.perf_counter()
+    result = function(*args)
+    startup_times[phase] = time.perf_counter() - start
+    return result
+
+
+def print_startup_stats():
+    for phase, seconds in startup_times.items():
+        print(f"{phase:<12} {seconds * 1000:8.2f} ms", file=sys.stderr)
+    total = sum(startup_times.values())
+    print(f"{'total':<12} {total * 1000:8.2f} ms", file=sys.stderr)
+
+
+def open_command_history():
     command_history = CommandHistory()
     command_history.open_history_file()
+    return command_history
 
-    define_new_forms()
-    set_argv()
 
-    if len(sys.argv) > 1:
-        filename = sys.argv[1]
-        read_eval_print(f'(load-file "{filename}")')
+def main():
+    try:
+        interpret(sys.argv[1:])
+    finally:
+        eventloop.stop()  # Complete the asynchronous I/O still running
+
+
+def interpret(argv):
+    global EVAL
+
+    arguments = timed("arguments", parse_arguments, argv)
+    EVAL = timed("engine", load_engine, arguments.engine)
+    timed("environment", define_new_forms)
+    set_argv(arguments.args)
+
+    if arguments.profile is not None:
+        _, recorded = profiler.record(
+            EVAL, READ(f'(load-file "{arguments.filename}")'), repl_environment
+        )
+        print(recorded.report(), file=sys.stderr)
+        with open(arguments.profile, "w") as file:
+            recorded.write_collapsed_stacks(file)
+        exit()
+
+    if arguments.filename is not None:
+        timed("run", read_eval_print, f'(load-file "{arguments.filename}")')
+        if arguments.startup_stats:
+            print_startup_stats()
         exit()
 
+    command_history = timed("history", open_command_history)
+    if arguments.startup_stats:
+        print_startup_stats()
+
     print_startup_header()
 
     repl_loop()
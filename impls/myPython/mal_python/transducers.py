@@ -0,0 +1,272 @@
+"""Native reduce and transducers, for processing sequences in a single pass without
+intermediate collections.
+
+A reducing function is a Reducer: a step function (accumulator, item) -> accumulator
+and a complete function called once on the final accumulator. A mal function used as a
+reducing function is its step function, and complete returns the accumulator as is.
+
+A transducer transforms a reducing function into another one, e.g. (map f) returns a
+transducer whose reducing functions call the step function they wrap with (f item).
+Transducers are composed with comp: in (comp (map f) (filter g)) items go through f,
+then g. A step function stops the reduction early by returning (reduced value).
+"""
+
+from mal_python import mal_types
+from mal_python import sequences
+
+
+class Reduced:
+    """Accumulator wrapper returned by a step function to end a reduction"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return f"(reduced {self.value!r})"
+
+
+class Reducer:
+    """Reducing function. Called from mal, it is its step function."""
+
+    __slots__ = ("step", "complete")
+
+    def __init__(self, step, complete):
+        self.step = step
+        self.complete = complete
+
+    def __call__(self, accumulator, item):
+        return self.step(accumulator, item)
+
+
+class Transducer:
+    """Called with a reducing function (a Reducer or a mal function), returns the
+    Reducer transforming it. make creates the state of each use, e.g. take's count.
+    """
+
+    __slots__ = ("make",)
+
+    def __init__(self, make):
+        self.make = make
+
+    def __call__(self, reducer):
+        return self.make(as_reducer(reducer))
+
+
+def identity(value):
+    return value
+
+
+def step_function(function):
+    """Return the fastest way to call a function with two arguments"""
+    if type(function) is mal_types.NativeFunction:
+        return function.binary
+    return function
+
+
+def as_reducer(function):
+    if isinstance(function, Reducer):
+        return function
+    return Reducer(step_function(function), identity)
+
+
+def mapping(function):
+    def make(reducer):
+        step = reducer.step
+        return Reducer(lambda acc, item: step(acc, function(item)), reducer.complete)
+
+    return Transducer(make)
+
+
+def filtering(predicate):
+    def make(reducer):
+        step = reducer.step
+
+        def filter_step(acc, item):
+            if sequences.is_true(predicate(item)):
+                return step(acc, item)
+            return acc
+
+        return Reducer(filter_step, reducer.complete)
+
+    return Transducer(make)
+
+
+def taking(count):
+    def make(reducer):
+        step = reducer.step
+        remaining = count
+
+        def take_step(acc, item):
+            nonlocal remaining
+            if remaining <= 0:
+                return Reduced(acc)
+            remaining -= 1
+            acc = step(acc, item)
+            if remaining <= 0 and type(acc) is not Reduced:
+                return Reduced(acc)
+            return acc
+
+        return Reducer(take_step, reducer.complete)
+
+    return Transducer(make)
+
+
+def reduce_items(step, accumulator, items):
+    for item in items:
+        accumulator = step(accumulator, item)
+        if type(accumulator) is Reduced:
+            return accumulator.value
+    return accumulator
+
+
+def reduce(function, *args):
+    """(reduce f coll) or (reduce f init coll). Without init, the first item is the
+    initial value, and (f) is returned for an empty collection.
+    """
+    if len(args) == 2:
+        initial, collection = args
+        return reduce_items(
+            step_function(function), initial, sequences.items(collection)
+        )
+
+    (collection,) = args
+    items = sequences.items(collection)
+    for initial in items:
+        return reduce_items(step_function(function), initial, items)
+    return function()
+
+
+def reduce_kv(function, initial, collection):
+    """(reduce-kv f init coll) calls (f acc key value) for the entries of a hash-map,
+    or the indexes and items of a vector
+    """
+    if isinstance(collection, mal_types.HashMap):
+        entries = collection.items()
+    else:
+        entries = enumerate(sequences.items(collection))
+
+    accumulator = initial
+    for key, value in entries:
+        accumulator = function(accumulator, key, value)
+        if type(accumulator) is Reduced:
+            return accumulator.value
+    return accumulator
+
+
+def transduce(transducer, function, *args):
+    """(transduce xform f coll) or (transduce xform f init coll), init defaults to (f)"""
+    if len(args) == 2:
+        initial, collection = args
+    else:
+        (collection,) = args
+        initial = function()
+
+    reducer = as_reducer(transducer(function))
+    return reducer.complete(
+        reduce_items(reducer.step, initial, sequences.items(collection))
+    )
+
+
+def append(items, item):
+    items.append(item)
+    return items
+
+
+def entry_pair(item):
+    """Return the key and value of an item added to a hash-map by into"""
+    if not isinstance(item, mal_types.ListVariant) or len(item) != 2:
+        raise mal_types.MalException(
+            mal_types.String(f"into: {item!r} is not a [key value] pair")
+        )
+    return item[0], item[1]
+
+
+def into(target, *args):
+    """(into to coll) or (into to xform coll): add the items to a list (at the front),
+    vector or hash-map (items are [key value] pairs) in one pass
+    """
+    if len(args) == 2:
+        transducer, collection = args
+        reducer = as_reducer(transducer(Reducer(append, identity)))
+        items = reduce_items(reducer.step, [], sequences.items(collection))
+        items = reducer.complete(items)
+    else:
+        (collection,) = args
+        items = list(sequences.items(collection))
+
+    if target is mal_types.nil:
+        target = mal_types.List()
+    if isinstance(target, mal_types.Vector):
+        for item in items:
+            target = target.conj(item)
+        return target
+    if isinstance(target, mal_types.HashMap):
+        return target.assoc_pairs(map(entry_pair, items))
+    if not isinstance(target, mal_types.List):
+        target = mal_types.List(target)
+    return target.prepend(tuple(reversed(items)))
+
+
+def transduced_items(transducer, collection):
+    """Yield the items of collection transformed by transducer, as they are produced"""
+    produced = []
+    reducer = as_reducer(transducer(Reducer(append, identity)))
+    for item in sequences.items(collection):
+        result = reducer.step(produced, item)
+        yield from produced
+        produced.clear()
+        if type(result) is Reduced:
+            break
+    reducer.complete(produced)
+    yield from produced
+
+
+def sequence(transducer, collection):
+    """A lazy sequence of the items of collection transformed by transducer"""
+    return sequences.LazySeq(transduced_items(transducer, collection))
+
+
+def comp(*functions):
+    """(comp f g h) returns a function calling h with its arguments, then g, then f"""
+    if not functions:
+        return identity
+    *outer, innermost = functions
+    outer.reverse()
+
+    def composed(*args):
+        value = innermost(*args)
+        for function in outer:
+            value = function(value)
+        return value
+
+    return composed
+
+
+def mal_filter(predicate, *collection):
+    if not collection:
+        return filtering(predicate)
+    return sequences.mal_filter(predicate, *collection)
+
+
+def take(count, *collection):
+    if not collection:
+        return taking(sequences.check_count("take", count))
+    return sequences.take(count, *collection)
+
+
+namespace = {
+    mal_types.Symbol("reduce"): reduce,
+    mal_types.Symbol("reduce-kv"): reduce_kv,
+    mal_types.Symbol("reduced"): Reduced,
+    mal_types.Symbol("reduced?"): lambda mal_type: (
+        mal_types.true if isinstance(mal_type, Reduced) else mal_types.false
+    ),
+    mal_types.Symbol("transduce"): transduce,
+    mal_types.Symbol("into"): into,
+    mal_types.Symbol("sequence"): sequence,
+    mal_types.Symbol("comp"): comp,
+    mal_types.Symbol("filter"): mal_filter,
+    mal_types.Symbol("take"): take,
+}
@@ -0,0 +1,300 @@
+"""Stack based virtual machine, executing the bytecode generated by compiler.py.
+Intended use:
+```
+evaluate(mal_type, environment)
+```
+
+Calls between functions created by the virtual machine do not use the Python stack. The
+machine keeps its own stack of callers, and a tail call replaces the frame of the caller,
+so tail recursion runs in constant space. Functions of this module called from Python,
+e.g. by map or swap!, start a new run of the machine.
+
+While profiling, the machine records the calls it makes with the profiler.Profiler of
+its thread: CALL enters a call, TAIL_CALL replaces it, and returning or unwinding the
+stack for an exception exits it.
+"""
+
+import copy
+
+from mal_python import analyzer
+from mal_python import env
+from mal_python import mal_types
+from mal_python import profiler
+from mal_python.compiler import (
+    BUILD_MAP,
+    BUILD_VECTOR,
+    CALL,
+    CONST,
+    DEFINE_GLOBAL,
+    DEFINE_LOCAL,
+    DEFINE_MACRO,
+    JUMP,
+    JUMP_IF_FALSE,
+    LOAD_DEFINED,
+    LOAD_GLOBAL,
+    LOAD_LOCAL,
+    LOAD_OUTER,
+    LOAD_PARENT,
+    MACROEXPAND,
+    MAKE_CLOSURE,
+    POP,
+    POP_TRY,
+    RETURN,
+    SETUP_TRY,
+    STORE_LOCAL,
+    TAIL_CALL,
+    FunctionCode,
+)
+
+max_call_depth = 10000
+
+
+def make_function(code, frame, is_macro=mal_types.false):
+    function = mal_types.FunctionState(code.body, code.params, frame, None, is_macro)
+    function.fn = lambda *args: call(function, args)
+    function.code = code
+    return function
+
+
+def call(function, args):
+    """Call a function created by this module from Python"""
+    recorder = profiler.current()
+    if recorder is None:
+        code = function.code
+        code.compile()
+        return execute(code, code.make_frame(function.env, args), None, 0)
+    base = len(recorder.stack)
+    recorder.enter_function(function)  # Before compiling, which may expand macros
+    try:
+        code = function.code
+        code.compile()
+        return execute(code, code.make_frame(function.env, args), recorder, base)
+    finally:
+        recorder.unwind(base)
+
+
+def exception_value(exception):
+    if isinstance(exception, mal_types.MalException):
+        return exception.value
+    return mal_types.String(str(exception))
+
+
+def run(code, frame):
+    """Execute the code of a top level form with frame, and return its value"""
+    recorder = profiler.current()
+    if recorder is None:
+        return execute(code, frame, None, 0)
+    base = len(recorder.stack)
+    try:
+        return execute(code, frame, recorder, base)
+    finally:
+        recorder.unwind(base)
+
+
+def execute(code, frame, recorder, base):
+    """Run the machine. recorder is the Profiler recording the calls, if any, and base
+    the number of calls on its stack before this run.
+    """
+    bytecode, constants = code.compiled or code.compile()
+    code_globals = code.globals
+    pc = 0
+    stack = []
+    calls = []  # (bytecode, constants, code_globals, pc, frame) of the callers
+    handlers = []  # state to restore when an exception is caught, see SETUP_TRY
+
+    while True:
+        try:
+            while True:
+                opcode = bytecode[pc]
+                argument = bytecode[pc + 1]
+                pc += 2
+
+                if opcode == LOAD_LOCAL:
+                    stack.append(frame[argument])
+
+                elif opcode == LOAD_GLOBAL:
+                    symbol = constants[argument]
+                    try:
+                        stack.append(code_globals[symbol])
+                    except KeyError:
+                        raise analyzer.not_found(symbol)
+
+                elif opcode == CONST:
+                    stack.append(constants[argument])
+
+                elif opcode == CALL or opcode == TAIL_CALL:
+                    start = len(stack) - argument
+                    function = stack[start - 1]
+                    if argument == 2 and type(function) is mal_types.NativeFunction:
+                        second = stack.pop()
+                        first = stack.pop()
+                        stack[-1] = function.binary(first, second)
+                        if opcode == TAIL_CALL:
+                            if not calls:
+                                return stack.pop()
+                            if recorder is not None:
+                                recorder.exit()
+                            bytecode, constants, code_globals, pc, frame = calls.pop()
+                        continue
+
+                    args = stack[start:]
+                    del stack[start - 1 :]
+
+                    if (
+                        type(function) is mal_types.FunctionState
+                        and type(function.code) is FunctionCode
+                    ):
+                        if opcode == CALL:
+                            if len(calls) >= max_call_depth:
+                                raise RecursionError("maximum recursion depth exceeded")
+                            calls.append((bytecode, constants, code_globals, pc, frame))
+                        if recorder is not None:
+                            if opcode == TAIL_CALL and len(recorder.stack) > base:
+                                recorder.tail_call(function)
+                            else:
+                                recorder.enter_function(function)
+                        code = function.code
+                        bytecode, constants = code.compiled or code.compile()
+                        code_globals = code.globals
+                        frame = code.make_frame(function.env, args)
+                        pc = 0
+
+                    else:
+                        stack.append(function(*args))
+                        if opcode == TAIL_CALL:
+                            if not calls:
+                                return stack.pop()
+                            if recorder is not None:
+                                recorder.exit()
+                            bytecode, constants, code_globals, pc, frame = calls.pop()
+
+                elif opcode == RETURN:
+                    if not calls:
+                        return stack.pop()
+                    if recorder is not None:
+                        recorder.exit()
+                    bytecode, constants, code_globals, pc, frame = calls.pop()
+
+                elif opcode == JUMP_IF_FALSE:
+                    value = stack.pop()
+                    if value is mal_types.false or value is mal_types.nil:
+                        pc = argument
+
+                elif opcode == LOAD_PARENT:
+                    stack.append(frame[0][argument])
+
+                elif opcode == JUMP:
+                    pc = argument
+
+                elif opcode == POP:
+                    stack.pop()
+
+                elif opcode == STORE_LOCAL:
+                    frame[argument] = stack.pop()
+
+                elif opcode == LOAD_OUTER:
+                    depth, slot = constants[argument]
+                    outer_frame = frame
+                    for _ in range(depth):
+                        outer_frame = outer_frame[0]
+                    stack.append(outer_frame[slot])
+
+                elif opcode == LOAD_DEFINED:
+                    depth, slot, symbol = constants[argument]
+                    outer_frame = frame
+                    for _ in range(depth):
+                        outer_frame = outer_frame[0]
+                    value = outer_frame[slot]
+                    if value is analyzer.undefined:
+                        raise analyzer.not_found(symbol)
+                    stack.append(value)
+
+                elif opcode == MAKE_CLOSURE:
+                    stack.append(make_function(constants[argument], frame))
+
+                elif opcode == DEFINE_LOCAL:
+                    frame[argument] = stack[-1]
+
+                elif opcode == DEFINE_GLOBAL:
+                    analyzer.name_function(stack[-1], constants[argument])
+                    code_globals[constants[argument]] = stack[-1]
+
+                elif opcode == DEFINE_MACRO:
+                    analyzer.name_function(stack[-1], constants[argument])
+                    # do not mutate original function
+                    function = copy.copy(stack.pop())
+                    function.is_macro = mal_types.true
+                    code_globals[constants[argument]] = function
+                    stack.append(function)
+
+                elif opcode == BUILD_VECTOR:
+                    start = len(stack) - argument
+                    vector = mal_types.Vector(stack[start:])
+                    del stack[start:]
+                    stack.append(vector)
+
+                elif opcode == BUILD_MAP:
+                    keys = constants[argument]
+                    start = len(stack) - len(keys)
+                    hash_map = mal_types.HashMap.from_pairs(zip(keys, stack[start:]))
+                    del stack[start:]
+                    stack.append(hash_map)
+
+                elif opcode == SETUP_TRY:
+                    handlers.append(
+                        (
+                            constants[argument],
+                            len(calls),
+                            len(stack),
+                            (bytecode, constants, code_globals, frame),
+                            len(recorder.stack) if recorder is not None else 0,
+                        )
+                    )
+
+                elif opcode == POP_TRY:
+                    handlers.pop()
+
+                elif opcode == MACROEXPAND:
+                    form, scope = constants[argument]
+                    stack.append(analyzer.expand_macro(form, scope))
+
+                else:
+                    raise ValueError(f"Unknown opcode {opcode}")
+
+        except Exception as exception:
+            if not handlers:
+                raise
+
+            (handler, catch_slot, form), depth, height, state, records = handlers.pop()
+            bytecode, constants, code_globals, frame = state
+            if catch_slot is None:
+                raise env.MissingKeyInEnvironment(f"{form} not found")
+
+            if recorder is not None:
+                recorder.unwind(records)
+            del calls[depth:]
+            del stack[height:]
+            frame[catch_slot] = exception_value(exception)
+            pc = handler
+
+
+def evaluate(mal_type, environment):
+    """Compile and execute mal_type in the global environment.
+    Forms of a top level do are compiled and executed one at a time, so macros
+    defined by one form can be used by the following forms.
+    """
+    scope = analyzer.GlobalScope(environment)
+    mal_type = analyzer.expand_macro(mal_type, scope)
+
+    if (
+        isinstance(mal_type, mal_types.List)
+        and len(mal_type) > 1
+        and mal_type[0] == "do"
+    ):
+        for item in mal_type[1:-1]:
+            evaluate(item, environment)
+        return evaluate(mal_type[-1], environment)
+
+    code = FunctionCode(mal_types.List(), mal_type, scope, script=True)
+    code.compile()
+    return run(code, code.make_frame(None, ()))
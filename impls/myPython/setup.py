@@ -20,6 +20,7 @@ setup(
         'readline; platform_system == "Linux"',
         'pyreadline; platform_system == "Windows"',
     ],
+    extras_require={"numpy": ["numpy"]},
     entry_points={"console_scripts": "mal=mal_python.stepA_mal:main"},
     url="https://github.com/hershen/mal/tree/master/impls/myPython",
     python_requires=">=3.6",